@@ -0,0 +1,43 @@
+"""
+Отчет по индексированной геометрии: число вершин до и после слияния,
+размер буферов и оценка промахов кэша вершин (ACMR) для каждого меша
+в порядке загрузки и после переупорядочивания треугольников.
+
+Запуск из корня репозитория: python -m benchmarks.mesh_stats
+"""
+import time
+import numpy as np
+from main import GraphicsEngine
+from service.vbo import VBO
+from service.geometry import get_acmr, optimize_triangle_order
+
+
+def main():
+    """
+    Функция вывода таблицы статистики мешей.
+    """
+    ctx = GraphicsEngine.get_headless_context()
+    vbo = VBO(ctx)
+    for name in vbo.vbos.keys():
+        vbo.vbos.request(name)
+    for name in vbo.vbos.keys():
+        vbo.vbos.load(name)
+    print(f'{"mesh":<14}{"vertices":>18}{"indices":>10}{"bytes":>20}{"saved":>10}'
+          f'{"ACMR":>14}{"reorder, ms":>14}')
+    for name, stats in vbo.get_stats().items():
+        indices = np.frombuffer(vbo.vbos[name].ibo.read(), dtype='u4')
+        start = time.perf_counter()
+        optimized = optimize_triangle_order(indices)
+        elapsed = (time.perf_counter() - start) * 1000
+        vertices = f'{stats["source_vertices"]} -> {stats["vertices"]}'
+        size = f'{stats["source_bytes"]} -> {stats["bytes"]}'
+        saved = f'{stats["saved_bytes"] / stats["source_bytes"]:.0%}'
+        acmr = f'{get_acmr(indices):.2f} -> {get_acmr(optimized):.2f}'
+        print(f'{name:<14}{vertices:>18}{stats["indices"]:>10}{size:>20}{saved:>10}'
+              f'{acmr:>14}{elapsed:>14.1f}')
+    vbo.destroy()
+    ctx.release()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Сравнение времени загрузки моделей OBJ.
+
+cold        - разбор файла и запись бинарного кэша (кэш удален);
+warm        - отображение готового кэша в память;
+pywavefront - прежняя загрузка через pywavefront с копированием в массив NumPy.
+
+Запуск из корня репозитория: python -m benchmarks.obj_loader
+"""
+import os
+import time
+import logging
+import statistics
+import numpy as np
+import pywavefront
+from service.wavefront import get_cache_path, get_file_hash, load_obj
+
+MODELS = ['objects/ball/ball.obj', 'objects/ball/octopus.obj']
+
+
+def measure(function, repeat=5):
+    """
+    Функция измерения медианного времени выполнения.
+    :param function: Измеряемая функция.
+    :param int repeat: Число повторов.
+    :return float: Медианное время в миллисекундах.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def load_cold(path):
+    """
+    Функция загрузки модели с удаленным кэшем. Удаляется только кэш меша,
+    кэши уровней детализации рядом с ним сохраняются.
+    :param str path: Путь к файлу OBJ.
+    """
+    cache_path = get_cache_path(path, get_file_hash(path))
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    return load_obj(path)
+
+
+def load_warm(path):
+    """
+    Функция загрузки модели из готового кэша с чтением всех вершин.
+    :param str path: Путь к файлу OBJ.
+    """
+    mesh = load_obj(path)
+    return mesh.vertex_data.sum()
+
+
+def load_pywavefront(path):
+    """
+    Функция загрузки модели через pywavefront.
+    :param str path: Путь к файлу OBJ.
+    """
+    objs = pywavefront.Wavefront(path, cache=False, parse=True, create_materials=True)
+    return [np.array(material.vertices, dtype='f4') for material in objs.materials.values()]
+
+
+def main():
+    """
+    Функция вывода таблицы времени загрузки моделей.
+    """
+    logging.getLogger('pywavefront').setLevel(logging.ERROR)
+    print(f'{"model":<28}{"cold, ms":>12}{"warm, ms":>12}{"pywavefront, ms":>18}')
+    for path in MODELS:
+        cold = measure(lambda: load_cold(path))
+        warm = measure(lambda: load_warm(path))
+        reference = measure(lambda: load_pywavefront(path), repeat=3)
+        print(f'{path:<28}{cold:>12.2f}{warm:>12.2f}{reference:>18.2f}')
+
+
+if __name__ == '__main__':
+    main()
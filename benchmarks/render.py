@@ -0,0 +1,247 @@
+"""
+Воспроизводимый замер скорости рендеринга без окна.
+Камера проходит по заранее заданной траектории над синтетической сценой,
+время каждого кадра измеряется с ожиданием завершения работы видеокарты.
+Результат (процентили времени кадра, время запуска, память) пишется в JSON и CSV.
+
+Запуск из корня репозитория:
+python -m benchmarks.render --objects 10000 --textures 3 --shadow-quality 4 --frames 300
+"""
+import os
+import sys
+import csv
+import json
+import math
+import time
+import argparse
+import resource
+import platform
+import numpy as np
+from main import GraphicsEngine
+from service.scene import Scene
+from service.model import Cube
+from service.light import PointLight
+
+
+class SyntheticScene(Scene):
+    """
+    Класс представляющий синтетическую сцену: квадратная сетка кубов
+    на полу с чередованием текстур и точечные источники света над ней.
+    """
+    objects_count = 1000
+    textures_count = 3
+    lights_count = 0
+    # номера преобразований кубов и их положения покоя для анимации
+    animated = None
+    rest = None
+
+    def load(self):
+        """
+        Метод заполнения сцены кубами по сетке и источниками света в случайных точках.
+        """
+        side = math.ceil(math.sqrt(self.objects_count))
+        for i in range(self.objects_count):
+            x, z = i % side - side // 2, i // side - side // 2
+            self.add_object(Cube(self.app, tex_id=i % self.textures_count,
+                                 pos=(3 * x, (i * 7919) % 5 * 0.5, 3 * z)))
+
+        rng = np.random.default_rng(0)
+        half = 1.5 * side
+        for _ in range(self.lights_count):
+            self.add_light(PointLight(position=(rng.uniform(-half, half), rng.uniform(0.5, 3.0),
+                                                rng.uniform(-half, half)),
+                                      color=tuple(rng.uniform(0.2, 1.0, 3)), radius=4.0))
+
+    def animate(self, phase):
+        """
+        Метод покачивания всех кубов по вертикали одним изменением хранилища преобразований.
+        :param float phase: Фаза анимации в радианах.
+        """
+        transforms = self.app.transforms
+        if self.animated is None:
+            self.animated = np.array([obj.transform for obj in self.objects])
+            self.rest = transforms.position[self.animated].copy()
+        position = self.rest.copy()
+        position[:, 1] += 0.5 * np.sin(phase + position[:, 0] + position[:, 2])
+        transforms.set(self.animated, position=position)
+
+
+def get_scene_class(objects, textures, lights=0):
+    """
+    Функция создания класса синтетической сцены с заданными размерами.
+    :param int objects: Число объектов.
+    :param int textures: Число различных текстур (не больше трех).
+    :param int lights: Число точечных источников света.
+    :return type: Класс сцены.
+    """
+    return type('SyntheticScene', (SyntheticScene,),
+                {'objects_count': objects, 'textures_count': max(1, min(textures, 3)),
+                 'lights_count': lights})
+
+
+def get_camera_path(frames, radius, height):
+    """
+    Функция построения траектории камеры: облет центра сцены по кругу
+    с плавным изменением высоты.
+    :param int frames: Число кадров.
+    :param float radius: Радиус облета.
+    :param float height: Средняя высота камеры.
+    :return list: Положение, угол рыскания и угол тангажа для каждого кадра.
+    """
+    path = []
+    for i in range(frames):
+        angle = 2 * math.pi * i / frames
+        position = np.array([radius * math.cos(angle),
+                             height * (1 + 0.5 * math.sin(2 * angle)),
+                             radius * math.sin(angle)])
+        forward = -position / np.linalg.norm(position)
+        yaw = math.degrees(math.atan2(forward[2], forward[0]))
+        pitch = math.degrees(math.asin(forward[1]))
+        path.append((tuple(position), yaw, pitch))
+    return path
+
+
+def get_memory():
+    """
+    Функция получения потребления памяти процессом.
+    :return dict: Текущий и пиковый размер резидентной памяти в МБ.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak = peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+    current = None
+    if os.path.exists('/proc/self/statm'):
+        with open('/proc/self/statm') as file:
+            current = int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    return {'rss_mb': current, 'peak_rss_mb': peak}
+
+
+def run(objects=1000, textures=3, shadow_quality=16, frames=300, warmup=10,
+        size=(640, 360), shadow_size=2048, shadow_cascades=1, renderer_options=None, lights=0,
+        animate=False):
+    """
+    Функция одного замера.
+    :param int objects: Число объектов синтетической сцены.
+    :param int textures: Число различных текстур.
+    :param int shadow_quality: Качество мягких теней.
+    :param int frames: Число замеряемых кадров.
+    :param int warmup: Число кадров прогрева, не входящих в замер.
+    :param tuple size: Размер кадра.
+    :param int shadow_size: Размер карты теней.
+    :param int shadow_cascades: Число каскадов теней.
+    :param dict renderer_options: Параметры рендерера сцены.
+    :param int lights: Число точечных источников света.
+    :param bool animate: Перемещать все объекты сцены в каждом кадре.
+    :return dict: Параметры и результаты замера.
+    """
+    start = time.perf_counter()
+    app = GraphicsEngine(win_size=size, shadow_size=shadow_size, shadow_cascades=shadow_cascades,
+                         shadow_quality=shadow_quality, headless=True,
+                         scene_class=get_scene_class(objects, textures, lights),
+                         renderer_options=renderer_options)
+    side = math.ceil(math.sqrt(objects)) * 3
+    path = get_camera_path(frames, radius=max(8.0, side * 0.6), height=max(4.0, side * 0.25))
+    app.camera.set_pose(*path[0])
+    app.render()
+    app.ctx.finish()
+    startup = time.perf_counter() - start
+
+    for _ in range(warmup):
+        app.render()
+    app.ctx.finish()
+
+    times = []
+    occlusion = []
+    for i, pose in enumerate(path):
+        frame_start = time.perf_counter()
+        app.camera.set_pose(*pose)
+        if animate:
+            app.scene.animate(2 * math.pi * i / frames)
+        app.render()
+        app.ctx.finish()
+        times.append(time.perf_counter() - frame_start)
+        stats = app.scene_renderer.occlusion.stats
+        occlusion.append((stats['visible'], stats['occluded']))
+
+    times = np.array(times) * 1000
+    result = {
+        'objects': objects, 'textures': textures, 'lights': lights, 'animate': animate,
+        'shadow_quality': shadow_quality,
+        'frames': frames, 'width': size[0], 'height': size[1],
+        'shadow_size': shadow_size, 'shadow_cascades': shadow_cascades,
+        'options': json.dumps(renderer_options or {}, sort_keys=True),
+        'renderer': app.ctx.info['GL_RENDERER'],
+        'python': platform.python_version(),
+        'startup_s': startup,
+        'frame_mean_ms': float(times.mean()),
+        **{f'frame_p{p}_ms': float(np.percentile(times, p)) for p in (50, 90, 95, 99)},
+        'frame_max_ms': float(times.max()),
+        'visible_mean': float(np.mean([visible for visible, _ in occlusion])),
+        'occluded_mean': float(np.mean([occluded for _, occluded in occlusion])),
+        **get_memory()
+    }
+    app.destroy()
+    return result
+
+
+def write_results(results, json_path=None, csv_path=None):
+    """
+    Функция записи результатов в JSON (перезапись) и CSV (дополнение).
+    :param list results: Результаты замеров.
+    :param str json_path: Путь к файлу JSON.
+    :param str csv_path: Путь к файлу CSV.
+    """
+    if json_path:
+        with open(json_path, 'w') as file:
+            json.dump(results, file, indent=2)
+    if csv_path and results:
+        exists = os.path.exists(csv_path)
+        with open(csv_path, 'a', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=list(results[0]))
+            if not exists:
+                writer.writeheader()
+            writer.writerows(results)
+
+
+def main():
+    """
+    Функция запуска замеров по параметрам командной строки.
+    Каждый параметр со списком значений дает отдельный замер для каждого значения.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--objects', type=int, nargs='+', default=[1000])
+    parser.add_argument('--textures', type=int, default=3)
+    parser.add_argument('--lights', type=int, nargs='+', default=[0])
+    parser.add_argument('--shadow-quality', type=int, nargs='+', default=[16])
+    parser.add_argument('--shadow-size', type=int, default=2048)
+    parser.add_argument('--cascades', type=int, default=1)
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--size', default='640x360')
+    parser.add_argument('--no-instancing', action='store_true')
+    parser.add_argument('--no-culling', action='store_true')
+    parser.add_argument('--depth-prepass', action='store_true')
+    parser.add_argument('--occlusion', action='store_true')
+    parser.add_argument('--animate', action='store_true')
+    parser.add_argument('--json', default='benchmark.json')
+    parser.add_argument('--csv', default='benchmark.csv')
+    args = parser.parse_args()
+
+    size = tuple(int(value) for value in args.size.split('x'))
+    options = {'instancing': not args.no_instancing, 'culling': not args.no_culling,
+               'depth_prepass': args.depth_prepass, 'occlusion': args.occlusion}
+    results = []
+    for objects in args.objects:
+        for quality in args.shadow_quality:
+            for lights in args.lights:
+                result = run(objects, args.textures, quality, args.frames, args.warmup, size,
+                             args.shadow_size, args.cascades, options, lights, args.animate)
+                results.append(result)
+                print(f'objects={objects:<8} shadow={quality:<4} lights={lights:<6} '
+                      f'startup {result["startup_s"]:.2f} s  '
+                      f'p50 {result["frame_p50_ms"]:.2f} ms  p99 {result["frame_p99_ms"]:.2f} ms  '
+                      f'peak {result["peak_rss_mb"]:.0f} MB')
+    write_results(results, args.json, args.csv)
+
+
+if __name__ == '__main__':
+    main()
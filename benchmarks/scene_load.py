@@ -0,0 +1,79 @@
+"""
+Замер загрузки большой сцены из файла: таблица экземпляров кубов пишется
+во временный каталог, после чего движок без окна загружает ее частями
+и, если задано, рисует первый кадр.
+
+Запуск из корня репозитория:
+python -m benchmarks.scene_load --instances 1000000
+"""
+import os
+import math
+import time
+import argparse
+import tempfile
+import numpy as np
+from main import GraphicsEngine
+from service.scene import Scene
+from service.scene_file import get_instance_table, write_scene, CHUNK_SIZE
+
+
+def write_grid_scene(path, count, textures=3):
+    """
+    Функция записи сцены из квадратной сетки кубов с чередованием текстур.
+    :param str path: Путь к манифесту.
+    :param int count: Число экземпляров.
+    :param int textures: Число различных текстур (не больше трех).
+    """
+    side = math.ceil(math.sqrt(count))
+    index = np.arange(count)
+    table = get_instance_table(count)
+    table['texture'] = index % textures
+    table['position'][:, 0] = 3 * (index % side - side // 2)
+    table['position'][:, 1] = (index * 7919) % 5 * 0.5
+    table['position'][:, 2] = 3 * (index // side - side // 2)
+    write_scene(path, ['cube'], [0, 1, 'other_model'][:textures], table)
+
+
+def get_scene_class(path, chunk_size):
+    """
+    Функция создания класса сцены, загружающей заданный файл.
+    :param str path: Путь к манифесту.
+    :param int chunk_size: Число экземпляров в части.
+    :return type: Класс сцены.
+    """
+    return type('FileScene', (Scene,), {'load': lambda self: self.load_file(path, chunk_size)})
+
+
+def main():
+    """
+    Функция вывода времени записи, загрузки сцены и первого кадра.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--instances', type=int, default=1000000)
+    parser.add_argument('--textures', type=int, default=2)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--render', action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'scene.json')
+        start = time.perf_counter()
+        write_grid_scene(path, args.instances, max(1, min(args.textures, 3)))
+        print(f'write  {time.perf_counter() - start:8.2f} s')
+
+        start = time.perf_counter()
+        app = GraphicsEngine(win_size=(640, 360), headless=True,
+                             scene_class=get_scene_class(path, args.chunk_size))
+        print(f'load   {time.perf_counter() - start:8.2f} s  '
+              f'({args.instances} instances, {len(app.scene.groups)} groups)')
+
+        if args.render:
+            start = time.perf_counter()
+            app.render()
+            app.ctx.finish()
+            print(f'frame  {time.perf_counter() - start:8.2f} s')
+        app.destroy()
+
+
+if __name__ == '__main__':
+    main()
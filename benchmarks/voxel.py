@@ -0,0 +1,98 @@
+"""
+Замер построения мешей сетки ячеек: рельеф из столбиков ячеек с чередованием
+материалов по слоям строится целиком, после чего по одной меняются ячейки
+и замеряется перестройка затронутых чанков и кадр.
+
+Запуск из корня репозитория:
+python -m benchmarks.voxel --size 128 --height 8 --edits 20
+"""
+import time
+import argparse
+import numpy as np
+from main import GraphicsEngine
+from service.scene import Scene
+
+
+def fill_terrain(grid, size, height, textures=2):
+    """
+    Функция заполнения сетки рельефом: высота столбика ячеек меняется плавно,
+    верхний слой столбика получает свой материал.
+    :param VoxelGrid grid: Сетка ячеек.
+    :param int size: Число ячеек по x и z.
+    :param int height: Наибольшая высота столбика.
+    :param int textures: Число различных текстур (не больше трех).
+    """
+    x, z = np.meshgrid(np.arange(size), np.arange(size), indexing='ij')
+    heights = 1 + ((np.sin(x / 9) + np.cos(z / 7) + 2) / 4 * (height - 1)).astype(int)
+    y = np.arange(height)
+    filled = y[None, None, :] < heights[:, :, None]
+    top = y[None, None, :] == heights[:, :, None] - 1
+    cells = np.argwhere(filled & ~top)
+    grid.set_cells(cells[:, [0, 2, 1]], 0)
+    if textures > 1:
+        cells = np.argwhere(top)
+        grid.set_cells(cells[:, [0, 2, 1]], [0, 1, 'other_model'][textures - 1])
+
+
+def get_scene_class(size, height, textures):
+    """
+    Функция создания класса сцены с рельефом из ячеек.
+    :param int size: Число ячеек по x и z.
+    :param int height: Наибольшая высота столбика.
+    :param int textures: Число различных текстур.
+    :return type: Класс сцены.
+    """
+    def load(self):
+        self.voxels.set_origin((-size, -height * 2 - 2, -size), 2.0)
+        fill_terrain(self.voxels, size, height, textures)
+
+    return type('VoxelScene', (Scene,), {'load': load})
+
+
+def main():
+    """
+    Функция вывода времени построения сетки, перестройки после изменения ячейки и кадра.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--size', type=int, default=128)
+    parser.add_argument('--height', type=int, default=8)
+    parser.add_argument('--textures', type=int, default=2)
+    parser.add_argument('--edits', type=int, default=20)
+    args = parser.parse_args()
+
+    app = GraphicsEngine(win_size=(640, 360), headless=True,
+                         scene_class=get_scene_class(args.size, args.height,
+                                                     max(1, min(args.textures, 3))))
+    grid = app.scene.voxels
+    cells = sum(int(np.count_nonzero(chunk)) for chunk in grid.chunks.values())
+
+    start = time.perf_counter()
+    app.scene.update_voxels()
+    build = time.perf_counter() - start
+    print(f'build  {build:8.3f} s  ({cells} cells, {grid.stats["chunks"]} chunks, '
+          f'{grid.stats["meshes"]} meshes, {grid.stats["quads"]} quads, '
+          f'{cells * 6} cube faces)')
+
+    app.render()
+    app.ctx.finish()
+    rng = np.random.default_rng(0)
+    rebuild, frame, rebuilt = [], [], grid.stats['rebuilt']
+    for _ in range(args.edits):
+        x, z = rng.integers(0, args.size, 2)
+        grid.set_cell((x, args.height, z), 1)
+        start = time.perf_counter()
+        app.scene.update_voxels()
+        rebuild.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        app.render()
+        app.ctx.finish()
+        frame.append(time.perf_counter() - start)
+    if args.edits:
+        print(f'edit   {np.mean(rebuild) * 1000:8.2f} ms  '
+              f'({(grid.stats["rebuilt"] - rebuilt) / args.edits:.1f} chunks per edit)')
+        print(f'frame  {np.mean(frame) * 1000:8.2f} ms')
+    app.destroy()
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,8 @@ from service.mesh import Mesh
 from service.scene import Scene, SceneRenderer
 from service.light import Light
 from service.camera import Camera
+from service.state import RenderState
+from service.transform import TransformStore
 
 
 class GraphicsEngine:
@@ -16,24 +18,40 @@ class GraphicsEngine:
     Создания объектов света, камеры, сцены и других элементов.
     Также для обновления и отображения графики.
     """
-    def __init__(self, win_size=(1600, 900)):
+    def __init__(self, win_size=(1600, 900), shadow_size=2048, shadow_cascades=1,
+                 shadow_quality=16, headless=False, scene_class=Scene, renderer_options=None):
         """
         Метод инициализации объекта графического движка.
         :param tuple win_size: Начальный размер окна в формате (ширина, высота).
+        :param int shadow_size: Размер карты теней (одного каскада) в текселях.
+        :param int shadow_cascades: Число каскадов теней (от 1 до 4).
+        :param int shadow_quality: Качество мягких теней (0, 1, 4, 16 или 64 выборки).
+        :param bool headless: Рисовать без окна в буфер кадра в памяти.
+        :param type scene_class: Класс сцены.
+        :param dict renderer_options: Параметры рендерера сцены (SceneRenderer).
         """
         self.WIN_SIZE = win_size
+        self.SHADOW_SIZE = shadow_size
+        self.SHADOW_CASCADES = shadow_cascades
+        self.SHADOW_QUALITY = shadow_quality
+        self.headless = headless
 
         # Настройки контекста OpenGL
         pg.init()
-        pg.display.gl_set_attribute(pg.GL_CONTEXT_MAJOR_VERSION, 3)
-        pg.display.gl_set_attribute(pg.GL_CONTEXT_MINOR_VERSION, 3)
-        pg.display.gl_set_attribute(pg.GL_CONTEXT_PROFILE_MASK, pg.GL_CONTEXT_PROFILE_CORE)
-        pg.display.set_mode(self.WIN_SIZE, flags=pg.OPENGL | pg.DOUBLEBUF)
-        pg.event.set_grab(True)
-        pg.mouse.set_visible(False)
-
-        # Создание контекста OpenGL
-        self.ctx = mgl.create_context()
+        if headless:
+            self.ctx = self.get_headless_context()
+            self.framebuffer = self.ctx.simple_framebuffer(self.WIN_SIZE)
+        else:
+            pg.display.gl_set_attribute(pg.GL_CONTEXT_MAJOR_VERSION, 3)
+            pg.display.gl_set_attribute(pg.GL_CONTEXT_MINOR_VERSION, 3)
+            pg.display.gl_set_attribute(pg.GL_CONTEXT_PROFILE_MASK, pg.GL_CONTEXT_PROFILE_CORE)
+            pg.display.set_mode(self.WIN_SIZE, flags=pg.OPENGL | pg.DOUBLEBUF)
+            pg.event.set_grab(True)
+            pg.mouse.set_visible(False)
+
+            # Создание контекста OpenGL
+            self.ctx = mgl.create_context()
+            self.framebuffer = self.ctx.screen
         self.ctx.enable(flags=mgl.DEPTH_TEST | mgl.CULL_FACE)
 
         # Настройки времени
@@ -41,24 +59,82 @@ class GraphicsEngine:
         self.time = 0
         self.delta_time = 0
 
+        # Кадр перерисовывается, только если он помечен устаревшим или изменилась сцена
+        self.dirty = True
+        self.frame_key = None
+
         # Инициализация базовых объектов
+        self.render_state = RenderState()
+        self.transforms = TransformStore()
         self.light = Light()
         self.camera = Camera(self)
         self.mesh = Mesh(self)
-        self.scene = Scene(self)
-        self.scene_renderer = SceneRenderer(self)
+        self.scene = scene_class(self)
+        self.scene_renderer = SceneRenderer(self, **(renderer_options or {}))
+
+    @staticmethod
+    def get_headless_context():
+        """
+        Метод создания контекста OpenGL без окна.
+        Сначала пробуется EGL (работает без X-сервера, в том числе с Mesa llvmpipe),
+        затем контекст по умолчанию для платформы.
+        :return moderngl.Context: Контекст OpenGL.
+        """
+        try:
+            return mgl.create_standalone_context(require=330, backend='egl')
+        except Exception:
+            return mgl.create_standalone_context(require=330)
 
     def check_events(self):
         """
         Метод проверяет наличие событий pygame в цикле и обрабатывает их.
         Если пользователь закрывает окно или нажимает клавишу Escape, приложение завершает работу.
+        Любое другое событие (ввод, изменение окна) помечает кадр устаревшим.
         """
         for event in pg.event.get():
             if event.type == pg.QUIT or (event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE):
-                self.mesh.destroy()
-                self.scene_renderer.destroy()
+                self.destroy()
                 pg.quit()
                 sys.exit()
+            self.dirty = True
+
+    def wait_events(self):
+        """
+        Метод ожидания следующего события pygame без загрузки процессора.
+        Событие возвращается в очередь и обрабатывается в check_events,
+        а время простоя не попадает в delta_time.
+        """
+        pg.event.post(pg.event.wait())
+        self.clock.tick()
+
+    def request_render(self):
+        """
+        Метод пометки кадра устаревшим (например, после перемещения камеры).
+        """
+        self.dirty = True
+
+    def get_frame_key(self):
+        """
+        Метод получения ключа состояния сцены, от которого зависит изображение.
+        :return tuple: Версии состава сцены, хранилища преобразований, сетки ячеек,
+                       источника света, точечных источников и загруженных ресурсов.
+        """
+        return (self.scene.version, self.transforms.version, self.scene.voxels.version,
+                self.light.version, self.scene.lights_version, self.mesh.version)
+
+    def needs_render(self):
+        """
+        Метод проверки, нужно ли перерисовывать кадр.
+        :return bool: True, если кадр помечен устаревшим или сцена изменилась.
+        """
+        return self.dirty or self.frame_key != self.get_frame_key()
+
+    def update(self):
+        """
+        Метод одного шага симуляции: обновление камеры и сцены.
+        """
+        self.camera.update()
+        self.scene.update()
 
     def get_time(self, time=0.001):
         """
@@ -75,20 +151,65 @@ class GraphicsEngine:
         :param float blue: Компонента синего цвета фона.
         :param float alpha: Прозрачность фона.
         """
-        self.ctx.clear(color=(red, green, blue, alpha))
+        self.framebuffer.use()
+        self.framebuffer.clear(red, green, blue, alpha)
         self.scene_renderer.render()
-        pg.display.flip()
+        if not self.headless:
+            pg.display.flip()
+        self.dirty = False
+        self.frame_key = self.get_frame_key()
 
-    def run(self, fps=60):
+    def read_pixels(self):
+        """
+        Метод чтения изображения последнего кадра.
+        :return bytes: Пиксели RGB кадра снизу вверх.
+        """
+        return self.framebuffer.read(components=3)
+
+    def destroy(self):
+        """
+        Метод освобождения ресурсов движка.
+        """
+        self.mesh.destroy()
+        self.scene_renderer.destroy()
+        if self.headless:
+            self.framebuffer.release()
+            self.ctx.release()
+
+    def run(self, fps=60, on_demand=False, fixed_step=None, max_steps=5):
         """
         Метод запускает основной цикл визуализации сцены.
         :param int fps: Количество сменяемых кадров за одну секунду.
+        :param bool on_demand: Перерисовывать кадр только при изменениях, а в остальное
+                               время ждать событий ввода (для редко меняющихся сцен).
+        :param float fixed_step: Шаг симуляции в миллисекундах; если задан, камера и сцена
+                                 обновляются шагами постоянной длины независимо от частоты кадров.
+        :param int max_steps: Наибольшее число шагов симуляции за кадр (остаток времени
+                              отбрасывается, чтобы медленный кадр не замедлял следующие).
         """
+        accumulator = 0.0
         while True:
             self.get_time()
             self.check_events()
-            self.camera.update()
-            self.render()
+            steps = 1
+            if fixed_step:
+                accumulator += self.delta_time
+                steps = min(int(accumulator // fixed_step), max_steps)
+                accumulator = accumulator - steps * fixed_step if steps < max_steps else 0.0
+                frame_time, self.delta_time = self.delta_time, fixed_step
+                for _ in range(steps):
+                    self.update()
+                self.delta_time = frame_time
+            else:
+                self.update()
+
+            if not on_demand or self.needs_render():
+                self.render()
+            elif steps:
+                # ожидание только после шага симуляции, иначе удерживаемая клавиша
+                # не успела бы сдвинуть камеру
+                self.wait_events()
+                accumulator = 0.0
             self.delta_time = self.clock.tick(fps)
 
 
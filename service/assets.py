@@ -0,0 +1,191 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AssetLoader:
+    """
+    Класс представляющий фоновую загрузку ресурсов.
+    Декодирование изображений и разбор мешей выполняются в пуле потоков,
+    а загрузка в видеопамять - в потоке контекста OpenGL по мере готовности.
+    Для каждого ресурса ведется отчет о времени загрузки.
+    """
+    def __init__(self, workers=None):
+        """
+        Метод инициализации загрузчика.
+        :param int workers: Число потоков пула (по умолчанию - по числу ядер).
+        """
+        self.executor = ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1))
+        self.report = {}
+        self.start_time = time.perf_counter()
+
+    def submit(self, name, decode):
+        """
+        Метод запуска декодирования ресурса в пуле потоков.
+        :param str name: Имя ресурса для отчета.
+        :param decode: Функция декодирования без обращений к OpenGL.
+        :return concurrent.futures.Future: Будущий результат декодирования.
+        """
+        entry = self.report.setdefault(name, {'decode': 0.0, 'wait': 0.0, 'upload': 0.0})
+
+        def run():
+            start = time.perf_counter()
+            result = decode()
+            entry['decode'] = (time.perf_counter() - start) * 1000
+            return result
+
+        return self.executor.submit(run)
+
+    def wait(self, name, future):
+        """
+        Метод ожидания результата декодирования в потоке контекста.
+        :param str name: Имя ресурса для отчета.
+        :param concurrent.futures.Future future: Будущий результат декодирования.
+        :return: Результат декодирования.
+        """
+        start = time.perf_counter()
+        result = future.result()
+        self.report[name]['wait'] += (time.perf_counter() - start) * 1000
+        return result
+
+    def upload(self, name, upload, data):
+        """
+        Метод загрузки декодированного ресурса в видеопамять.
+        :param str name: Имя ресурса для отчета.
+        :param upload: Функция загрузки, вызываемая в потоке контекста.
+        :param data: Результат декодирования.
+        :return: Загруженный ресурс.
+        """
+        start = time.perf_counter()
+        asset = upload(data)
+        entry = self.report.setdefault(name, {'decode': 0.0, 'wait': 0.0, 'upload': 0.0})
+        entry['upload'] = (time.perf_counter() - start) * 1000
+        entry['ready'] = (time.perf_counter() - self.start_time) * 1000
+        return asset
+
+    def get_report(self):
+        """
+        Метод форматирования отчета о загрузке ресурсов.
+        :return str: Таблица времени декодирования, ожидания и загрузки по ресурсам (мс).
+        """
+        lines = [f'{"asset":<28}{"decode":>10}{"wait":>10}{"upload":>10}{"ready at":>10}']
+        for name, entry in sorted(self.report.items(), key=lambda item: item[1].get('ready', 0)):
+            lines.append(f'{name:<28}{entry["decode"]:>10.1f}{entry["wait"]:>10.1f}'
+                         f'{entry["upload"]:>10.1f}{entry.get("ready", 0):>10.1f}')
+        return '\n'.join(lines)
+
+    def destroy(self):
+        """
+        Метод остановки пула потоков.
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AssetDict:
+    """
+    Класс представляющий словарь ресурсов с ленивой загрузкой.
+    Ресурс загружается при первом обращении по ключу; request позволяет
+    заранее запустить декодирование, не блокируя поток контекста.
+    """
+    def __init__(self, loader, prefix, sources):
+        """
+        Метод инициализации словаря ресурсов.
+        :param AssetLoader loader: Загрузчик ресурсов.
+        :param str prefix: Префикс имен ресурсов в отчете.
+        :param dict sources: Ключ -> (decode, upload); decode может быть None,
+                             если ресурс создается сразу в видеопамяти.
+        """
+        self.loader = loader
+        self.prefix = prefix
+        self.sources = sources
+        self.assets = {}
+        self.pending = {}
+        # число загруженных в видеопамять ресурсов: меняется, когда готов новый ресурс
+        self.version = 0
+
+    def add(self, key, source):
+        """
+        Метод добавления источника ресурса, описанного после создания словаря.
+        :param key: Ключ ресурса.
+        :param tuple source: Функции (decode, upload).
+        """
+        self.sources[key] = source
+
+    def get_name(self, key):
+        """
+        Метод получения имени ресурса для отчета.
+        :param key: Ключ ресурса.
+        :return str: Имя ресурса.
+        """
+        return f'{self.prefix}:{key}'
+
+    def request(self, key):
+        """
+        Метод запуска фонового декодирования ресурса без ожидания.
+        :param key: Ключ ресурса.
+        """
+        if key in self.assets or key in self.pending:
+            return
+        decode, _ = self.sources[key]
+        if decode is not None:
+            self.pending[key] = self.loader.submit(self.get_name(key), decode)
+
+    def __getitem__(self, key):
+        return self.load(key)
+
+    def load(self, key):
+        """
+        Метод получения ресурса с загрузкой при первом обращении.
+        :param key: Ключ ресурса.
+        :return: Загруженный ресурс.
+        """
+        asset = self.assets.get(key)
+        if asset is not None:
+            return asset
+
+        decode, upload = self.sources[key]
+        name = self.get_name(key)
+        if decode is None:
+            data = None
+        else:
+            self.request(key)
+            data = self.loader.wait(name, self.pending.pop(key))
+        asset = self.assets[key] = self.loader.upload(name, upload, data)
+        self.version += 1
+        return asset
+
+    def __contains__(self, key):
+        return key in self.sources
+
+    def is_loaded(self, key):
+        """
+        Метод проверки, что ресурс уже загружен.
+        :param key: Ключ ресурса.
+        :return bool: Загружен ли ресурс.
+        """
+        return key in self.assets
+
+    def keys(self):
+        return self.sources.keys()
+
+    def values(self):
+        """
+        Метод получения уже загруженных ресурсов.
+        :return list: Загруженные ресурсы.
+        """
+        return list(self.assets.values())
+
+    def items(self):
+        """
+        Метод получения пар (ключ, ресурс) для уже загруженных ресурсов.
+        :return list: Загруженные ресурсы с ключами.
+        """
+        return list(self.assets.items())
+
+    def poll(self):
+        """
+        Метод загрузки в видеопамять ресурсов, декодирование которых уже завершено.
+        Вызывается в потоке контекста, не блокирует его.
+        """
+        for key in [key for key, future in self.pending.items() if future.done()]:
+            self.load(key)
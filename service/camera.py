@@ -11,7 +11,8 @@ class Camera:
     def __init__(self, app,
                  position=(0, 0, 4),
                  yaw=-90, pitch=0,
-                 up=(0, 1, 0), right=(1, 0, 0), forward=(0, 0, -1)):
+                 up=(0, 1, 0), right=(1, 0, 0), forward=(0, 0, -1),
+                 fov=50, near=0.1, far=100):
         """
         Метод инициализации объекта камеры.
         :param GraphicsEngine app: Объект приложения.
@@ -21,6 +22,9 @@ class Camera:
         :param float up: Вектор направления "вверх" камеры.
         :param float right: Вектор направления "вправо" камеры.
         :param float forward: Вектор направления "вперед" камеры.
+        :param float fov: Угол обзора камеры в градусах.
+        :param float near: Ближняя граница видимости объектов.
+        :param float far: Дальняя граница видимости объектов.
         """
         self.app = app
         self.aspect_ratio = app.WIN_SIZE[0] / app.WIN_SIZE[1]
@@ -30,6 +34,9 @@ class Camera:
         self.forward = glm.vec3(forward)
         self.yaw = yaw
         self.pitch = pitch
+        self.fov = fov
+        self.near = near
+        self.far = far
         self.m_view = self.get_view_matrix()
         self.m_proj = self.get_projection_matrix()
 
@@ -37,11 +44,31 @@ class Camera:
         """
         Метод изменяет положение и ориентацию камеры.
         Путем перемещения, поворота и обновления векторов направления.
+        Матрица вида пересчитывается, только если камера сдвинулась или повернулась.
         """
-        self.move()
-        self.rotate()
+        moved = self.move()
+        rotated = self.rotate()
+        if moved or rotated:
+            self.update_camera_vectors()
+            self.m_view = self.get_view_matrix()
+
+    def set_pose(self, position=None, yaw=None, pitch=None):
+        """
+        Метод установки положения и ориентации камеры без учета ввода
+        (например, для заранее записанной траектории).
+        :param position: Положение камеры (x, y, z).
+        :param float yaw: Угол рыскания в градусах.
+        :param float pitch: Угол тангажа в градусах.
+        """
+        if position is not None:
+            self.position = glm.vec3(position)
+        if yaw is not None:
+            self.yaw = yaw
+        if pitch is not None:
+            self.pitch = pitch
         self.update_camera_vectors()
         self.m_view = self.get_view_matrix()
+        self.app.request_render()
 
     def update_camera_vectors(self, right=(0, 1, 0)):
         """
@@ -65,19 +92,26 @@ class Camera:
         :param float sensitivity: Чувствительность мыши, определяющая скорость поворота камеры.
         :param float max_pitch: Максимальный угол тангажа (вертикальный поворот) в градусах.
         :param float min_pitch: Минимальный угол тангажа (вертикальный поворот) в градусах.
+        :return bool: Повернулась ли камера.
         """
         rel_x, rel_y = pg.mouse.get_rel()
+        if not rel_x and not rel_y:
+            return False
         self.yaw += rel_x * sensitivity
         self.pitch -= rel_y * sensitivity
         self.pitch = max(max_pitch, min(min_pitch, self.pitch))
+        self.app.request_render()
+        return True
 
     def move(self, speed=0.005):
         """
         Метод перемещает камеру в зависимости от нажатых клавиш на клавиатуре.
         :param float speed: Скорость передвижения камеры.
+        :return bool: Сдвинулась ли камера.
         """
         velocity = speed * self.app.delta_time
         keys = pg.key.get_pressed()
+        position = glm.vec3(self.position)
         if keys[pg.K_w]:
             self.position += self.forward * velocity
         if keys[pg.K_s]:
@@ -90,6 +124,10 @@ class Camera:
             self.position += self.up * velocity
         if keys[pg.K_e]:
             self.position -= self.up * velocity
+        if self.position == position:
+            return False
+        self.app.request_render()
+        return True
 
     def get_view_matrix(self):
         """
@@ -98,12 +136,13 @@ class Camera:
         """
         return glm.lookAt(self.position, self.position + self.forward, self.up)
 
-    def get_projection_matrix(self, fov=50, near=0.1, far=100):
+    def get_projection_matrix(self, near=None, far=None):
         """
         Метод преобразования трехмерных координат в двухмерные для отображения на экране.
-        :param float fov: Определяет угол обзора камеры.
-        :param float near: Определяет ближнюю границу видимости объектов.
-        :param float far: Определяет дальнюю границу видимости объектов.
+        :param float near: Ближняя граница видимости объектов (по умолчанию - камеры).
+        :param float far: Дальняя граница видимости объектов (по умолчанию - камеры).
         :return glm.mat4: Проекционная матрица, используемая для преобразования координат.
         """
-        return glm.perspective(glm.radians(fov), self.aspect_ratio, near, far)
+        near = self.near if near is None else near
+        far = self.far if far is None else far
+        return glm.perspective(glm.radians(self.fov), self.aspect_ratio, near, far)
@@ -0,0 +1,235 @@
+import time
+import numpy as np
+
+
+class Bounds:
+    """
+    Класс представляющий ограничивающие объемы меша в локальных координатах.
+    Хранит выровненный по осям параллелепипед (AABB) и описанную сферу.
+    """
+    def __init__(self, positions):
+        """
+        Метод инициализации ограничивающих объемов.
+        :param numpy.ndarray positions: Позиции вершин размером (n, 3).
+        """
+        self.min = positions.min(axis=0)
+        self.max = positions.max(axis=0)
+        self.center = (self.min + self.max) / 2
+        self.radius = float(np.sqrt(((positions - self.center) ** 2).sum(axis=1).max()))
+
+
+def get_world_spheres(matrices, bounds):
+    """
+    Функция переноса описанной сферы меша в мировые координаты для набора объектов.
+    :param numpy.ndarray matrices: Матрицы моделей размером (n, 16) по столбцам.
+    :param Bounds bounds: Ограничивающие объемы меша.
+    :return numpy.ndarray: Сферы (x, y, z, радиус) размером (n, 4).
+    """
+    m = matrices.reshape(-1, 4, 4)
+    cx, cy, cz = bounds.center
+    centers = m[:, 0, :3] * cx + m[:, 1, :3] * cy + m[:, 2, :3] * cz + m[:, 3, :3]
+    scale = np.sqrt((m[:, :3, :3] ** 2).sum(axis=2).max(axis=1))
+    return np.column_stack([centers, bounds.radius * scale]).astype('f4')
+
+
+def get_frustum_planes(m_clip):
+    """
+    Функция извлечения шести плоскостей пирамиды видимости из матрицы (метод Гриба-Хартманна).
+    :param glm.mat4 m_clip: Матрица проекции, умноженная на матрицу вида.
+    :return numpy.ndarray: Нормированные плоскости (a, b, c, d) размером (6, 4).
+    """
+    rows = np.frombuffer(m_clip.to_bytes(), dtype='f4').reshape(4, 4).T
+    planes = np.array([rows[3] + rows[0], rows[3] - rows[0],
+                       rows[3] + rows[1], rows[3] - rows[1],
+                       rows[3] + rows[2], rows[3] - rows[2]])
+    planes /= np.linalg.norm(planes[:, :3], axis=1)[:, None]
+    return planes.astype('f4')
+
+
+def get_morton_order(points, bits=10):
+    """
+    Функция сортировки точек вдоль кривой Мортона, чтобы соседние по индексу точки были близки.
+    :param numpy.ndarray points: Точки размером (n, 3).
+    :param int bits: Число бит на ось.
+    :return numpy.ndarray: Перестановка индексов.
+    """
+    low, high = points.min(axis=0), points.max(axis=0)
+    cells = (points - low) / np.maximum(high - low, 1e-6) * ((1 << bits) - 1)
+    cells = cells.astype(np.uint64)
+
+    code = np.zeros(len(points), dtype=np.uint64)
+    for bit in range(bits):
+        for axis in range(3):
+            code |= ((cells[:, axis] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(3 * bit + axis)
+    return np.argsort(code, kind='stable')
+
+
+class SphereSet:
+    """
+    Класс представляющий набор ограничивающих сфер в виде структуры массивов.
+    Сферы упорядочены по кривой Мортона и сгруппированы в кластеры,
+    поэтому отсечение сначала проверяет кластеры, а затем только пограничные объекты.
+    Перемещенные сферы обновляются на своих местах (refit), пока их не накопится
+    столько, что набор выгоднее пересобрать и заново упорядочить.
+    """
+    cluster_size = 64
+
+    def __init__(self, spheres):
+        """
+        Метод инициализации набора сфер.
+        :param numpy.ndarray spheres: Сферы (x, y, z, радиус) размером (n, 4).
+        """
+        self.count = len(spheres)
+        self.order = get_morton_order(spheres[:, :3]) if self.count else np.zeros(0, dtype=int)
+        spheres = spheres[self.order]
+
+        # дополнение до целого числа кластеров копиями последней сферы
+        k = self.cluster_size
+        padded = -self.count % k
+        if self.count and padded:
+            spheres = np.vstack([spheres, np.repeat(spheres[-1:], padded, axis=0)])
+
+        self.points = np.ones((4, len(spheres)), dtype='f4')
+        self.points[:3] = spheres[:, :3].T
+        self.radius = np.ascontiguousarray(spheres[:, 3])
+        self.offsets = np.arange(k)
+
+        clusters = spheres.reshape(-1, k, 4)
+        centers = clusters[:, :, :3].mean(axis=1)
+        distances = np.linalg.norm(clusters[:, :, :3] - centers[:, None], axis=2)
+        self.cluster_points = np.ones((4, len(clusters)), dtype='f4')
+        self.cluster_points[:3] = centers.T
+        self.cluster_radius = (distances + clusters[:, :, 3]).max(axis=1).astype('f4')
+        # число сфер, обновленных после упорядочивания
+        self.refitted = 0
+
+    def refit(self, slots, spheres):
+        """
+        Метод обновления сфер на их местах в наборе без пересортировки.
+        Пересчитываются только кластеры, в которые входят обновленные сферы.
+        :param numpy.ndarray slots: Места сфер в порядке набора (order).
+        :param numpy.ndarray spheres: Новые сферы размером (n, 4).
+        """
+        k = self.cluster_size
+        self.points[:3, slots] = spheres[:, :3].T
+        self.radius[slots] = spheres[:, 3]
+        # копии последней сферы в дополнении кластера
+        self.points[:, self.count:] = self.points[:, self.count - 1:self.count]
+        self.radius[self.count:] = self.radius[self.count - 1]
+
+        clusters = np.unique(slots // k)
+        index = (clusters[:, None] * k + self.offsets).ravel()
+        points = self.points[:3, index].T.reshape(-1, k, 3)
+        centers = points.mean(axis=1)
+        distances = np.linalg.norm(points - centers[:, None], axis=2)
+        self.cluster_points[:3, clusters] = centers.T
+        self.cluster_radius[clusters] = (distances + self.radius[index].reshape(-1, k)).max(axis=1)
+        self.refitted += len(slots)
+
+    def test(self, planes):
+        """
+        Метод проверки всех сфер набора на пересечение с пирамидой видимости.
+        :param numpy.ndarray planes: Плоскости размером (6, 4).
+        :return numpy.ndarray: Маска видимости в порядке набора (order).
+        """
+        if not self.count:
+            return np.zeros(0, dtype=bool)
+
+        dist = planes @ self.cluster_points
+        outside = (dist < -self.cluster_radius).any(axis=0)
+        inside = (dist > self.cluster_radius).all(axis=0)
+        mask = np.repeat(inside, self.cluster_size)
+
+        partial = np.flatnonzero(~(outside | inside))
+        if len(partial):
+            index = (partial[:, None] * self.cluster_size + self.offsets).ravel()
+            dist = planes @ self.points[:, index]
+            mask[index] = dist.min(axis=0) > -self.radius[index]
+        return mask[:self.count]
+
+    def get_depths(self, m_view):
+        """
+        Метод вычисления расстояния от камеры до ближней точки каждой сферы вдоль взгляда.
+        :param glm.mat4 m_view: Матрица вида камеры.
+        :return numpy.ndarray: Глубины в порядке набора (order), не меньше нуля.
+        """
+        # третья строка матрицы вида дает координату z в пространстве камеры
+        row = np.frombuffer(m_view.to_bytes(), dtype='f4').reshape(4, 4)[:, 2]
+        depths = -(row @ self.points[:, :self.count]) - self.radius[:self.count]
+        return np.maximum(depths, 0.0)
+
+
+class FrustumCuller:
+    """
+    Класс представляющий отсечение объектов по пирамиде видимости.
+    Ведет счетчики видимых и отсеченных объектов для каждого прохода.
+    """
+    def __init__(self, enabled=True):
+        """
+        Метод инициализации объекта отсечения.
+        :param bool enabled: Включено ли отсечение.
+        """
+        self.enabled = enabled
+        self.stats = {}
+        self.frame_stats = {}
+        self.planes = {}
+
+    def set_frustum(self, name, m_clip):
+        """
+        Метод установки пирамиды видимости прохода на текущий кадр.
+        :param str name: Имя прохода ('main', 'shadow').
+        :param glm.mat4 m_clip: Матрица проекции, умноженная на матрицу вида.
+        """
+        self.planes[name] = get_frustum_planes(m_clip)
+        self.stats[name] = {'visible': 0, 'culled': 0, 'time': 0.0}
+
+    def cull(self, name, sphere_set):
+        """
+        Метод отсечения набора сфер пирамидой видимости прохода.
+        :param str name: Имя прохода.
+        :param SphereSet sphere_set: Набор ограничивающих сфер.
+        :return numpy.ndarray: Маска видимости или None, если отсечение выключено.
+        """
+        if not self.enabled:
+            return None
+
+        start = time.perf_counter()
+        mask = sphere_set.test(self.planes[name])
+        visible = int(np.count_nonzero(mask))
+
+        stats = self.stats[name]
+        stats['visible'] += visible
+        stats['culled'] += sphere_set.count - visible
+        stats['time'] += (time.perf_counter() - start) * 1000
+        return mask
+
+    def cull_index(self, name, index, positions):
+        """
+        Метод отсечения объектов пространственного индекса пирамидой видимости прохода.
+        Дерево отбрасывает невидимые области целиком, поэтому время зависит
+        в основном от числа видимых объектов, а не от размера сцены.
+        :param str name: Имя прохода.
+        :param LooseOctree index: Пространственный индекс объектов.
+        :param dict positions: Объект -> его номер в маске; остальные объекты индекса пропускаются.
+        :return numpy.ndarray: Маска видимости или None, если отсечение выключено.
+        """
+        if not self.enabled:
+            return None
+
+        start = time.perf_counter()
+        mask = np.zeros(len(positions), dtype=bool)
+        rows = [positions[obj] for obj in index.query_planes(self.planes[name]) if obj in positions]
+        mask[rows] = True
+
+        stats = self.stats[name]
+        stats['visible'] += len(rows)
+        stats['culled'] += len(positions) - len(rows)
+        stats['time'] += (time.perf_counter() - start) * 1000
+        return mask
+
+    def begin_frame(self):
+        """
+        Метод начала нового кадра: сохраняет счетчики прошлого кадра.
+        """
+        self.frame_stats = self.stats
+        self.stats = {}
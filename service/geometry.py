@@ -0,0 +1,177 @@
+import numpy as np
+
+CACHE_SIZE = 32
+
+
+def weld(vertex_data):
+    """
+    Функция слияния одинаковых вершин (текстурные координаты, нормаль, позиция).
+    Вершины сохраняют порядок первого появления.
+    :param numpy.ndarray vertex_data: Несвязанные вершины размером (n, k).
+    :return tuple: Уникальные вершины размером (m, k) и индексы uint32 размером (n,).
+    """
+    vertex_data = np.ascontiguousarray(vertex_data, dtype='f4').reshape(len(vertex_data), -1)
+    rows = vertex_data.view(np.dtype((np.void, vertex_data.dtype.itemsize * vertex_data.shape[1])))
+    _, first, inverse = np.unique(rows.ravel(), return_index=True, return_inverse=True)
+
+    order = np.argsort(first)
+    remap = np.empty_like(order)
+    remap[order] = np.arange(len(order))
+    return vertex_data[first[order]], remap[inverse].astype('u4')
+
+
+def get_vertex_score(cache_position, valence):
+    """
+    Функция оценки вершины по алгоритму Форсайта (Linear-Speed Vertex Cache Optimisation).
+    :param int cache_position: Позиция вершины в кэше или -1.
+    :param int valence: Число еще не выведенных треугольников вершины.
+    :return float: Оценка вершины.
+    """
+    if not valence:
+        return -1.0
+    score = 0.0
+    if cache_position >= 0:
+        if cache_position < 3:
+            score = 0.75
+        else:
+            score = (1.0 - (cache_position - 3) / (CACHE_SIZE - 3)) ** 1.5
+    return score + 2.0 * valence ** -0.5
+
+
+def optimize_triangle_order(indices):
+    """
+    Функция переупорядочивания треугольников для кэша вершин после преобразования.
+    Жадный выбор треугольника зависит от предыдущего шага и не векторизуется,
+    поэтому функция медленнее разбора файла и вызывается только по запросу.
+    :param numpy.ndarray indices: Индексы треугольников размером (n * 3,).
+    :return numpy.ndarray: Переупорядоченные индексы.
+    """
+    triangles = np.asarray(indices).reshape(-1, 3).tolist()
+    count = int(max(indices)) + 1 if len(indices) else 0
+
+    vertex_triangles = [[] for _ in range(count)]
+    for triangle, corners in enumerate(triangles):
+        for vertex in corners:
+            vertex_triangles[vertex].append(triangle)
+
+    valence = [len(items) for items in vertex_triangles]
+    position = [-1] * count
+    vertex_score = [get_vertex_score(-1, value) for value in valence]
+    triangle_score = [sum(vertex_score[v] for v in corners) for corners in triangles]
+    emitted = [False] * len(triangles)
+
+    cache, result = [], []
+    best, next_unemitted = -1, 0
+    for _ in range(len(triangles)):
+        if best < 0:
+            # полный перебор нужен, только если в кэше не осталось треугольников
+            while emitted[next_unemitted]:
+                next_unemitted += 1
+            best = next_unemitted
+
+        corners = triangles[best]
+        emitted[best] = True
+        result.extend(corners)
+        for vertex in corners:
+            valence[vertex] -= 1
+            vertex_triangles[vertex].remove(best)
+            if vertex in cache:
+                cache.remove(vertex)
+            cache.insert(0, vertex)
+
+        evicted = cache[CACHE_SIZE:]
+        del cache[CACHE_SIZE:]
+        for vertex in evicted:
+            position[vertex] = -1
+
+        touched = set(cache) | set(evicted)
+        for index, vertex in enumerate(cache):
+            position[vertex] = index
+        for vertex in touched:
+            score = get_vertex_score(position[vertex], valence[vertex])
+            delta = score - vertex_score[vertex]
+            vertex_score[vertex] = score
+            for triangle in vertex_triangles[vertex]:
+                triangle_score[triangle] += delta
+
+        best, best_score = -1, -1.0
+        for vertex in cache:
+            for triangle in vertex_triangles[vertex]:
+                if triangle_score[triangle] > best_score:
+                    best, best_score = triangle, triangle_score[triangle]
+    return np.array(result, dtype='u4')
+
+
+def reorder_vertices(vertex_data, indices):
+    """
+    Функция перенумерации вершин в порядке первого использования в буфере индексов.
+    :param numpy.ndarray vertex_data: Вершины размером (m, k).
+    :param numpy.ndarray indices: Индексы.
+    :return tuple: Переупорядоченные вершины и индексы.
+    """
+    _, first = np.unique(indices, return_index=True)
+    order = indices[np.sort(first)]
+    remap = np.empty(len(vertex_data), dtype='u4')
+    remap[order] = np.arange(len(order), dtype='u4')
+    return vertex_data[order], remap[indices]
+
+
+def get_acmr(indices, cache_size=CACHE_SIZE):
+    """
+    Функция оценки среднего числа промахов кэша вершин на треугольник (ACMR) для FIFO-кэша.
+    :param numpy.ndarray indices: Индексы треугольников.
+    :param int cache_size: Размер кэша.
+    :return float: Среднее число промахов на треугольник.
+    """
+    cache, members, misses = [], set(), 0
+    for vertex in np.asarray(indices).tolist():
+        if vertex in members:
+            continue
+        misses += 1
+        cache.append(vertex)
+        members.add(vertex)
+        if len(cache) > cache_size:
+            members.discard(cache.pop(0))
+    return misses / max(1, len(indices) // 3)
+
+
+def get_index_stats(source_count, vertex_data, indices):
+    """
+    Функция подсчета экономии памяти после слияния вершин.
+    :param int source_count: Число вершин до слияния.
+    :param numpy.ndarray vertex_data: Вершины после слияния размером (m, k).
+    :param numpy.ndarray indices: Индексы.
+    :return dict: Число вершин и размеры буферов в байтах.
+    """
+    stride = vertex_data.shape[1] * vertex_data.itemsize
+    source_bytes = source_count * stride
+    indexed_bytes = vertex_data.nbytes + indices.nbytes
+    return {
+        'source_vertices': source_count,
+        'vertices': len(vertex_data),
+        'indices': len(indices),
+        'source_bytes': source_bytes,
+        'bytes': indexed_bytes,
+        'saved_bytes': source_bytes - indexed_bytes
+    }
+
+
+def build_indexed(vertex_data, ranges=None, optimize=False):
+    """
+    Функция построения индексированной геометрии из несвязанных треугольников.
+    Треугольники переупорядочиваются внутри каждого диапазона материалов,
+    поэтому диапазоны остаются непрерывными в буфере индексов.
+    :param numpy.ndarray vertex_data: Несвязанные вершины размером (n, k).
+    :param list ranges: Диапазоны материалов (first, count в вершинах) или None.
+    :param bool optimize: Переупорядочивать ли треугольники для кэша вершин.
+    :return tuple: Вершины, индексы uint32.
+    """
+    vertex_data, indices = weld(vertex_data)
+    if optimize and len(indices):
+        ranges = ranges or [{'first': 0, 'count': len(indices)}]
+        indices = np.concatenate([
+            optimize_triangle_order(indices[item['first']:item['first'] + item['count']])
+            for item in ranges
+        ])
+        vertex_data, indices = reorder_vertices(vertex_data, indices)
+    return vertex_data, indices
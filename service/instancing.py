@@ -0,0 +1,456 @@
+import numpy as np
+from service.culling import SphereSet, get_world_spheres
+
+# данные экземпляра: матрица модели, матрица нормалей и слой текстурного массива
+INSTANCE_FORMAT = {False: ('16f 9f/i', ('in_instance_model', 'in_instance_normal')),
+                   True: ('16f 9f 1f/i', ('in_instance_model', 'in_instance_normal',
+                                          'in_instance_layer'))}
+
+# формат тех же данных для проходов, которым нужна только матрица модели
+POSITION_FORMAT = {False: '16f 36x/i', True: '16f 40x/i'}
+
+
+class InstanceGroup:
+    """
+    Класс представляющий экземпляры одного меша с одной текстурой, загруженные
+    из файла сцены без объекта Python на каждый экземпляр: группа хранит только
+    номера записей в хранилище преобразований и ограничивающие сферы экземпляров.
+    Сферы первых len(spheres) экземпляров посчитаны, остальные ждут update_pending.
+    """
+    def __init__(self, app, vao_name, tex_id):
+        """
+        Метод инициализации группы экземпляров.
+        :param GraphicsEngine app: Объект приложения.
+        :param str vao_name: Имя VAO экземпляров.
+        :param tex_id: Идентификатор текстуры экземпляров.
+        """
+        self.app = app
+        self.vao_name = vao_name
+        self.tex_id = tex_id
+        self.transforms = app.transforms
+        self.indices = np.zeros(0, dtype=int)
+        self.spheres = np.zeros((0, 4), dtype='f4')
+        # текстуры, которые может заменить текстурный массив, запрашиваются при сборке групп
+        app.mesh.request(vao_name, None if tex_id in app.mesh.texture.array_ids else tex_id)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def get_spheres(self, indices):
+        """
+        Метод вычисления ограничивающих сфер записей в мировых координатах.
+        :param numpy.ndarray indices: Номера записей в хранилище преобразований.
+        :return numpy.ndarray: Сферы размером (n, 4).
+        """
+        bounds = self.app.mesh.vao.vbo.vbos[self.vao_name].bounds
+        return get_world_spheres(self.transforms.get_matrices(indices), bounds)
+
+    def add(self, position, rotation, scale):
+        """
+        Метод добавления экземпляров в группу одним шагом.
+        Сферы новых экземпляров вычисляются позже в update_pending, чтобы
+        добавление не ждало разбора меша.
+        :param numpy.ndarray position: Позиции размером (n, 3).
+        :param numpy.ndarray rotation: Углы поворота по осям в градусах размером (n, 3).
+        :param numpy.ndarray scale: Масштабы размером (n, 3).
+        :return numpy.ndarray: Номера записей добавленных экземпляров.
+        """
+        indices = self.transforms.add_many(position, np.radians(rotation), scale)
+        self.indices = np.concatenate([self.indices, indices])
+        return indices
+
+    def update_pending(self):
+        """
+        Метод вычисления сфер экземпляров, добавленных после прошлого вызова.
+        :return numpy.ndarray: Строки этих экземпляров в группе.
+        """
+        rows = np.arange(len(self.spheres), len(self.indices))
+        if len(rows):
+            self.spheres = np.concatenate([self.spheres, self.get_spheres(self.indices[rows])])
+        return rows
+
+    def find(self, indices):
+        """
+        Метод поиска записей группы среди номеров записей хранилища.
+        :param numpy.ndarray indices: Номера записей хранилища по возрастанию.
+        :return tuple: Маска записей группы среди indices и их строки в группе.
+        """
+        rows = np.minimum(np.searchsorted(self.indices, indices), max(len(self.indices) - 1, 0))
+        mask = self.indices[rows] == indices if len(self.indices) else \
+            np.zeros(len(indices), dtype=bool)
+        return mask, rows[mask]
+
+    def update_spheres(self, rows):
+        """
+        Метод пересчета сфер перемещенных экземпляров.
+        :param numpy.ndarray rows: Строки экземпляров в группе.
+        :return tuple: Сферы до и после перемещения.
+        """
+        old = self.spheres[rows]
+        self.spheres[rows] = self.get_spheres(self.indices[rows])
+        return old, self.spheres[rows]
+
+
+class InstanceBatch:
+    """
+    Класс представляющий группу объектов с общим VAO и текстурой.
+    Матрицы моделей и нормалей всех объектов группы хранятся в буфере экземпляров,
+    поэтому группа отрисовывается одним вызовом в каждом проходе.
+    Группа с ключом текстурного массива вместо текстуры объединяет объекты
+    с разными текстурами из этого массива: номер слоя хранится в данных экземпляра.
+    """
+    def __init__(self, app, vao_name, tex_id, depth_prepass=False):
+        """
+        Метод инициализации группы объектов.
+        :param GraphicsEngine app: Объект приложения.
+        :param str vao_name: Имя VAO, общего для всех объектов группы.
+        :param tex_id: Идентификатор текстуры, общей для всех объектов группы,
+                       или ключ текстурного массива (Texture.get_arrays).
+        :param bool depth_prepass: Создавать VAO предварительного прохода глубины.
+        """
+        self.app = app
+        self.ctx = app.ctx
+        self.vao_name = vao_name
+        self.tex_id = tex_id
+        self.name = f'{vao_name}:{tex_id}'
+        self.objects = []
+        self.groups = []
+        self.transforms = app.transforms
+        self.indices = None
+        self.layers = None
+        self.count = 0
+        # место строки группы в буфере (в порядке набора сфер) и строки по возрастанию номеров записей
+        self.slots = None
+        self.sorted_rows = None
+
+        vao = app.mesh.vao
+        self.vbo = vao.vbo.vbos[vao_name]
+        self.texture_array = tex_id in app.mesh.texture.arrays
+        defines = self.vbo.layout.defines
+        self.program = vao.program.get_variant('default_array' if self.texture_array
+                                               else 'default_instanced', **defines)
+        self.shadow_program = vao.program.get_variant('shadow_map_instanced', **defines)
+        self.depth_program = (vao.program.get_variant('depth_prepass_instanced', **defines)
+                              if depth_prepass else None)
+        self.texture = app.mesh.texture.textures[tex_id]
+        self.depth_texture = app.mesh.texture.textures['depth_texture']
+        self.state = app.render_state
+
+        self.instance_data = None
+        self.spheres = None
+        self.instance_buffers = {}
+        self.visible = {}
+        # буферы, данные которых устарели для последней маски видимости
+        self.stale = set()
+        self.counts = {}
+        self.vao = None
+        self.shadow_vao = None
+        # уровень детализации -> (VAO, VAO для теней, VAO прохода глубины или None)
+        self.lod_names = vao.get_lod_names(vao_name)
+        self.lod_vaos = {}
+
+    def add(self, obj):
+        """
+        Метод добавления объекта в группу.
+        :param ExtendedBaseModel obj: Объект сцены.
+        """
+        self.objects.append(obj)
+
+    def add_group(self, group):
+        """
+        Метод добавления в группу отрисовки экземпляров, загруженных из файла сцены.
+        :param InstanceGroup group: Группа экземпляров.
+        """
+        self.groups.append(group)
+
+    def get_instance_data(self):
+        """
+        Метод сборки матриц моделей и нормалей всех объектов группы в один массив.
+        Матрицы берутся из хранилища преобразований одной выборкой.
+        :return numpy.ndarray: Массив размером (n, 25): матрицы 4x4 и 3x3 по столбцам.
+        """
+        return np.hstack([self.transforms.get_matrices(self.indices),
+                          self.transforms.get_normal_matrices(self.indices)])
+
+    def get_layers(self):
+        """
+        Метод получения слоев текстурного массива для всех объектов и экземпляров группы.
+        :return numpy.ndarray: Номера слоев размером (n, 1).
+        """
+        layers = self.app.mesh.texture.arrays[self.tex_id]
+        return np.concatenate([[layers[obj.tex_id] for obj in self.objects],
+                               *[np.full(len(group), layers[group.tex_id]) for group in self.groups]]
+                              ).astype('f4').reshape(-1, 1)
+
+    def update_instances(self):
+        """
+        Метод сборки данных экземпляров и набора ограничивающих сфер.
+        Экземпляры упорядочиваются так же, как их ограничивающие сферы.
+        """
+        instance_data = self.get_instance_data()
+        self.count = len(instance_data)
+        self.spheres = SphereSet(get_world_spheres(instance_data[:, :16], self.vbo.bounds))
+        if self.texture_array:
+            instance_data = np.hstack([instance_data, self.layers])
+        self.instance_data = np.ascontiguousarray(instance_data[self.spheres.order])
+        self.slots = np.empty(self.count, dtype=int)
+        self.slots[self.spheres.order] = np.arange(self.count)
+        self.sorted_rows = np.argsort(self.indices, kind='stable')
+
+    def find(self, indices):
+        """
+        Метод поиска строк группы по номерам записей хранилища преобразований.
+        :param numpy.ndarray indices: Номера записей.
+        :return numpy.ndarray: Строки группы с этими записями.
+        """
+        if not self.count:
+            return np.zeros(0, dtype=int)
+        sorted_indices = self.indices[self.sorted_rows]
+        places = np.minimum(np.searchsorted(sorted_indices, indices), self.count - 1)
+        return self.sorted_rows[places[sorted_indices[places] == indices]]
+
+    def refit(self, rows):
+        """
+        Метод обновления данных и сфер перемещенных экземпляров на их местах
+        без пересортировки набора сфер.
+        :param numpy.ndarray rows: Строки группы.
+        :return numpy.ndarray: Места строк в буфере экземпляров.
+        """
+        indices = self.indices[rows]
+        data = np.hstack([self.transforms.get_matrices(indices),
+                          self.transforms.get_normal_matrices(indices)])
+        slots = self.slots[rows]
+        self.spheres.refit(slots, get_world_spheres(data[:, :16], self.vbo.bounds))
+        self.instance_data[slots, :data.shape[1]] = data
+        return slots
+
+    def get_indices(self):
+        """
+        Метод получения номеров записей хранилища преобразований всех объектов
+        и экземпляров группы.
+        :return numpy.ndarray: Номера записей.
+        """
+        return np.concatenate([[obj.transform for obj in self.objects],
+                               *[group.indices for group in self.groups]]).astype(int)
+
+    def build(self):
+        """
+        Метод создания буферов экземпляров и VAO для обоих проходов.
+        """
+        self.indices = self.get_indices()
+        if self.texture_array:
+            self.layers = self.get_layers()
+        self.update_instances()
+
+        for name in ('main', 'shadow'):
+            self.instance_buffers[name] = self.ctx.buffer(self.instance_data)
+            self.visible[name] = None
+            self.counts[name] = self.count
+        self.lod_vaos[0] = self.get_vaos(self.vbo)
+        self.vao, self.shadow_vao = self.lod_vaos[0][:2]
+        self.on_init()
+
+    def refresh(self, changed=None):
+        """
+        Метод обновления группы после перемещения ее объектов без пересоздания VAO.
+        Матрицы и сферы перемещенных экземпляров обновляются на своих местах,
+        а в буферы перезаписывается только диапазон с ними. Набор сфер пересобирается
+        и заново упорядочивается, когда обновлена четверть экземпляров после прошлой
+        сортировки, а также если в группы экземпляров дописаны экземпляры
+        (тогда буферы увеличиваются на месте).
+        :param numpy.ndarray changed: Номера измененных записей хранилища преобразований
+                                      (None - пересобрать группу целиком).
+        """
+        rows = None
+        if len(self.indices) != len(self.objects) + sum(map(len, self.groups)):
+            self.indices = self.get_indices()
+            if self.texture_array:
+                self.layers = self.get_layers()
+        elif changed is not None:
+            rows = self.find(changed)
+            if not len(rows):
+                return
+            if (self.spheres.refitted + len(rows)) * 4 > self.count:
+                rows = None
+
+        if rows is None:
+            self.update_instances()
+            for name, buffer in self.instance_buffers.items():
+                if buffer.size < self.instance_data.nbytes:
+                    buffer.orphan(self.instance_data.nbytes)
+                buffer.write(self.instance_data)
+                self.visible[name] = None
+                self.counts[name] = self.count
+            self.stale.clear()
+            return
+
+        slots = self.refit(rows)
+        start, end = int(slots.min()), int(slots.max()) + 1
+        stride = self.instance_data.strides[0]
+        for name, buffer in self.instance_buffers.items():
+            if self.visible[name] is None:
+                buffer.write(self.instance_data[start:end], offset=start * stride)
+            else:
+                self.stale.add(name)
+
+    def get_vaos(self, vbo):
+        """
+        Метод создания VAO проходов для буфера вершин с общими буферами экземпляров.
+        Проход глубины читает буфер экземпляров основного прохода.
+        :param BaseVBO vbo: Буфер вершин (исходный меш или уровень детализации).
+        :return tuple: VAO основного прохода, прохода теней и прохода глубины (или None).
+        """
+        vao = self.app.mesh.vao
+        instance_format, instance_attribs = INSTANCE_FORMAT[self.texture_array]
+        position_format = POSITION_FORMAT[self.texture_array]
+        depth_vao = None
+        if self.depth_program is not None:
+            depth_vao = vao.get_vao(self.depth_program, vbo,
+                                    instance_buffer=self.instance_buffers['main'],
+                                    instance_format=position_format)
+        return (vao.get_vao(self.program, vbo, instance_buffer=self.instance_buffers['main'],
+                            instance_format=instance_format, instance_attribs=instance_attribs),
+                vao.get_vao(self.shadow_program, vbo, instance_buffer=self.instance_buffers['shadow'],
+                            instance_format=position_format),
+                depth_vao)
+
+    def get_lod_vaos(self, level):
+        """
+        Метод получения VAO уровня детализации, общего для всей группы.
+        Меш уровня загружается при первом выборе, а пока он загружается,
+        берется ближайший более детальный готовый уровень.
+        :param int level: Желаемый уровень детализации.
+        :return tuple: VAO основного прохода, прохода теней и прохода глубины.
+        """
+        vao = self.app.mesh.vao
+        level = vao.get_ready_level(self.lod_names, level)
+        if level not in self.lod_vaos:
+            name = self.lod_names[level]
+            self.lod_vaos[level] = self.get_vaos(vao.vbo.vbos[vao.layouts[name][1]])
+        return self.lod_vaos[level]
+
+    def set_visible(self, name, mask):
+        """
+        Метод загрузки в буфер прохода только видимых экземпляров.
+        :param str name: Имя прохода ('main', 'shadow').
+        :param numpy.ndarray mask: Маска видимости или None, чтобы рисовать все экземпляры.
+        """
+        last = self.visible[name]
+        if mask is None:
+            if last is None and name not in self.stale:
+                return
+            data = self.instance_data
+        elif last is not None and name not in self.stale and np.array_equal(mask, last):
+            return
+        else:
+            data = self.instance_data[mask]
+        self.stale.discard(name)
+
+        if len(data):
+            self.instance_buffers[name].write(data)
+        self.visible[name] = mask
+        self.counts[name] = len(data)
+
+    def update(self):
+        """
+        Метод обновляет данные в шейдере перед рендерингом группы.
+        Данные камеры и света передаются через блок форм кадра (FrameUniforms).
+        """
+        self.state.use_texture(self.texture, location=0)
+
+    def render(self, mask=None, vao=None):
+        """
+        Метод визуализации видимых объектов группы одним вызовом.
+        :param numpy.ndarray mask: Маска видимости экземпляров.
+        :param moderngl.VertexArray vao: VAO уровня детализации (по умолчанию - исходный).
+        """
+        self.set_visible('main', mask)
+        if self.counts['main']:
+            self.update()
+            vao = vao or self.vao
+            vao.extra.use(self.state, self.program)
+            vao.render(instances=self.counts['main'])
+
+    def render_shadow(self, mask=None, vao=None):
+        """
+        Рендеринг видимых из источника света объектов группы для теней одним вызовом.
+        :param numpy.ndarray mask: Маска видимости экземпляров.
+        :param moderngl.VertexArray vao: VAO уровня детализации (по умолчанию - исходный).
+        """
+        self.set_visible('shadow', mask)
+        if self.counts['shadow']:
+            vao = vao or self.shadow_vao
+            vao.extra.use(self.state, self.shadow_program)
+            vao.render(instances=self.counts['shadow'])
+
+    def render_depth(self, mask=None, vao=None):
+        """
+        Рендеринг глубины видимых объектов группы в предварительном проходе.
+        Видимые экземпляры загружаются в буфер основного прохода, поэтому
+        основной проход с той же маской не перезаписывает его.
+        :param numpy.ndarray mask: Маска видимости экземпляров.
+        :param moderngl.VertexArray vao: VAO прохода глубины нужного уровня детализации.
+        """
+        self.set_visible('main', mask)
+        if self.counts['main']:
+            vao.extra.use(self.state, self.depth_program)
+            vao.render(instances=self.counts['main'])
+
+    def submit(self, queue, mask=None, depths=None, level=0):
+        """
+        Метод добавления пакета отрисовки группы в очередь.
+        Глубиной группы считается глубина ее ближнего видимого экземпляра.
+        :param RenderQueue queue: Очередь отрисовки.
+        :param numpy.ndarray mask: Маска видимости экземпляров.
+        :param numpy.ndarray depths: Глубины экземпляров.
+        :param int level: Уровень детализации группы.
+        """
+        if mask is not None and depths is not None:
+            depths = depths[mask]
+        depth = float(depths.min()) if depths is not None and len(depths) else 0.0
+        vao = self.get_lod_vaos(level)[0]
+        queue.submit('opaque', self.program, self.texture, vao, depth,
+                     lambda: self.render(mask, vao), name=self.name)
+
+    def submit_shadow(self, queue, mask=None, level=0):
+        """
+        Метод добавления пакета отрисовки группы для теней в очередь.
+        :param RenderQueue queue: Очередь отрисовки.
+        :param numpy.ndarray mask: Маска видимости экземпляров.
+        :param int level: Уровень детализации группы.
+        """
+        vao = self.get_lod_vaos(level)[1]
+        queue.submit('shadow', self.shadow_program, None, vao, 0.0,
+                     lambda: self.render_shadow(mask, vao), name=self.name)
+
+    def submit_depth(self, queue, mask=None, depths=None, level=0):
+        """
+        Метод добавления пакета предварительного прохода глубины в очередь.
+        :param RenderQueue queue: Очередь отрисовки.
+        :param numpy.ndarray mask: Маска видимости экземпляров.
+        :param numpy.ndarray depths: Глубины экземпляров.
+        :param int level: Уровень детализации группы (тот же, что в основном проходе).
+        """
+        if mask is not None and depths is not None:
+            depths = depths[mask]
+        depth = float(depths.min()) if depths is not None and len(depths) else 0.0
+        vao = self.get_lod_vaos(level)[2]
+        queue.submit('depth', self.depth_program, None, vao, depth,
+                     lambda: self.render_depth(mask, vao), name=self.name)
+
+    def on_init(self):
+        """
+        Метод для установки начальных значений для форм и матриц шейдеров.
+        """
+        state = self.state
+        state.write(self.program, 'shadowMap', 1)
+        state.write(self.program, 'u_texture_0', 0)
+        state.use_texture(self.depth_texture, location=1)
+
+    def destroy(self):
+        """
+        Метод уничтожения объекта путем освобождения связанных ресурсов.
+        """
+        vaos = [vao for vaos in self.lod_vaos.values() for vao in vaos if vao is not None]
+        for resource in (*vaos, *self.instance_buffers.values()):
+            resource.release()
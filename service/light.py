@@ -28,6 +28,21 @@ class Light:
         self.Is = specular * self.color
 
         self.m_view_light = self.get_view_matrix()
+        # увеличивается при каждом изменении, влияющем на карту теней
+        self.version = 0
+
+    def set_position(self, position=None, direction=None):
+        """
+        Метод перемещения источника света с пересчетом матрицы вида.
+        :param position: Новое положение источника света (x, y, z).
+        :param direction: Новая точка, куда направлен источник света (x, y, z).
+        """
+        if position is not None:
+            self.position = glm.vec3(position)
+        if direction is not None:
+            self.direction = glm.vec3(direction)
+        self.m_view_light = self.get_view_matrix()
+        self.version += 1
 
     def get_view_matrix(self, view=(0, 1, 0)):
         """
@@ -35,3 +50,71 @@ class Light:
         :return glm.mat4: Матрица вида для источника света.
         """
         return glm.lookAt(self.position, self.direction, glm.vec3(view))
+
+
+class PointLight:
+    """
+    Класс представляющий точечный источник света без теней.
+    Таких источников в сцене может быть много: они распределяются по кластерам
+    пирамиды видимости (LightGrid), и фрагмент освещается только источниками своего кластера.
+    Присваивание положения, цвета, радиуса или интенсивности увеличивает версию
+    источников сцены, в которую добавлен источник (изменение вектора на месте,
+    например light.position.x = 1, не отслеживается).
+    """
+    def __init__(self, position=(0, 0, 0), color=(1, 1, 1), radius=5.0, intensity=1.0):
+        """
+        Метод инициализации точечного источника света.
+        :param position: Положение источника света (x, y, z).
+        :param color: RGB-цвет источника света.
+        :param float radius: Расстояние, на котором освещенность спадает до нуля.
+        :param float intensity: Интенсивность свечения.
+        """
+        # сцена, источники которой содержат этот источник (задается в Scene.add_light)
+        self.scene = None
+        self._position = glm.vec3(position)
+        self._color = glm.vec3(color)
+        self._radius = radius
+        self._intensity = intensity
+
+    def changed(self):
+        """
+        Метод учета изменения источника света в версии источников сцены.
+        """
+        if self.scene is not None:
+            self.scene.lights_version += 1
+
+    @property
+    def position(self):
+        return self._position
+
+    @position.setter
+    def position(self, value):
+        self._position = glm.vec3(value)
+        self.changed()
+
+    @property
+    def color(self):
+        return self._color
+
+    @color.setter
+    def color(self, value):
+        self._color = glm.vec3(value)
+        self.changed()
+
+    @property
+    def radius(self):
+        return self._radius
+
+    @radius.setter
+    def radius(self, value):
+        self._radius = value
+        self.changed()
+
+    @property
+    def intensity(self):
+        return self._intensity
+
+    @intensity.setter
+    def intensity(self, value):
+        self._intensity = value
+        self.changed()
@@ -0,0 +1,237 @@
+import time
+import numpy as np
+import moderngl as mgl
+
+# размер сетки кластеров: плитки экрана по x и y и слои по глубине
+GRID_SIZE = (16, 9, 24)
+
+# текстурные блоки данных источников, сетки кластеров и списка индексов источников
+SAMPLERS = {'u_lights': 2, 'u_light_grid': 3, 'u_light_indices': 4}
+
+# ширина текстуры списка индексов источников
+INDEX_WIDTH = 1024
+
+
+def get_cluster_ranges(centers, radius, m_proj, near, far, grid=GRID_SIZE):
+    """
+    Функция вычисления кластеров, которые пересекают ограничивающие параллелепипеды
+    сфер источников света. Для каждого слоя по глубине, который задевает сфера,
+    диапазон плиток берется по проекции параллелепипеда на ближней и дальней
+    границах пересечения сферы со слоем, поэтому он консервативен и не раздувается
+    у источников рядом с камерой.
+    :param numpy.ndarray centers: Центры сфер в пространстве камеры размером (n, 3).
+    :param numpy.ndarray radius: Радиусы сфер размером (n,).
+    :param glm.mat4 m_proj: Матрица перспективной проекции камеры.
+    :param float near: Ближняя граница видимости камеры.
+    :param float far: Дальняя граница видимости камеры.
+    :param tuple grid: Число плиток по x и y и слоев по глубине.
+    :return tuple: Номера источников пар (источник, слой) и нижние и верхние
+                   номера кластеров пар размером (m, 3).
+    """
+    tiles_x, tiles_y, slices = grid
+    depth = -centers[:, 2]
+    z_near = np.maximum(depth - radius, near)
+    z_far = np.minimum(depth + radius, far)
+    lights = np.flatnonzero(z_far > z_near)
+
+    scale = slices / np.log(far / near)
+    first = np.clip(np.floor(np.log(z_near[lights] / near) * scale), 0, slices - 1).astype(int)
+    last = np.clip(np.floor(np.log(z_far[lights] / near) * scale), 0, slices - 1).astype(int)
+    counts = last - first + 1
+    pairs = np.repeat(lights, counts)
+    z = np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                                        counts)
+    d0 = np.maximum(z_near[pairs], near * np.exp(z / scale))
+    d1 = np.minimum(z_far[pairs], near * np.exp((z + 1) / scale))
+
+    lo = np.empty((len(pairs), 3), dtype=int)
+    hi = np.empty((len(pairs), 3), dtype=int)
+    lo[:, 2] = hi[:, 2] = z
+    visible = np.ones(len(pairs), dtype=bool)
+    for axis, (tiles, focal) in enumerate(((tiles_x, m_proj[0][0]), (tiles_y, m_proj[1][1]))):
+        low = centers[pairs, axis] - radius[pairs]
+        high = centers[pairs, axis] + radius[pairs]
+        ndc_low = focal * np.minimum(low / d0, low / d1)
+        ndc_high = focal * np.maximum(high / d0, high / d1)
+        visible &= (ndc_high > -1) & (ndc_low < 1)
+        lo[:, axis] = np.clip(np.floor((ndc_low + 1) / 2 * tiles), 0, tiles - 1)
+        hi[:, axis] = np.clip(np.floor((ndc_high + 1) / 2 * tiles), 0, tiles - 1)
+    return pairs[visible], lo[visible], hi[visible]
+
+
+def bin_lights(lo, hi, grid=GRID_SIZE):
+    """
+    Функция распределения источников по кластерам: список индексов источников,
+    упорядоченный по кластерам, и смещение и число источников каждого кластера.
+    :param numpy.ndarray lo: Нижние номера кластеров источников размером (n, 3).
+    :param numpy.ndarray hi: Верхние номера кластеров источников размером (n, 3).
+    :param tuple grid: Число плиток по x и y и слоев по глубине.
+    :return tuple: Смещения и числа источников кластеров и индексы источников.
+    """
+    tiles_x, tiles_y, slices = grid
+    sizes = hi - lo + 1
+    counts = sizes.prod(axis=1)
+    lights = np.repeat(np.arange(len(lo)), counts)
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    size_x, size_y = sizes[lights, 0], sizes[lights, 1]
+    x = lo[lights, 0] + local % size_x
+    y = lo[lights, 1] + local // size_x % size_y
+    z = lo[lights, 2] + local // (size_x * size_y)
+    clusters = (z * tiles_y + y) * tiles_x + x
+
+    order = np.argsort(clusters, kind='stable')
+    cluster_counts = np.bincount(clusters, minlength=tiles_x * tiles_y * slices)
+    offsets = np.cumsum(cluster_counts) - cluster_counts
+    return offsets, cluster_counts, lights[order]
+
+
+class LightGrid:
+    """
+    Класс представляющий кластерное освещение точечными источниками (clustered forward).
+    Пирамида видимости камеры делится на плитки экрана и экспоненциальные слои
+    по глубине. Каждый кадр источники распределяются по кластерам на процессоре,
+    а данные источников, сетка кластеров и список индексов загружаются в текстуры.
+    Фрагментный шейдер перебирает только источники своего кластера,
+    поэтому стоимость затенения почти не зависит от общего числа источников.
+    """
+    def __init__(self, app, grid=GRID_SIZE):
+        """
+        Метод инициализации кластерного освещения.
+        :param GraphicsEngine app: Объект приложения.
+        :param tuple grid: Число плиток по x и y и слоев по глубине.
+        """
+        self.app = app
+        self.ctx = app.ctx
+        self.state = app.render_state
+        self.grid = grid
+        self.count = 0
+        tiles_x, tiles_y, slices = grid
+        self.light_texture = None
+        self.index_texture = None
+        self.grid_texture = self.get_texture((tiles_x * tiles_y, slices), 2, 'u4')
+        self.stats = {'lights': 0, 'visible': 0, 'indices': 0, 'time': 0.0}
+        self.resize_lights(64)
+        self.resize_indices(INDEX_WIDTH)
+
+    def get_texture(self, size, components, dtype):
+        """
+        Метод создания текстуры данных без фильтрации.
+        :param tuple size: Размер текстуры.
+        :param int components: Число компонент.
+        :param str dtype: Тип данных ('f4', 'u4').
+        :return moderngl.Texture: Текстура.
+        """
+        texture = self.ctx.texture(size, components, dtype=dtype)
+        texture.filter = (mgl.NEAREST, mgl.NEAREST)
+        return texture
+
+    def replace(self, old, new):
+        """
+        Метод замены текстуры большего размера. Имя удаленной текстуры может
+        достаться новой, поэтому кэш привязок сбрасывается.
+        :param moderngl.Texture old: Прежняя текстура или None.
+        :param moderngl.Texture new: Новая текстура.
+        :return moderngl.Texture: Новая текстура.
+        """
+        if old is not None:
+            old.release()
+            self.state.invalidate()
+        return new
+
+    def resize_lights(self, capacity):
+        """
+        Метод создания текстуры данных источников: строка положений и радиусов
+        и строка цветов, умноженных на интенсивность.
+        :param int capacity: Наибольшее число источников.
+        """
+        self.light_texture = self.replace(self.light_texture,
+                                          self.get_texture((capacity, 2), 4, 'f4'))
+
+    def resize_indices(self, capacity):
+        """
+        Метод создания текстуры списка индексов источников по кластерам.
+        :param int capacity: Наибольшая длина списка.
+        """
+        rows = -(-capacity // INDEX_WIDTH)
+        self.index_texture = self.replace(self.index_texture,
+                                          self.get_texture((INDEX_WIDTH, rows), 1, 'u4'))
+
+    @staticmethod
+    def get_light_data(lights):
+        """
+        Метод сборки массивов источников света.
+        :param list lights: Точечные источники света.
+        :return tuple: Положения и радиусы размером (n, 4) и цвета размером (n, 4).
+        """
+        spheres = np.array([(*light.position, light.radius) for light in lights],
+                           dtype='f4').reshape(-1, 4)
+        colors = np.array([(*(light.color * light.intensity), 0.0) for light in lights],
+                          dtype='f4').reshape(-1, 4)
+        return spheres, colors
+
+    def update(self, lights):
+        """
+        Метод распределения источников по кластерам и загрузки текстур на текущий кадр.
+        :param list lights: Точечные источники света.
+        """
+        start = time.perf_counter()
+        camera = self.app.camera
+        spheres, colors = self.get_light_data(lights)
+        self.count = len(spheres)
+
+        m_view = np.frombuffer(camera.m_view.to_bytes(), dtype='f4').reshape(4, 4)
+        centers = spheres[:, :3] @ m_view[:3, :3] + m_view[3, :3]
+        lights, lo, hi = get_cluster_ranges(centers, spheres[:, 3], camera.m_proj,
+                                            camera.near, camera.far, self.grid)
+        offsets, counts, indices = bin_lights(lo, hi, self.grid)
+        indices = lights[indices].astype('u4')
+
+        if self.count > self.light_texture.width:
+            self.resize_lights(1 << (self.count - 1).bit_length())
+        if len(indices) > self.index_texture.width * self.index_texture.height:
+            self.resize_indices(1 << (len(indices) - 1).bit_length())
+
+        if self.count:
+            data = np.zeros((2, self.light_texture.width, 4), dtype='f4')
+            data[0, :self.count] = spheres
+            data[1, :self.count] = colors
+            self.light_texture.write(data)
+        if len(indices):
+            data = np.zeros(self.index_texture.width * self.index_texture.height, dtype='u4')
+            data[:len(indices)] = indices
+            self.index_texture.write(data)
+        self.grid_texture.write(np.column_stack([offsets, counts]).astype('u4'))
+
+        self.stats = {'lights': self.count, 'visible': len(np.unique(lights)),
+                      'indices': len(indices),
+                      'time': (time.perf_counter() - start) * 1000}
+
+    def use(self):
+        """
+        Метод привязки текстур кластерного освещения к их текстурным блокам.
+        """
+        for name, texture in (('u_lights', self.light_texture), ('u_light_grid', self.grid_texture),
+                              ('u_light_indices', self.index_texture)):
+            self.state.use_texture(texture, location=SAMPLERS[name])
+
+    def get_data(self):
+        """
+        Метод сборки параметров сетки для блока форм кадра.
+        :return bytes: Размер сетки и число источников, ближняя граница,
+                       масштаб слоев по глубине и размер плитки в пикселях (2 * vec4).
+        """
+        camera = self.app.camera
+        tiles_x, tiles_y, slices = self.grid
+        width, height = self.app.WIN_SIZE
+        scale = slices / np.log(camera.far / camera.near)
+        return np.array([tiles_x, tiles_y, slices, self.count,
+                         camera.near, scale, width / tiles_x, height / tiles_y],
+                        dtype='f4').tobytes()
+
+    def destroy(self):
+        """
+        Метод уничтожения объекта путем освобождения связанных ресурсов.
+        """
+        for texture in (self.light_texture, self.grid_texture, self.index_texture):
+            texture.release()
@@ -0,0 +1,313 @@
+import heapq
+import threading
+import hashlib
+import numpy as np
+from service.wavefront import (ObjMesh, get_file_hash, get_cache_path, read_cache, write_cache,
+                               get_indexed_mesh, load_obj)
+
+# доли треугольников исходного меша для уровней детализации 1, 2, ...
+LOD_RATIOS = (0.5, 0.25, 0.1)
+LOD_VERSION = 2
+
+# наименьший диаметр объекта на экране (в пикселях) для уровней 0, 1, 2, ...
+LOD_THRESHOLDS = (240, 120, 48)
+
+# угол поворота грани (косинус), начиная с которого стягивание ребра запрещено
+MIN_NORMAL_DOT = 0.2
+
+lod_lock = threading.Lock()
+
+# уровни, построенные без кэша на диске: хэш уровней -> меши уровней 1, 2, ...
+lod_meshes = {}
+
+
+def get_face_quadrics(positions, triangles):
+    """
+    Функция вычисления квадрик ошибки граней (Garland-Heckbert), взвешенных площадью.
+    :param numpy.ndarray positions: Позиции вершин размером (m, 3).
+    :param numpy.ndarray triangles: Треугольники размером (n, 3).
+    :return numpy.ndarray: Квадрики вершин размером (m, 4, 4).
+    """
+    p0, p1, p2 = (positions[triangles[:, i]].astype('f8') for i in range(3))
+    normals = np.cross(p1 - p0, p2 - p0)
+    areas = np.linalg.norm(normals, axis=1)
+    normals /= np.maximum(areas, 1e-12)[:, None]
+    planes = np.column_stack([normals, -(normals * p0).sum(axis=1)])
+    face_quadrics = planes[:, :, None] * planes[:, None, :] * areas[:, None, None]
+
+    quadrics = np.zeros((len(positions), 4, 4))
+    for i in range(3):
+        np.add.at(quadrics, triangles[:, i], face_quadrics)
+    return quadrics
+
+
+class QuadricSimplifier:
+    """
+    Класс представляющий упрощение меша стягиванием ребер по квадрикам ошибки.
+    Стягивание выполняется в одну из вершин ребра (half-edge collapse), поэтому
+    новые вершины не появляются. Вершины границы (в том числе швов текстурных
+    координат) не перемещаются, стягивания, переворачивающие грани, отбрасываются.
+    """
+    def __init__(self, positions, triangles):
+        """
+        Метод инициализации упрощения.
+        :param numpy.ndarray positions: Позиции вершин размером (m, 3).
+        :param numpy.ndarray triangles: Треугольники размером (n, 3).
+        """
+        self.positions = positions.astype('f8')
+        self.triangles = triangles.tolist()
+        self.quadrics = get_face_quadrics(positions, triangles)
+        self.parent = list(range(len(positions)))
+        self.alive = [True] * len(self.triangles)
+        self.count = len(self.triangles)
+        self.version = [0] * len(positions)
+
+        self.faces = [set() for _ in positions]
+        edges = {}
+        for face, corners in enumerate(self.triangles):
+            for i in range(3):
+                self.faces[corners[i]].add(face)
+                edge = tuple(sorted((corners[i], corners[(i + 1) % 3])))
+                edges[edge] = edges.get(edge, 0) + 1
+        self.locked = [False] * len(positions)
+        for (a, b), count in edges.items():
+            if count == 1:
+                self.locked[a] = self.locked[b] = True
+
+        self.heap = []
+        for a, b in edges:
+            self.push(a, b)
+
+    def get_error(self, quadric, vertex):
+        """
+        Метод вычисления ошибки положения вершины для квадрики.
+        :param numpy.ndarray quadric: Квадрика размером (4, 4).
+        :param int vertex: Номер вершины.
+        :return float: Ошибка.
+        """
+        point = np.append(self.positions[vertex], 1.0)
+        return float(point @ quadric @ point)
+
+    def push(self, a, b):
+        """
+        Метод добавления в очередь лучшего стягивания ребра (a, b).
+        :param int a: Номер вершины.
+        :param int b: Номер вершины.
+        """
+        quadric = self.quadrics[a] + self.quadrics[b]
+        options = []
+        if not self.locked[a]:
+            options.append((self.get_error(quadric, b), a, b))
+        if not self.locked[b]:
+            options.append((self.get_error(quadric, a), b, a))
+        if options:
+            error, source, target = min(options)
+            heapq.heappush(self.heap, (error, source, target,
+                                       self.version[source], self.version[target]))
+
+    def find(self, vertex):
+        """
+        Метод поиска вершины, в которую стянута данная.
+        :param int vertex: Номер вершины.
+        :return int: Номер оставшейся вершины.
+        """
+        root = vertex
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[vertex] != root:
+            self.parent[vertex], vertex = root, self.parent[vertex]
+        return root
+
+    def get_normal(self, corners, source=None, target=None):
+        """
+        Метод вычисления нормали грани, в том числе после перемещения вершины.
+        :param list corners: Вершины грани.
+        :param int source: Перемещаемая вершина.
+        :param int target: Новое положение перемещаемой вершины.
+        :return numpy.ndarray: Ненормированная нормаль.
+        """
+        p0, p1, p2 = (self.positions[target if v == source else v] for v in corners)
+        return np.cross(p1 - p0, p2 - p0)
+
+    def can_collapse(self, source, target):
+        """
+        Метод проверки, что стягивание не переворачивает и не вырождает оставшиеся грани.
+        :param int source: Удаляемая вершина.
+        :param int target: Оставшаяся вершина.
+        :return bool: Можно ли стянуть ребро.
+        """
+        for face in self.faces[source]:
+            corners = self.triangles[face]
+            if target in corners:
+                continue
+            before = self.get_normal(corners)
+            after = self.get_normal(corners, source, target)
+            length = np.linalg.norm(before) * np.linalg.norm(after)
+            if length < 1e-20 or before @ after < MIN_NORMAL_DOT * length:
+                return False
+        return True
+
+    def collapse(self, source, target):
+        """
+        Метод стягивания вершины source в target.
+        :param int source: Удаляемая вершина.
+        :param int target: Оставшаяся вершина.
+        """
+        self.parent[source] = target
+        self.quadrics[target] += self.quadrics[source]
+        self.version[source] += 1
+        self.version[target] += 1
+
+        neighbours = set()
+        for face in list(self.faces[source]):
+            corners = self.triangles[face]
+            if target in corners:
+                self.alive[face] = False
+                self.count -= 1
+                for vertex in corners:
+                    self.faces[vertex].discard(face)
+            else:
+                corners[corners.index(source)] = target
+                self.faces[target].add(face)
+            neighbours.update(corners)
+        self.faces[source] = set()
+
+        # квадрики изменились только у ребер оставшейся вершины
+        neighbours.discard(source)
+        neighbours.discard(target)
+        for vertex in neighbours:
+            self.push(target, vertex)
+
+    def simplify(self, target_count):
+        """
+        Метод стягивания ребер с наименьшей ошибкой, пока число граней больше заданного.
+        Можно вызывать несколько раз с убывающим числом граней.
+        :param int target_count: Желаемое число граней.
+        """
+        while self.count > target_count and self.heap:
+            _, source, target, source_version, target_version = heapq.heappop(self.heap)
+            if (self.version[source] != source_version or self.version[target] != target_version
+                    or self.parent[source] != source or self.parent[target] != target):
+                continue
+            if self.can_collapse(source, target):
+                self.collapse(source, target)
+
+    def get_remap(self):
+        """
+        Метод получения отображения исходных вершин в оставшиеся.
+        :return numpy.ndarray: Номер оставшейся вершины для каждой исходной.
+        """
+        return np.array([self.find(vertex) for vertex in range(len(self.parent))])
+
+
+def get_lod_meshes(mesh, ratios=LOD_RATIOS):
+    """
+    Функция построения упрощенных уровней детализации индексированного меша.
+    Упрощение идет по вершинам со всеми атрибутами: швы текстурных координат
+    являются границей и не перемещаются, а стянутая вершина целиком заменяется
+    оставшейся, поэтому текстура не искажается.
+    :param ObjMesh mesh: Индексированный меш.
+    :param tuple ratios: Доли граней исходного меша для каждого уровня.
+    :return list: Индексированные меши уровней 1, 2, ...
+    """
+    vertex_data = np.asarray(mesh.vertex_data)
+    indices = np.asarray(mesh.index_data, dtype=np.int64).reshape(-1, 3)
+    simplifier = QuadricSimplifier(vertex_data[:, 5:8], indices)
+
+    # номер материала каждой грани
+    materials = np.zeros(len(indices), dtype=int)
+    for i, item in enumerate(mesh.ranges):
+        materials[item['first'] // 3:(item['first'] + item['count']) // 3] = i
+
+    meshes = []
+    for ratio in ratios:
+        simplifier.simplify(int(len(indices) * ratio))
+        corners = simplifier.get_remap()[indices]
+        alive = ((corners[:, 0] != corners[:, 1]) & (corners[:, 1] != corners[:, 2])
+                 & (corners[:, 0] != corners[:, 2]))
+
+        counts = np.bincount(materials[alive], minlength=len(mesh.ranges)) * 3
+        ranges = [{**item, 'first': int(first), 'count': int(count)}
+                  for item, first, count in zip(mesh.ranges, np.cumsum(counts) - counts, counts)]
+        lod = ObjMesh(vertex_data[corners[alive]].reshape(-1, 8).astype('f4'), ranges)
+        meshes.append(get_indexed_mesh(lod))
+    return meshes
+
+
+def get_lod_digest(path, ratios):
+    """
+    Функция вычисления хэша уровней детализации по содержимому файла и параметрам упрощения.
+    :param str path: Путь к файлу OBJ.
+    :param tuple ratios: Доли граней уровней.
+    :return str: Хэш SHA-1.
+    """
+    key = f'{get_file_hash(path)}:{LOD_VERSION}:{",".join(map(str, ratios))}'
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def load_lod(path, level, ratios=LOD_RATIOS, cache=True):
+    """
+    Функция загрузки уровня детализации меша из OBJ через бинарный кэш.
+    Уровень 0 - исходный меш. При отсутствии кэша все уровни строятся разом
+    и сохраняются рядом с кэшем меша, а без кэша - один раз на меш и хранятся в памяти.
+    :param str path: Путь к файлу OBJ.
+    :param int level: Уровень детализации.
+    :param tuple ratios: Доли граней уровней 1, 2, ...
+    :param bool cache: Использовать ли кэш.
+    :return ObjMesh: Индексированный меш уровня.
+    """
+    mesh = load_obj(path, cache)
+    if not level:
+        return mesh
+
+    digest = get_lod_digest(path, ratios)
+    if not cache:
+        with lod_lock:
+            if digest not in lod_meshes:
+                lod_meshes[digest] = get_lod_meshes(mesh, ratios)
+        return lod_meshes[digest][level - 1]
+
+    cache_path = get_cache_path(path, digest, f'lod{level}')
+    lod = read_cache(cache_path)
+    if lod is None:
+        # уровни разных VAO могут запрашиваться из нескольких потоков загрузчика
+        with lod_lock:
+            lod = read_cache(cache_path)
+            if lod is None:
+                for i, item in enumerate(get_lod_meshes(mesh, ratios), 1):
+                    write_cache(get_cache_path(path, digest, f'lod{i}'), item)
+                lod = read_cache(cache_path)
+    return lod
+
+
+def get_lod_name(name, level):
+    """
+    Функция получения имени ресурса (VBO, VAO) уровня детализации.
+    :param str name: Имя ресурса исходного меша.
+    :param int level: Уровень детализации.
+    :return str: Имя ресурса уровня.
+    """
+    return f'{name}_lod{level}' if level else name
+
+
+def get_screen_sizes(depths, radius, focal):
+    """
+    Функция оценки диаметра проекций ограничивающих сфер в пикселях.
+    :param numpy.ndarray depths: Расстояния от камеры до ближних точек сфер.
+    :param numpy.ndarray radius: Радиусы сфер.
+    :param float focal: Фокусное расстояние камеры в пикселях.
+    :return numpy.ndarray: Диаметры проекций.
+    """
+    return 2 * radius * focal / np.maximum(depths + radius, 1e-6)
+
+
+def get_lod_levels(sizes, thresholds=LOD_THRESHOLDS, bias=0.0):
+    """
+    Функция выбора уровней детализации по размеру объектов на экране.
+    :param numpy.ndarray sizes: Диаметры проекций ограничивающих сфер в пикселях.
+    :param tuple thresholds: Наименьший размер для уровней 0, 1, ... (по убыванию).
+    :param float bias: Смещение уровня: каждая единица вдвое уменьшает учитываемый размер.
+    :return numpy.ndarray: Уровни детализации.
+    """
+    sizes = np.asarray(sizes) * 2.0 ** -bias
+    return np.searchsorted(-np.asarray(thresholds, dtype='f4'), -sizes, side='left')
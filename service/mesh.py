@@ -1,5 +1,6 @@
 from service.vao import VAO
 from service.texture import Texture
+from service.assets import AssetLoader
 
 
 class Mesh:
@@ -14,12 +15,41 @@ class Mesh:
         :param GraphicsEngine app: Объект приложения.
         """
         self.app = app
-        self.vao = VAO(app.ctx)
-        self.texture = Texture(app)
+        self.loader = AssetLoader()
+        self.vao = VAO(app.ctx, self.loader, {'SHADOW_QUALITY': app.SHADOW_QUALITY})
+        self.texture = Texture(app, self.loader)
+
+    def request(self, vao_name=None, tex_id=None):
+        """
+        Метод запуска фоновой загрузки ресурсов модели без ожидания.
+        :param str vao_name: Имя VAO модели.
+        :param tex_id: Идентификатор текстуры модели.
+        """
+        if vao_name is not None:
+            self.vao.request(vao_name)
+        if tex_id is not None:
+            self.texture.textures.request(tex_id)
+
+    @property
+    def version(self):
+        """
+        Версия загруженных ресурсов: меняется, когда в видеопамять загружен новый меш
+        или текстура (например, готов уровень детализации, вместо которого рисовался другой).
+        :return int: Версия.
+        """
+        return self.vao.vbo.vbos.version + self.texture.textures.version
+
+    def poll(self):
+        """
+        Метод загрузки в видеопамять ресурсов, декодирование которых уже завершено.
+        """
+        self.vao.vbo.vbos.poll()
+        self.texture.textures.poll()
 
     def destroy(self):
         """
         Метод уничтожения объекта путем освобождения связанных ресурсов.
         """
+        self.loader.destroy()
         self.vao.destroy()
         self.texture.destroy()
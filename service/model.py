@@ -1,4 +1,5 @@
 import glm
+from service.culling import get_world_spheres
 
 
 class BaseModel:
@@ -17,112 +18,248 @@ class BaseModel:
         :param scale: Масштаб модели по осям (x, y, z).
         """
         self.app = app
-        self.pos = pos
         self.vao_name = vao_name
-        self.rot = glm.vec3(*map(glm.radians, rot))
-        self.scale = scale
-        self.m_model = self.get_model_matrix()
+        self.transforms = app.transforms
+        self.transform = app.transforms.add(pos, tuple(map(glm.radians, rot)), scale, owner=self)
         self.tex_id = tex_id
-        self.vao = app.mesh.vao.vaos[vao_name]
-        self.program = self.vao.program
+        # текстуры, которые может заменить текстурный массив, запрашиваются при сборке групп
+        app.mesh.request(vao_name, None if tex_id in app.mesh.texture.array_ids else tex_id)
+        self.lod_names = app.mesh.vao.get_lod_names(vao_name)
         self.camera = self.app.camera
-        self.texture = None
-        self.shadow_vao = None
-        self.shadow_program = None
+        self.state = self.app.render_state
         self.depth_texture = None
+        # формы программы задаются при первой отрисовке, когда меш уже загружен
+        self.initialized = False
 
-    def get_model_matrix(self, z=(0, 0, 1), y=(0, 1, 0), x=(1, 0, 0)):
+    @property
+    def vao(self):
         """
-        Метод получения идентификационной матрицы в качестве матрицы модели.
-        :param z: Направление оси Z модели.
-        :param y: Направление оси Y модели.
-        :param x: Направление оси X модели.
-        :return glm.mat4: Идентификационная матрица.
+        VAO модели. Меш загружается при первом обращении (обычно при первой отрисовке),
+        разбор запускается заранее при создании модели.
+        :return moderngl.VertexArray: VAO.
         """
-        m_model = glm.mat4()
-        m_model = glm.translate(m_model, self.pos)
-        m_model = glm.rotate(m_model, self.rot.z, glm.vec3(z))
-        m_model = glm.rotate(m_model, self.rot.y, glm.vec3(y))
-        m_model = glm.rotate(m_model, self.rot.x, glm.vec3(x))
-        m_model = glm.scale(m_model, self.scale)
-        return m_model
+        return self.app.mesh.vao.vaos[self.vao_name]
+
+    @property
+    def program(self):
+        """
+        Шейдерная программа VAO модели.
+        :return moderngl.Program: Программа.
+        """
+        return self.vao.program
+
+    @property
+    def pos(self):
+        """
+        Позиция модели (x, y, z) из хранилища преобразований.
+        :return glm.vec3: Позиция.
+        """
+        return glm.vec3(*self.transforms.position[self.transform].tolist())
+
+    @property
+    def rot(self):
+        """
+        Углы поворота модели по осям (x, y, z) в радианах из хранилища преобразований.
+        :return glm.vec3: Углы поворота.
+        """
+        return glm.vec3(*self.transforms.rotation[self.transform].tolist())
+
+    @property
+    def scale(self):
+        """
+        Масштаб модели по осям (x, y, z) из хранилища преобразований.
+        :return glm.vec3: Масштаб.
+        """
+        return glm.vec3(*self.transforms.scale[self.transform].tolist())
+
+    @property
+    def m_model(self):
+        """
+        Мировая матрица модели. Устаревшие матрицы хранилища пересчитываются
+        все разом при первом обращении.
+        :return glm.mat4: Матрица модели.
+        """
+        return self.transforms.get_matrix(self.transform)
+
+    @property
+    def m_normal(self):
+        """
+        Матрица нормалей модели (обратная транспонированная к матрице модели),
+        вычисленная в хранилище преобразований вместе с матрицей модели.
+        :return glm.mat3: Матрица нормалей.
+        """
+        return self.transforms.get_normal_matrix(self.transform)
+
+    def set_transform(self, pos=None, rot=None, scale=None):
+        """
+        Метод изменения положения, поворота или масштаба модели.
+        Матрица пересчитывается в хранилище преобразований вместе с остальными
+        измененными объектами, а сцена учитывает перемещение в начале кадра.
+        :param pos: Позиция модели (x, y, z).
+        :param rot: Углы поворота модели по осям (x, y, z) в градусах.
+        :param scale: Масштаб модели по осям (x, y, z).
+        """
+        if rot is not None:
+            rot = tuple(map(glm.radians, rot))
+        self.transforms.set(self.transform, pos, rot, scale)
+
+    def set_parent(self, parent=None):
+        """
+        Метод прикрепления модели к другой модели: ее положение, поворот
+        и масштаб становятся локальными относительно родителя.
+        :param BaseModel parent: Родительская модель или None, чтобы открепить модель.
+        """
+        self.transforms.set_parent(self.transform, -1 if parent is None else parent.transform)
+
+    @property
+    def texture(self):
+        """
+        Текстура модели. Загружается при первом обращении, декодирование
+        запускается заранее при создании модели или при сборке групп отрисовки.
+        :return: Текстура moderngl.
+        """
+        return self.app.mesh.texture.textures[self.tex_id]
+
+    def get_bounding_sphere(self):
+        """
+        Метод получения ограничивающей сферы модели в мировых координатах.
+        :return numpy.ndarray: Сфера (x, y, z, радиус).
+        """
+        bounds = self.app.mesh.vao.vbo.vbos[self.vao_name].bounds
+        matrix = self.transforms.get_matrices([self.transform])
+        return get_world_spheres(matrix, bounds)[0]
+
+    def get_lod_vao(self, level, kind=None):
+        """
+        Метод получения VAO уровня детализации.
+        Меш уровня загружается при первом выборе, а пока он загружается,
+        берется ближайший более детальный готовый уровень.
+        :param int level: Желаемый уровень детализации.
+        :param str kind: Проход ('shadow', 'depth') или None для основного.
+        :return moderngl.VertexArray: VAO уровня.
+        """
+        vao = self.app.mesh.vao
+        prefix = f'{kind}_' if kind else ''
+        level = vao.get_ready_level(self.lod_names, level)
+        return vao.vaos[prefix + self.lod_names[level]]
 
     def update(self): ...
 
-    def render(self):
+    def on_init(self): ...
+
+    def render(self, vao=None):
         """
         Метод визуализации модели.
         Обновление ее атрибутов и отрисовки связанный с ней объект массива вершин.
+        :param moderngl.VertexArray vao: VAO уровня детализации (по умолчанию - исходный).
         """
+        if not self.initialized:
+            self.on_init()
+            self.initialized = True
         self.update()
-        self.vao.render()
+        vao = vao or self.vao
+        vao.extra.use(self.state, vao.program)
+        vao.render()
+
+    def submit(self, queue, layer='opaque', depth=0.0, level=0):
+        """
+        Метод добавления пакета отрисовки модели в очередь.
+        :param RenderQueue queue: Очередь отрисовки.
+        :param str layer: Слой очереди.
+        :param float depth: Расстояние до камеры.
+        :param int level: Уровень детализации.
+        """
+        vao = self.get_lod_vao(level)
+        queue.submit(layer, self.program, self.texture, vao, depth, lambda: self.render(vao))
 
 
 class ExtendedBaseModel(BaseModel):
     """
     Класс представляющий наследуемую функциональность для создания и визуализации моделей.
     """
-    def __init__(self, app, vao_name, tex_id, pos, rot, scale):
-        super().__init__(app, vao_name, tex_id, pos, rot, scale)
+    @property
+    def shadow_vao(self):
+        """
+        VAO модели для прохода теней.
+        :return moderngl.VertexArray: VAO.
+        """
+        return self.app.mesh.vao.vaos['shadow_' + self.vao_name]
 
-        self.on_init()
+    @property
+    def shadow_program(self):
+        """
+        Шейдерная программа прохода теней.
+        :return moderngl.Program: Программа.
+        """
+        return self.shadow_vao.program
 
     def update(self):
         """
         Метод обновляет данные в шейдере перед его использованием для рендеринга.
+        Данные камеры и света передаются через блок форм кадра (FrameUniforms).
         """
-        self.texture.use(location=0)
-        self.program['camPos'].write(self.camera.position)
-        self.program['m_view'].write(self.camera.m_view)
-        self.program['m_model'].write(self.m_model)
+        self.state.use_texture(self.texture, location=0)
+        self.state.write(self.program, 'm_model', self.m_model)
+        self.state.write(self.program, 'm_normal', self.m_normal)
 
     def update_shadow(self):
         """
         Обновление данных для рендеринга теней.
         """
-        self.shadow_program['m_model'].write(self.m_model)
+        self.state.write(self.shadow_program, 'm_model', self.m_model)
 
-    def render_shadow(self):
+    def render_shadow(self, vao=None):
         """
         Рендеринг модели для теней.
+        :param moderngl.VertexArray vao: VAO уровня детализации (по умолчанию - исходный).
         """
         self.update_shadow()
-        self.shadow_vao.render()
+        vao = vao or self.shadow_vao
+        vao.extra.use(self.state, vao.program)
+        vao.render()
+
+    def submit_shadow(self, queue, level=0):
+        """
+        Метод добавления пакета отрисовки модели для теней в очередь.
+        :param RenderQueue queue: Очередь отрисовки.
+        :param int level: Уровень детализации.
+        """
+        vao = self.get_lod_vao(level, kind='shadow')
+        queue.submit('shadow', self.shadow_program, None, vao, 0.0, lambda: self.render_shadow(vao))
+
+    def render_depth(self, vao):
+        """
+        Рендеринг глубины модели в предварительном проходе.
+        :param moderngl.VertexArray vao: VAO прохода глубины нужного уровня детализации.
+        """
+        self.state.write(vao.program, 'm_model', self.m_model)
+        vao.extra.use(self.state, vao.program)
+        vao.render()
+
+    def submit_depth(self, queue, depth=0.0, level=0):
+        """
+        Метод добавления пакета предварительного прохода глубины в очередь.
+        Уровень детализации должен совпадать с основным проходом, иначе глубины разойдутся.
+        :param RenderQueue queue: Очередь отрисовки.
+        :param float depth: Расстояние до камеры.
+        :param int level: Уровень детализации.
+        """
+        vao = self.get_lod_vao(level, kind='depth')
+        queue.submit('depth', vao.program, None, vao, depth, lambda: self.render_depth(vao))
 
     def on_init(self):
         """
         Метод для установки начальных значений для форм и матриц шейдеров.
         """
-        self.program['m_view_light'].write(self.app.light.m_view_light)
-        self.program['u_resolution'].write(glm.vec2(self.app.WIN_SIZE))
+        state = self.state
 
         # depth texture
         self.depth_texture = self.app.mesh.texture.textures['depth_texture']
-        self.program['shadowMap'] = 1
-        self.depth_texture.use(location=1)
-
-        # shadow
-        self.shadow_vao = self.app.mesh.vao.vaos['shadow_' + self.vao_name]
-        self.shadow_program = self.shadow_vao.program
-        self.shadow_program['m_proj'].write(self.camera.m_proj)
-        self.shadow_program['m_view_light'].write(self.app.light.m_view_light)
-        self.shadow_program['m_model'].write(self.m_model)
+        state.write(self.program, 'shadowMap', 1)
+        state.use_texture(self.depth_texture, location=1)
 
         # texture
-        self.texture = self.app.mesh.texture.textures[self.tex_id]
-        self.program['u_texture_0'] = 0
-        self.texture.use(location=0)
-
-        # mvp
-        self.program['m_proj'].write(self.camera.m_proj)
-        self.program['m_view'].write(self.camera.m_view)
-        self.program['m_model'].write(self.m_model)
-
-        # light
-        self.program['light.position'].write(self.app.light.position)
-        self.program['light.Ia'].write(self.app.light.Ia)
-        self.program['light.Id'].write(self.app.light.Id)
-        self.program['light.Is'].write(self.app.light.Is)
+        state.write(self.program, 'u_texture_0', 0)
 
 
 class Cube(ExtendedBaseModel):
@@ -141,16 +278,14 @@ class SkyBox(BaseModel):
     def __init__(self, app, vao_name='skybox', tex_id='skybox',
                  pos=(0, 0, 0), rot=(0, 0, 0), scale=(1, 1, 1)):
         super().__init__(app, vao_name, tex_id, pos, rot, scale)
-        self.on_init()
 
     def update(self):
         m_view = glm.mat4(self.camera.m_view)
-        self.program['m_invProjView'].write(glm.inverse(self.camera.m_proj * m_view))
+        self.state.use_texture(self.texture, location=0)
+        self.state.write(self.program, 'm_invProjView', glm.inverse(self.camera.m_proj * m_view))
 
     def on_init(self):
-        self.texture = self.app.mesh.texture.textures[self.tex_id]
-        self.program['u_texture_skybox'] = 0
-        self.texture.use(location=0)
+        self.state.write(self.program, 'u_texture_skybox', 0)
 
 
 class OtherModel(ExtendedBaseModel):
@@ -0,0 +1,193 @@
+import time
+import glm
+import numpy as np
+from collections import deque
+
+
+class OcclusionCuller:
+    """
+    Класс представляющий отсечение перекрытых объектов аппаратными запросами (occlusion query).
+    После основного прохода для каждого объекта или кластера набора сфер рисуется
+    ограничивающий куб без вывода цвета и глубины, а запрос считает фрагменты,
+    прошедшие тест глубины. Результаты читаются с задержкой в latency кадров,
+    поэтому процессор не ждет видеокарту: пока результата нет или он устарел,
+    объект считается видимым, иначе решение берется из последнего прочитанного запроса.
+    Чтение query.samples блокирует поток, пока видеокарта не закончит кадр запроса:
+    при latency=1 это кадр, отправленный только что, и каждый кадр ждет видеокарту.
+    Задержка в 2-3 кадра, как у профилировщика, обычно снимает ожидание, но драйвер
+    может отставать и сильнее (например, при вертикальной синхронизации с глубокой
+    очередью кадров), и тогда чтение по-прежнему останавливает поток.
+    """
+    def __init__(self, ctx, enabled=True, groups=True, latency=3, min_samples=1):
+        """
+        Метод инициализации объекта отсечения.
+        :param moderngl.Context ctx: Контекст moderngl.
+        :param bool enabled: Включено ли отсечение.
+        :param bool groups: Проверять кластеры набора сфер вместо отдельных объектов.
+        :param int latency: Через сколько кадров читаются результаты запросов
+                            (1 - в следующем кадре, с ожиданием видеокарты).
+        :param int min_samples: Наименьшее число фрагментов видимого куба.
+        """
+        self.ctx = ctx
+        self.enabled = enabled
+        self.groups = groups
+        self.latency = latency
+        self.min_samples = min_samples
+        self.pool = []
+        self.current = []
+        self.pending = deque()
+        # имя набора -> состояние его проверяемых частей
+        self.sets = {}
+        self.frame = 0
+        self.stats = self.get_empty_stats()
+        self.frame_stats = self.get_empty_stats()
+
+    @staticmethod
+    def get_empty_stats():
+        """
+        Метод создания обнуленных счетчиков.
+        :return dict: Счетчики видимых и перекрытых объектов, запросов и времени (мс).
+        """
+        return {'visible': 0, 'occluded': 0, 'queries': 0, 'time': 0.0}
+
+    def get_query(self):
+        """
+        Метод получения свободного запроса из пула.
+        :return moderngl.Query: Запрос числа фрагментов.
+        """
+        if self.pool:
+            return self.pool.pop()
+        return self.ctx.query(samples=True)
+
+    def get_units(self, sphere_set):
+        """
+        Метод получения проверяемых частей набора: кластеров или отдельных сфер.
+        :param SphereSet sphere_set: Набор ограничивающих сфер.
+        :return tuple: Центры размером (n, 3) и радиусы размером (n,).
+        """
+        if self.groups:
+            return sphere_set.cluster_points[:3].T, sphere_set.cluster_radius
+        count = sphere_set.count
+        return sphere_set.points[:3, :count].T, sphere_set.radius[:count]
+
+    def get_entry(self, name, sphere_set):
+        """
+        Метод получения состояния набора; при пересборке набора оно сбрасывается.
+        :param str name: Имя набора (группы инстансинга).
+        :param SphereSet sphere_set: Набор ограничивающих сфер.
+        :return dict: Видимость частей, кадр их последнего результата и части для проверки.
+        """
+        entry = self.sets.get(name)
+        if entry is None or entry['set'] is not sphere_set:
+            count = len(self.get_units(sphere_set)[1])
+            entry = self.sets[name] = {
+                'set': sphere_set,
+                'visible': np.ones(count, dtype=bool),
+                'frame': np.full(count, -1 - self.latency, dtype=int),
+                'test': np.zeros(0, dtype=int),
+                'used': self.frame
+            }
+        return entry
+
+    def cull(self, name, sphere_set, mask=None):
+        """
+        Метод отсечения перекрытых объектов набора по результатам прошлых кадров.
+        Части внутри пирамиды видимости запоминаются для проверки в текущем кадре.
+        :param str name: Имя набора (группы инстансинга).
+        :param SphereSet sphere_set: Набор ограничивающих сфер.
+        :param numpy.ndarray mask: Маска видимости по пирамиде или None.
+        :return numpy.ndarray: Маска видимости или None, если отсечение выключено.
+        """
+        if not self.enabled:
+            return mask
+
+        entry = self.get_entry(name, sphere_set)
+        stale = self.frame - entry['frame'] > self.latency + 1
+        visible = entry['visible'] | stale
+        inside = np.ones(sphere_set.count, dtype=bool) if mask is None else mask
+        if self.groups:
+            size = sphere_set.cluster_size
+            visible = np.repeat(visible, size)[:sphere_set.count]
+            padded = np.zeros(len(entry['visible']) * size, dtype=bool)
+            padded[:sphere_set.count] = inside
+            entry['test'] = np.flatnonzero(padded.reshape(-1, size).any(axis=1))
+        else:
+            entry['test'] = np.flatnonzero(inside)
+        entry['used'] = self.frame
+
+        result = inside & visible
+        visible_count = int(np.count_nonzero(result))
+        self.stats['visible'] += visible_count
+        self.stats['occluded'] += int(np.count_nonzero(inside)) - visible_count
+        return result
+
+    def render(self, state, vao, eye, near):
+        """
+        Метод отправки запросов для ограничивающих кубов частей, проверяемых в этом кадре.
+        Вывод цвета и запись глубины должны быть выключены.
+        :param RenderState state: Кэш состояния OpenGL.
+        :param moderngl.VertexArray vao: VAO куба [-1, 1] с программой прохода глубины.
+        :param glm.vec3 eye: Положение камеры.
+        :param float near: Ближняя плоскость отсечения камеры.
+        """
+        if not self.enabled:
+            return
+        start = time.perf_counter()
+        program = vao.program
+        vao.extra.use(state, program)
+        eye = np.array(eye, dtype='f4')
+        for name, entry in self.sets.items():
+            if entry['used'] != self.frame or not len(entry['test']):
+                continue
+            centers, radius = self.get_units(entry['set'])
+            index = entry['test']
+            # куб, пересекающий ближнюю плоскость, может не дать фрагментов: он видим
+            near_eye = (np.abs(centers[index] - eye).max(axis=1)
+                        <= radius[index] + near * np.sqrt(3))
+            entry['visible'][index[near_eye]] = True
+            entry['frame'][index[near_eye]] = self.frame
+            for i in index[~near_eye]:
+                (x, y, z), r = centers[i], float(radius[i])
+                m_model = glm.mat4(r, 0, 0, 0, 0, r, 0, 0, 0, 0, r, 0, x, y, z, 1)
+                state.write(program, 'm_model', m_model)
+                query = self.get_query()
+                with query:
+                    vao.render()
+                self.current.append((name, entry['set'], i, self.frame, query))
+        self.stats['queries'] += len(self.current)
+        self.stats['time'] += (time.perf_counter() - start) * 1000
+
+    def read(self, records):
+        """
+        Метод чтения результатов запросов одного кадра.
+        :param list records: Запросы кадра (имя набора, набор, часть, кадр, запрос).
+        """
+        for name, sphere_set, index, frame, query in records:
+            entry = self.sets.get(name)
+            if entry is not None and entry['set'] is sphere_set:
+                entry['visible'][index] = query.samples >= self.min_samples
+                entry['frame'][index] = frame
+            self.pool.append(query)
+
+    def begin_frame(self):
+        """
+        Метод начала нового кадра: откладывает запросы прошлого кадра, читает
+        результаты кадров, отправленных latency кадров назад, и сохраняет счетчики.
+        """
+        self.frame += 1
+        if self.current:
+            self.pending.append(self.current)
+            self.current = []
+        while len(self.pending) > self.latency - 1:
+            self.read(self.pending.popleft())
+        self.frame_stats = self.stats
+        self.stats = self.get_empty_stats()
+
+    def destroy(self):
+        """
+        Метод уничтожения объекта. Запросы moderngl освобождаются вместе с контекстом.
+        """
+        self.current = []
+        self.pending.clear()
+        self.pool = []
+        self.sets = {}
@@ -0,0 +1,103 @@
+import glm
+import numpy as np
+import pygame as pg
+import moderngl as mgl
+
+
+class ProfilerOverlay:
+    """
+    Класс представляющий вывод статистики профилировщика поверх кадра.
+    Текст рисуется шрифтом pygame в текстуру, которая обновляется
+    раз в несколько кадров и выводится прямоугольником в углу экрана.
+    """
+    def __init__(self, app, profiler, interval=15, position=(8, 8), font_size=16):
+        """
+        Метод инициализации вывода статистики.
+        :param GraphicsEngine app: Объект приложения.
+        :param Profiler profiler: Профилировщик.
+        :param int interval: Через сколько кадров обновлять текст.
+        :param tuple position: Положение левого верхнего угла в пикселях.
+        :param int font_size: Размер шрифта.
+        """
+        self.app = app
+        self.ctx = app.ctx
+        self.profiler = profiler
+        self.interval = interval
+        self.position = position
+        self.state = app.render_state
+        pg.font.init()
+        self.font = pg.font.Font(None, font_size)
+
+        self.program = app.mesh.vao.program.programs['overlay']
+        quad = np.array([0, 0, 1, 0, 1, 1, 0, 0, 1, 1, 0, 1], dtype='f4')
+        self.vbo = self.ctx.buffer(quad)
+        self.vao = self.ctx.vertex_array(self.program, [(self.vbo, '2f', 'in_position')])
+        self.texture = None
+        self.frame = 0
+
+    def get_surface(self):
+        """
+        Метод отрисовки таблицы статистики в поверхность pygame.
+        :return pygame.Surface: Текст на полупрозрачном фоне.
+        """
+        stats = self.profiler.get_stats()
+        lines = [f'{"":<22}{"cpu":>7}{"gpu":>7}']
+        lines += [f'{name[:22]:<22}{entry["cpu_ms"]:>7.2f}{entry["gpu_ms"]:>7.2f}'
+                  for name, entry in sorted(stats.items())]
+        images = [self.font.render(line, True, (255, 255, 255)) for line in lines]
+        width = max(image.get_width() for image in images) + 8
+        height = sum(image.get_height() for image in images) + 8
+
+        surface = pg.Surface((width, height), pg.SRCALPHA)
+        surface.fill((0, 0, 0, 160))
+        y = 4
+        for image in images:
+            surface.blit(image, (4, y))
+            y += image.get_height()
+        return surface
+
+    def update(self):
+        """
+        Метод обновления текстуры с текстом раз в interval кадров.
+        """
+        self.frame += 1
+        if self.texture is not None and self.frame % self.interval:
+            return
+        surface = self.get_surface()
+        data = pg.image.tostring(surface, 'RGBA')
+        if self.texture is not None and self.texture.size == surface.get_size():
+            self.texture.write(data)
+            return
+        if self.texture is not None:
+            # имя удаленной текстуры может достаться новой, поэтому кэш привязок сбрасывается
+            self.texture.release()
+            self.state.invalidate()
+        self.texture = self.ctx.texture(surface.get_size(), 4, data)
+
+    def render(self):
+        """
+        Метод вывода статистики поверх кадра.
+        """
+        self.update()
+        win_width, win_height = self.app.WIN_SIZE
+        width, height = self.texture.size
+        x, y = self.position
+        rect = glm.vec4(-1 + 2 * x / win_width, 1 - 2 * (y + height) / win_height,
+                        2 * width / win_width, 2 * height / win_height)
+
+        self.state.write(self.program, 'u_rect', rect)
+        self.state.write(self.program, 'u_texture_0', 0)
+        self.state.use_texture(self.texture, location=0)
+        self.ctx.disable(mgl.DEPTH_TEST)
+        self.ctx.enable(mgl.BLEND)
+        self.vao.render()
+        self.ctx.disable(mgl.BLEND)
+        self.ctx.enable(mgl.DEPTH_TEST)
+
+    def destroy(self):
+        """
+        Метод уничтожения объекта путем освобождения связанных ресурсов.
+        """
+        for resource in (self.vao, self.vbo, self.texture):
+            if resource is not None:
+                resource.release()
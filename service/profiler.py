@@ -0,0 +1,214 @@
+import time
+from collections import deque
+
+
+class Section:
+    """
+    Класс представляющий замер одного участка кадра (прохода или группы отрисовки).
+    Время процессора замеряется сразу, а запрос к видеокарте читается позже.
+    Запрос прохода приостанавливается на время замера вложенной группы
+    и возобновляется новым запросом после нее.
+    """
+    def __init__(self, profiler, name, group=False):
+        """
+        Метод инициализации замера.
+        :param Profiler profiler: Профилировщик.
+        :param str name: Имя участка.
+        :param bool group: Является ли участок группой отрисовки внутри прохода.
+        """
+        self.profiler = profiler
+        self.name = name
+        self.group = group
+        self.query = None
+        self.parent = None
+        self.start = 0.0
+
+    def begin_query(self):
+        """
+        Метод запуска запроса к видеокарте.
+        """
+        self.query = self.profiler.get_query()
+        self.query.__enter__()
+
+    def end_query(self):
+        """
+        Метод остановки запроса к видеокарте и записи его в замеры кадра.
+        """
+        if self.query is not None:
+            self.query.__exit__(None, None, None)
+            self.profiler.current.append((self.name, 0.0, self.query))
+            self.query = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        if self.group:
+            self.parent = self.profiler.active
+            if self.parent is not None:
+                self.parent.end_query()
+        else:
+            self.profiler.active = self
+        self.begin_query()
+        return self
+
+    def __exit__(self, *args):
+        self.end_query()
+        if self.group:
+            if self.parent is not None:
+                self.parent.begin_query()
+        else:
+            self.profiler.active = None
+        cpu = (time.perf_counter() - self.start) * 1000
+        self.profiler.current.append((self.name, cpu, None))
+
+
+class NullSection:
+    """
+    Класс представляющий пустой замер, когда профилирование выключено.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+NULL_SECTION = NullSection()
+
+
+class Profiler:
+    """
+    Класс представляющий профилировщик кадра по проходам рендеринга.
+    Для каждого участка замеряется время процессора на отправку команд
+    и, через запросы moderngl (Query), время видеокарты, число прошедших
+    тест глубины фрагментов и число примитивов.
+    Результаты запросов читаются с задержкой в несколько кадров, когда
+    видеокарта их уже посчитала, поэтому профилировщик не останавливает конвейер.
+    Запросы одного типа в OpenGL не могут быть вложенными, поэтому при замере
+    групп отрисовки запрос прохода прерывается на время каждой группы,
+    а данные видеокарты для прохода складываются из его частей и его групп.
+    """
+    def __init__(self, ctx, enabled=True, groups=False, window=120, latency=3):
+        """
+        Метод инициализации профилировщика.
+        :param moderngl.Context ctx: Контекст moderngl.
+        :param bool enabled: Включено ли профилирование.
+        :param bool groups: Замерять ли отдельные группы отрисовки внутри проходов.
+        :param int window: Число кадров в скользящем окне статистики.
+        :param int latency: Через сколько кадров читаются результаты запросов.
+        """
+        self.ctx = ctx
+        self.enabled = enabled
+        self.groups = groups
+        self.latency = latency
+        self.window = window
+        self.pool = []
+        self.current = []
+        self.active = None
+        self.pending = deque()
+        self.history = {}
+        self.frames = 0
+
+    def get_query(self):
+        """
+        Метод получения свободного запроса из пула.
+        :return moderngl.Query: Запрос времени, фрагментов и примитивов.
+        """
+        if self.pool:
+            return self.pool.pop()
+        return self.ctx.query(samples=True, time=True, primitives=True)
+
+    def section(self, name, group=False):
+        """
+        Метод создания замера участка кадра (используется в with).
+        :param str name: Имя участка; имя группы начинается с имени прохода и '/'.
+        :param bool group: Является ли участок группой отрисовки внутри прохода.
+        :return Section: Замер участка.
+        """
+        if not self.enabled or (group and not self.groups):
+            return NULL_SECTION
+        return Section(self, name, group)
+
+    def begin_frame(self):
+        """
+        Метод начала нового кадра: откладывает замеры прошлого кадра
+        и читает результаты кадров, отправленных latency кадров назад.
+        """
+        if not self.enabled:
+            return
+        if self.current:
+            self.pending.append(self.current)
+            self.current = []
+        while len(self.pending) > self.latency:
+            self.read_frame(self.pending.popleft())
+
+    def read_frame(self, records):
+        """
+        Метод чтения результатов запросов одного кадра в историю.
+        :param list records: Замеры кадра (имя, время процессора, запрос или None).
+        """
+        frame = {}
+        for name, cpu, query in records:
+            entry = frame.setdefault(name, {'cpu': 0.0, 'gpu': 0.0, 'samples': 0, 'primitives': 0})
+            entry['cpu'] += cpu
+            if query is not None:
+                entry['gpu'] += query.elapsed / 1e6
+                entry['samples'] += query.samples
+                entry['primitives'] += query.primitives
+                self.pool.append(query)
+
+        # данные видеокарты групп складываются в данные прохода
+        if self.groups:
+            for name, entry in list(frame.items()):
+                if '/' in name:
+                    parent = frame.setdefault(name.split('/')[0], {'cpu': 0.0, 'gpu': 0.0,
+                                                                 'samples': 0, 'primitives': 0})
+                    for key in ('gpu', 'samples', 'primitives'):
+                        parent[key] += entry[key]
+
+        frame['frame'] = {key: sum(entry[key] for name, entry in frame.items() if '/' not in name)
+                          for key in ('cpu', 'gpu', 'samples', 'primitives')}
+        # участки, не встретившиеся в кадре (пропущенный проход), учитываются нулями
+        for name in self.history.keys() - frame.keys():
+            frame[name] = {'cpu': 0.0, 'gpu': 0.0, 'samples': 0, 'primitives': 0}
+        for name, entry in frame.items():
+            self.history.setdefault(name, deque(maxlen=self.window)).append(entry)
+        self.frames += 1
+
+    def get_stats(self):
+        """
+        Метод получения статистики по скользящему окну.
+        :return dict: Имя участка -> среднее и наибольшее время процессора и видеокарты (мс),
+                      среднее число фрагментов и примитивов.
+        """
+        stats = {}
+        for name, entries in self.history.items():
+            count = len(entries)
+            stats[name] = {
+                'cpu_ms': sum(entry['cpu'] for entry in entries) / count,
+                'cpu_max_ms': max(entry['cpu'] for entry in entries),
+                'gpu_ms': sum(entry['gpu'] for entry in entries) / count,
+                'gpu_max_ms': max(entry['gpu'] for entry in entries),
+                'samples': sum(entry['samples'] for entry in entries) / count,
+                'primitives': sum(entry['primitives'] for entry in entries) / count
+            }
+        return stats
+
+    def get_report(self):
+        """
+        Метод форматирования статистики в таблицу.
+        :return str: Таблица по участкам кадра.
+        """
+        lines = [f'{"section":<24}{"cpu ms":>9}{"gpu ms":>9}{"gpu max":>9}{"samples":>11}{"prims":>9}']
+        for name, entry in sorted(self.get_stats().items()):
+            lines.append(f'{name:<24}{entry["cpu_ms"]:>9.2f}{entry["gpu_ms"]:>9.2f}'
+                         f'{entry["gpu_max_ms"]:>9.2f}{entry["samples"]:>11.0f}'
+                         f'{entry["primitives"]:>9.0f}')
+        return '\n'.join(lines)
+
+    def destroy(self):
+        """
+        Метод уничтожения объекта. Запросы moderngl освобождаются вместе с контекстом.
+        """
+        self.current = []
+        self.pending.clear()
+        self.pool = []
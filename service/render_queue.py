@@ -0,0 +1,175 @@
+import numpy as np
+
+# слои очереди в порядке отрисовки
+LAYERS = {'shadow': 0, 'depth': 1, 'opaque': 2, 'sky': 3}
+
+# поля ключа сортировки от старших бит к младшим: (имя, число бит)
+KEY_FIELDS = (('layer', 4), ('program', 8), ('texture', 12), ('vao', 12), ('depth', 28))
+FIELD_BITS = dict(KEY_FIELDS)
+
+
+def radix_sort(keys, digit_bits=16):
+    """
+    Функция поразрядной сортировки 64-битных ключей (LSD radix sort).
+    Разряды обрабатываются от младшего к старшему устойчивой сортировкой
+    16-битных цифр (для таких типов numpy использует сортировку подсчетом);
+    разряды, одинаковые у всех ключей, пропускаются.
+    :param numpy.ndarray keys: Ключи типа uint64.
+    :param int digit_bits: Число бит в разряде.
+    :return numpy.ndarray: Перестановка индексов по возрастанию ключей.
+    """
+    order = np.arange(len(keys))
+    mask = np.uint64((1 << digit_bits) - 1)
+    for shift in range(0, 64, digit_bits):
+        digits = ((keys >> np.uint64(shift)) & mask).astype(np.uint16)
+        if not len(digits) or digits.min() == digits.max():
+            continue
+        order = order[np.argsort(digits[order], kind='stable')]
+    return order
+
+
+class RenderQueue:
+    """
+    Класс представляющий очередь отрисовки с сортировкой по состоянию.
+    Модели и группы инстансинга добавляют в очередь пакеты отрисовки
+    (слой, программа, текстура, VAO, глубина), из которых собирается
+    64-битный ключ сортировки. Пакеты одного слоя рисуются подряд
+    с минимальным числом смен программы, текстуры и VAO, а при равном
+    состоянии - от ближних к дальним, чтобы ранний тест глубины
+    отбрасывал перекрытые фрагменты.
+    """
+    def __init__(self, far=100.0, profiler=None):
+        """
+        Метод инициализации очереди отрисовки.
+        :param float far: Глубина, на которую рассчитано квантование ключа.
+        :param Profiler profiler: Профилировщик для замера именованных пакетов.
+        """
+        self.far = far
+        self.profiler = profiler
+        # glo ресурса -> номер в ключе; номера раздаются заново в каждом проходе
+        self.ids = {'program': {}, 'texture': {}, 'vao': {}}
+        self.keys = []
+        self.packets = []
+        self.order = []
+        self.stats = self.get_empty_stats()
+        self.frame_stats = self.get_empty_stats()
+
+    @staticmethod
+    def get_empty_stats():
+        """
+        Метод создания обнуленных счетчиков.
+        :return dict: Счетчики пакетов и смен состояния.
+        """
+        return {
+            'packets': 0,
+            'program_changes': 0,
+            'texture_changes': 0,
+            'vao_changes': 0,
+            'state_changes': 0
+        }
+
+    def get_id(self, kind, resource):
+        """
+        Метод получения короткого номера ресурса для ключа сортировки.
+        Номера раздаются по порядку в пределах прохода и сбрасываются в clear,
+        поэтому освобожденный и заново созданный ресурс с тем же glo не получает
+        чужой номер. Если ресурсов в проходе больше, чем вмещает поле ключа,
+        лишние получают последний номер: сортировка по ним только хуже группирует
+        пакеты, но не смешивается с соседними полями.
+        :param str kind: Вид ресурса ('program', 'texture', 'vao').
+        :param resource: Ресурс moderngl или None.
+        :return int: Номер ресурса (0 - нет ресурса).
+        """
+        if resource is None:
+            return 0
+        ids = self.ids[kind]
+        return min(ids.setdefault(resource.glo, len(ids) + 1), (1 << FIELD_BITS[kind]) - 1)
+
+    def get_key(self, layer, program, texture, vao, depth):
+        """
+        Метод сборки ключа сортировки пакета.
+        :param str layer: Слой ('shadow', 'depth', 'opaque', 'sky').
+        :param program: Шейдерная программа.
+        :param texture: Текстура или None.
+        :param vao: VAO.
+        :param float depth: Расстояние до камеры.
+        :return int: Ключ сортировки.
+        """
+        depth_bits = KEY_FIELDS[-1][1]
+        depth = int(min(max(depth / self.far, 0.0), 1.0) * ((1 << depth_bits) - 1))
+        values = {
+            'layer': LAYERS[layer],
+            'program': self.get_id('program', program),
+            'texture': self.get_id('texture', texture),
+            'vao': self.get_id('vao', vao),
+            'depth': depth
+        }
+        key = 0
+        for name, bits in KEY_FIELDS:
+            key = (key << bits) | (values[name] & ((1 << bits) - 1))
+        return key
+
+    def submit(self, layer, program, texture, vao, depth, draw, name=None):
+        """
+        Метод добавления пакета отрисовки в очередь.
+        :param str layer: Слой ('shadow', 'depth', 'opaque', 'sky').
+        :param program: Шейдерная программа.
+        :param texture: Текстура или None.
+        :param vao: VAO.
+        :param float depth: Расстояние до камеры.
+        :param draw: Функция отрисовки пакета без аргументов.
+        :param str name: Имя пакета для профилировщика (группы инстансинга).
+        """
+        self.keys.append(self.get_key(layer, program, texture, vao, depth))
+        self.packets.append((LAYERS[layer], program, texture, vao, draw, name))
+
+    def sort(self):
+        """
+        Метод сортировки пакетов по ключам.
+        """
+        keys = np.array(self.keys, dtype=np.uint64)
+        self.order = radix_sort(keys).tolist()
+
+    def render(self, layer=None, section=None):
+        """
+        Метод отрисовки отсортированных пакетов слоя с подсчетом смен состояния.
+        :param str layer: Слой или None, чтобы отрисовать все пакеты.
+        :param str section: Имя прохода, в котором именованные пакеты замеряются
+                            профилировщиком как группы.
+        """
+        stats = self.stats
+        last = (None, None, None)
+        for index in self.order:
+            layer_id, program, texture, vao, draw, name = self.packets[index]
+            if layer is not None and layer_id != LAYERS[layer]:
+                continue
+            changes = [current is not None and current is not previous
+                       for current, previous in zip((program, texture, vao), last)]
+            stats['program_changes'] += changes[0]
+            stats['texture_changes'] += changes[1]
+            stats['vao_changes'] += changes[2]
+            stats['state_changes'] += any(changes)
+            stats['packets'] += 1
+            last = (program, texture or last[1], vao)
+            if section is not None and name is not None and self.profiler is not None:
+                with self.profiler.section(f'{section}/{name}', group=True):
+                    draw()
+            else:
+                draw()
+
+    def clear(self):
+        """
+        Метод очистки очереди перед сбором пакетов очередного прохода.
+        """
+        for ids in self.ids.values():
+            ids.clear()
+        self.keys = []
+        self.packets = []
+        self.order = []
+
+    def begin_frame(self):
+        """
+        Метод начала нового кадра: сохраняет счетчики прошлого кадра и обнуляет текущие.
+        """
+        self.frame_stats = self.stats
+        self.stats = self.get_empty_stats()
@@ -1,4 +1,22 @@
-from service.model import Cube, SkyBox, OtherModel
+import numpy as np
+from service.model import SkyBox
+from service.light import PointLight
+from service.culling import FrustumCuller, SphereSet, get_world_spheres, get_frustum_planes
+from service.occlusion import OcclusionCuller
+from service.spatial import LooseOctree, get_plane_mask, get_radius_mask, get_ray_hits
+from service.instancing import InstanceBatch, InstanceGroup
+from service.scene_file import SceneFile, CHUNK_SIZE
+from service.voxel import VoxelGrid
+from service.uniform import FrameUniforms
+from service.shadow import ShadowMap
+from service.light_grid import LightGrid
+from service.profiler import Profiler
+from service.overlay import ProfilerOverlay
+from service.render_queue import RenderQueue
+from service.lod import get_screen_sizes, get_lod_levels
+
+# файл сцены, загружаемой по умолчанию
+DEFAULT_SCENE = 'scenes/default.json'
 
 
 class Scene:
@@ -12,8 +30,27 @@ class Scene:
         """
         self.app = app
         self.objects = []
+        # (имя VAO, текстура) -> экземпляры из файлов сцены
+        self.groups = {}
+        self.lights = []
+        # увеличивается при добавлении, удалении и изменении точечных источников света
+        self.lights_version = 0
+        # объекты сцены; экземпляры групп ищутся по сферам групп (query_frustum и др.)
+        self.index = LooseOctree()
+        self.version = 0
+        self.transform_version = 0
+        self.moved = []
+        # номера записей хранилища преобразований, измененных к последнему update_transforms
+        self.changed = np.zeros(0, dtype=int)
+        # объекты, еще не добавленные в пространственный индекс
+        self.unindexed = []
+        self.voxels = VoxelGrid(app)
         self.load()
         self.skybox = SkyBox(app)
+        # загрузка мешей всех объектов уже запущена, поэтому их разбор идет параллельно
+        self.index_objects()
+        # матрицы начальных объектов уже учтены в пространственном индексе
+        app.transforms.take_changed()
 
     def add_object(self, obj):
         """
@@ -21,24 +58,277 @@ class Scene:
         :param obj obj: Объект, который нужно добавить в сцену.
         """
         self.objects.append(obj)
+        self.unindexed.append(obj)
+        self.version += 1
 
-    def load(self):
+    def remove_object(self, obj):
         """
-        Метод загрузки начальных объектов в сцену.
+        Метод удаления объекта из сцены.
+        Запись объекта в хранилище преобразований освобождается.
+        :param obj obj: Объект, который нужно удалить из сцены.
+        """
+        self.objects.remove(obj)
+        self.app.transforms.remove(obj.transform)
+        if obj in self.index.items:
+            self.index.remove(obj)
+        else:
+            self.unindexed.remove(obj)
+        self.version += 1
+
+    def index_objects(self):
+        """
+        Метод добавления в пространственный индекс объектов и вычисления сфер экземпляров,
+        добавленных с прошлого вызова. Ограничивающим сферам нужны границы мешей,
+        поэтому они вычисляются не при добавлении, а после запуска загрузки
+        всех ресурсов: в конце инициализации сцены и в начале каждого кадра.
+        Сферы новых экземпляров запоминаются для частичной перерисовки карты теней.
+        :return list: Группы экземпляров, в которые добавлены экземпляры.
+        """
+        grown = []
+        for group in self.groups.values():
+            rows = group.update_pending()
+            if len(rows):
+                self.moved.append(group.spheres[rows])
+                grown.append(group)
+        if grown:
+            self.transform_version += 1
+        if self.unindexed:
+            objects, self.unindexed = self.unindexed, []
+            for obj, sphere in zip(objects, self.get_bounding_spheres(objects)):
+                self.index.insert(obj, sphere)
+        return grown
+
+    def add_instances(self, vao_name, tex_id, position, rotation, scale):
+        """
+        Метод добавления в сцену многих экземпляров меша без объекта на каждый экземпляр.
+        Новая версия состава сцены нужна только при создании новой группы.
+        :param str vao_name: Имя VAO экземпляров.
+        :param tex_id: Идентификатор текстуры экземпляров.
+        :param numpy.ndarray position: Позиции размером (n, 3).
+        :param numpy.ndarray rotation: Углы поворота по осям в градусах размером (n, 3).
+        :param numpy.ndarray scale: Масштабы размером (n, 3).
+        :return InstanceGroup: Группа, в которую добавлены экземпляры.
+        """
+        key = (vao_name, tex_id)
+        if key not in self.groups:
+            self.groups[key] = InstanceGroup(self.app, vao_name, tex_id)
+            self.version += 1
+        # в существующую группу экземпляры дописываются без смены состава сцены:
+        # отрисовка дописывает их в буфер своей группы отрисовки
+        self.groups[key].add(position, rotation, scale)
+        return self.groups[key]
+
+    def stream_file(self, path, chunk_size=CHUNK_SIZE):
+        """
+        Метод потоковой загрузки файла сцены: таблица экземпляров читается частями,
+        и каждая часть добавляется в сцену по группам одним шагом.
+        Между частями можно рисовать кадры, чтобы большая сцена появлялась постепенно.
+        :param str path: Путь к манифесту сцены.
+        :param int chunk_size: Число экземпляров в части.
+        :return: Генератор числа загруженных экземпляров после каждой части.
+        """
+        scene_file = SceneFile(path)
+        for light in scene_file.lights:
+            self.add_light(PointLight(**light))
+        if scene_file.voxels is not None:
+            self.load_voxels(scene_file.voxels)
+        loaded = 0
+        for chunk in scene_file.get_chunks(chunk_size):
+            for vao_name, tex_id, rows in scene_file.get_groups(chunk):
+                self.add_instances(vao_name, tex_id, rows['position'], rows['rotation'], rows['scale'])
+            loaded += len(chunk)
+            yield loaded
+
+    def load_file(self, path, chunk_size=CHUNK_SIZE):
+        """
+        Метод загрузки файла сцены целиком.
+        :param str path: Путь к манифесту сцены.
+        :param int chunk_size: Число экземпляров в части.
+        """
+        for _ in self.stream_file(path, chunk_size):
+            pass
+
+    def load_voxels(self, voxels):
+        """
+        Метод заполнения сетки ячеек из описания файла сцены.
+        :param dict voxels: Угол ячейки (0, 0, 0) 'origin', размер ячейки 'cell_size'
+                            и параллелепипеды 'boxes' ('min', 'max', 'texture').
+        """
+        self.voxels.set_origin(voxels.get('origin', (0, 0, 0)), voxels.get('cell_size', 2.0))
+        for box in voxels.get('boxes', []):
+            self.voxels.fill(box['min'], box['max'], box['texture'])
+
+    def update_voxels(self):
+        """
+        Метод перестройки чанков сетки ячеек, измененных с прошлого кадра.
+        Сферы мешей до и после перестройки запоминаются для частичной
+        перерисовки карты теней.
+        """
+        old, new = self.voxels.update()
+        if len(old) or len(new):
+            self.moved.extend((old, new))
+            self.transform_version += 1
+
+    def get_spheres(self):
+        """
+        Метод получения ограничивающих сфер всех объектов, экземпляров и мешей сетки сцены.
+        :return numpy.ndarray: Сферы размером (n, 4).
         """
-        app = self.app
-        add = self.add_object
+        spheres = [sphere for sphere, _ in self.index.items.values()]
+        return np.concatenate([np.array(spheres, dtype='f4').reshape(-1, 4),
+                               *[group.spheres for group in self.groups.values()],
+                               self.voxels.get_spheres()])
 
-        # floor
-        n, s = 20, 2
-        for x in range(-n, n, s):
-            for z in range(-n, n, s):
-                add(Cube(app, pos=(x, -s, z)))
+    def query_instances(self, get_mask):
+        """
+        Метод поиска экземпляров групп одной векторной проверкой сфер каждой группы.
+        Экземпляры не хранятся в пространственном индексе: их бывают миллионы,
+        и узлы дерева на каждый экземпляр замедлили бы загрузку сцены в разы
+        сильнее, чем ускорили бы поиск.
+        :param get_mask: Функция (сферы) -> маска подходящих экземпляров.
+        :return dict: Ключ группы (имя VAO, текстура) -> строки найденных экземпляров.
+        """
+        found = {}
+        for key, group in self.groups.items():
+            rows = np.flatnonzero(get_mask(group.spheres))
+            if len(rows):
+                found[key] = rows
+        return found
+
+    def query_frustum(self, m_clip):
+        """
+        Метод поиска объектов и экземпляров, пересекающих пирамиду видимости.
+        :param glm.mat4 m_clip: Матрица проекции, умноженная на матрицу вида.
+        :return tuple: Найденные объекты и экземпляры (см. query_instances).
+        """
+        planes = get_frustum_planes(m_clip)
+        return (self.index.query_planes(planes),
+                self.query_instances(lambda spheres: get_plane_mask(spheres, planes)))
+
+    def query_radius(self, center, radius):
+        """
+        Метод поиска объектов и экземпляров, пересекающих сферу.
+        :param center: Центр сферы (x, y, z).
+        :param float radius: Радиус сферы.
+        :return tuple: Найденные объекты и экземпляры (см. query_instances).
+        """
+        center = np.asarray(center, dtype='f4')
+        return (self.index.query_radius(center, radius),
+                self.query_instances(lambda spheres: get_radius_mask(spheres, center, radius)))
+
+    def query_ray(self, origin, direction, max_distance=np.inf):
+        """
+        Метод поиска объектов и экземпляров, ограничивающие сферы которых пересекает луч.
+        :param origin: Начало луча (x, y, z).
+        :param direction: Направление луча (x, y, z).
+        :param float max_distance: Максимальная длина луча.
+        :return list: Пары (расстояние, объект или (ключ группы, строка экземпляра)),
+                      отсортированные по расстоянию.
+        """
+        hits = self.index.query_ray(origin, direction, max_distance)
+        origin = np.asarray(origin, dtype='f4')
+        direction = np.asarray(direction, dtype='f4')
+        direction = direction / np.linalg.norm(direction)
+        for key, group in self.groups.items():
+            t, mask = get_ray_hits(group.spheres, origin, direction, max_distance)
+            hits.extend((float(t[row]), (key, int(row))) for row in np.flatnonzero(mask))
+        hits.sort(key=lambda hit: hit[0])
+        return hits
+
+    def add_light(self, light):
+        """
+        Метод добавления точечного источника света в сцену.
+        :param PointLight light: Источник света.
+        """
+        self.lights.append(light)
+        light.scene = self
+        self.lights_version += 1
+
+    def remove_light(self, light):
+        """
+        Метод удаления точечного источника света из сцены.
+        :param PointLight light: Источник света.
+        """
+        self.lights.remove(light)
+        light.scene = None
+        self.lights_version += 1
+
+    def get_bounding_spheres(self, objects):
+        """
+        Метод получения ограничивающих сфер объектов в мировых координатах.
+        Сферы объектов с общим мешем вычисляются одним векторным шагом.
+        :param list objects: Объекты сцены.
+        :return numpy.ndarray: Сферы (x, y, z, радиус) размером (n, 4).
+        """
+        groups = {}
+        for i, obj in enumerate(objects):
+            groups.setdefault(obj.vao_name, []).append(i)
+        vbos = self.app.mesh.vao.vbo.vbos
+        spheres = np.zeros((len(objects), 4), dtype='f4')
+        for vao_name, rows in groups.items():
+            matrices = self.app.transforms.get_matrices([objects[i].transform for i in rows])
+            spheres[rows] = get_world_spheres(matrices, vbos[vao_name].bounds)
+        return spheres
 
-        # cube
-        add(Cube(app, pos=(0, 0, 0), tex_id=1))
+    def move_objects(self, objects):
+        """
+        Метод учета перемещения объектов сцены.
+        Сферы объектов до и после перемещения запоминаются для частичной
+        перерисовки карты теней.
+        :param list objects: Перемещенные объекты.
+        """
+        spheres = self.get_bounding_spheres(objects)
+        self.moved.append(np.array([self.index.items[obj][0] for obj in objects], dtype='f4'))
+        self.moved.append(spheres)
+        self.index.update_many(objects, spheres)
+        self.transform_version += 1
 
-        add(OtherModel(app, pos=(0, 0, -10)))
+    def update_transforms(self):
+        """
+        Метод применения изменений хранилища преобразований: матрицы всех измененных
+        объектов пересчитываются одним шагом, объекты сцены среди них
+        переносятся в пространственном индексе, а у групп экземпляров
+        пересчитываются сферы перемещенных экземпляров. Новые объекты и экземпляры
+        пропускаются: их сферы вычисляет index_objects.
+        :return list: Перемещенные объекты сцены и группы экземпляров.
+        """
+        transforms = self.app.transforms
+        changed = self.changed = transforms.take_changed()
+        if not len(changed):
+            return []
+        moved = []
+        claimed = np.zeros(len(changed), dtype=bool)
+        for group in self.groups.values():
+            mask, rows = group.find(changed)
+            claimed |= mask
+            rows = rows[rows < len(group.spheres)]
+            if len(rows):
+                self.moved.extend(group.update_spheres(rows))
+                moved.append(group)
+        if moved:
+            self.transform_version += 1
+
+        items = self.index.items
+        objects = [transforms.owners[i] for i in changed[~claimed].tolist()]
+        objects = [obj for obj in objects if obj in items]
+        if objects:
+            self.move_objects(objects)
+        return objects + moved
+
+    def take_moved(self):
+        """
+        Метод получения сфер перемещенных объектов с очисткой списка.
+        :return numpy.ndarray: Сферы объектов до и после перемещения размером (n, 4).
+        """
+        moved = np.concatenate([np.zeros((0, 4), dtype='f4'), *self.moved])
+        self.moved = []
+        return moved
+
+    def load(self):
+        """
+        Метод загрузки начальных объектов в сцену.
+        """
+        self.load_file(DEFAULT_SCENE)
 
     def render(self):
         """
@@ -54,46 +344,349 @@ class SceneRenderer:
     """
     Класс представляющий рендеринг сцены.
     """
-    def __init__(self, app):
+    def __init__(self, app, instancing=True, culling=True, texture_array=True, shadow_cache=True,
+                 profiler=False, profile_groups=False, overlay=False,
+                 lod=True, lod_bias=0.0, shadow_lod_bias=1.0, depth_prepass=False,
+                 occlusion=False, occlusion_groups=True):
         """
         Метод инициализации объекта сцены.
         :param GraphicsEngine app: Объект приложения.
+        :param bool instancing: Отрисовывать объекты с общим VAO и текстурой одним вызовом.
+        :param bool culling: Отсекать объекты вне пирамиды видимости.
+        :param bool texture_array: Объединять в группу инстансинга объекты с разными
+                                   текстурами из текстурного массива.
+        :param bool shadow_cache: Перерисовывать карту теней только при изменениях сцены.
+        :param bool profiler: Замерять время проходов рендеринга.
+        :param bool profile_groups: Замерять отдельные группы отрисовки внутри проходов.
+        :param bool overlay: Выводить статистику профилировщика поверх кадра.
+        :param bool lod: Выбирать уровень детализации мешей по размеру на экране.
+        :param float lod_bias: Смещение уровня детализации основного прохода
+                               (положительное - более грубые уровни).
+        :param float shadow_lod_bias: Смещение уровня детализации прохода теней.
+        :param bool depth_prepass: Перед основным проходом рисовать только глубину,
+                                   чтобы освещение считалось один раз на пиксель.
+        :param bool occlusion: Отсекать перекрытые объекты запросами к видеокарте.
+        :param bool occlusion_groups: Проверять перекрытие кластерами объектов, а не по одному.
         """
         self.app = app
         self.ctx = app.ctx
         self.mesh = app.mesh
         self.scene = app.scene
-        self.depth_texture = self.mesh.texture.textures['depth_texture']
-        self.depth_fbo = self.ctx.framebuffer(depth_attachment=self.depth_texture)
+        self.shadow_map = ShadowMap(app, cache=shadow_cache)
+        self.light_grid = LightGrid(app)
+        self.frame_uniforms = FrameUniforms(app, self.shadow_map, self.light_grid)
+        self.state = app.render_state
+        self.culler = FrustumCuller(enabled=culling)
+        self.occlusion = OcclusionCuller(self.ctx, enabled=occlusion, groups=occlusion_groups)
+        self.profiler = Profiler(self.ctx, enabled=profiler or overlay, groups=profile_groups)
+        self.overlay = ProfilerOverlay(app, self.profiler) if overlay else None
+        self.queue = RenderQueue(far=app.camera.far, profiler=self.profiler)
+        self.lod = lod
+        self.lod_bias = {'main': lod_bias, 'shadow': shadow_lod_bias}
+        self.depth_prepass = depth_prepass
+
+        # instancing
+        self.instancing = instancing
+        self.texture_array = texture_array
+        self.batches = []
+        self.batches_version = None
+        self.object_spheres = None
+        self.ordered_objects = []
+        self.object_positions = {}
+
+    def get_batches(self, objects, groups):
+        """
+        Метод группировки объектов и экземпляров сцены по VAO и текстуре.
+        Объекты с текстурами одного размера объединяются общим текстурным массивом.
+        :param list objects: Объекты сцены.
+        :param list groups: Группы экземпляров из файлов сцены.
+        :return list: Список групп объектов для инстансинга.
+        """
+        items = (*objects, *groups)
+        arrays = self.mesh.texture.get_arrays(item.tex_id for item in items) \
+            if self.texture_array else {}
+        keys = [(item.vao_name, arrays.get(item.tex_id, item.tex_id)) for item in items]
+        # текстуры декодируются параллельно, пока группы ждут первую из них
+        for tex_id in dict.fromkeys(tex_id for _, tex_id in keys):
+            self.mesh.request(tex_id=tex_id)
+
+        batches = {}
+        for item, key in zip(items, keys):
+            if key not in batches:
+                batches[key] = InstanceBatch(self.app, *key, depth_prepass=self.depth_prepass)
+            if isinstance(item, InstanceGroup):
+                batches[key].add_group(item)
+            else:
+                batches[key].add(item)
+        return list(batches.values())
+
+    def update_batches(self, moved=(), changed=None):
+        """
+        Метод пересборки групп объектов и ограничивающих сфер после изменения состава сцены.
+        При перемещении объектов и добавлении экземпляров в существующие группы
+        группы отрисовки только обновляют свои буферы экземпляров.
+        Экземпляры из файлов сцены не имеют своих объектов, поэтому рисуются
+        группами и без инстансинга объектов.
+        :param list moved: Объекты и группы экземпляров, перемещенные или пополненные
+                           с прошлого кадра.
+        :param numpy.ndarray changed: Номера измененных записей хранилища преобразований
+                                      (None - обновить группы целиком).
+        """
+        groups = list(self.scene.groups.values())
+        if self.batches_version != self.scene.version:
+            self.destroy_batches()
+            if self.instancing:
+                self.batches = self.get_batches(self.scene.objects, groups)
+            else:
+                for obj in self.scene.objects:
+                    self.mesh.request(tex_id=obj.tex_id)
+                self.batches = self.get_batches([], groups)
+                self.update_object_spheres()
+            for batch in self.batches:
+                batch.build()
+            self.batches_version = self.scene.version
+        elif moved:
+            moved = set(moved)
+            for batch in self.batches:
+                if not (moved.isdisjoint(batch.objects) and moved.isdisjoint(batch.groups)):
+                    batch.refresh(changed)
+            if not self.instancing:
+                self.update_object_spheres()
+
+    def update_object_spheres(self):
+        """
+        Метод сборки набора ограничивающих сфер объектов для отрисовки без инстансинга.
+        Отсечение пирамидой видимости идет по пространственному индексу сцены,
+        а набор сфер задает порядок объектов, глубины и уровни детализации.
+        """
+        objects = self.scene.objects
+        self.object_spheres = SphereSet(self.scene.get_bounding_spheres(objects))
+        self.ordered_objects = [objects[i] for i in self.object_spheres.order]
+        self.object_positions = {obj: i for i, obj in enumerate(self.ordered_objects)}
 
     def render_shadow(self):
         """
         Рендеринг теней.
+        Объекты отсекаются общей для всех каскадов проекцией источника света,
+        после чего каждый каскад рисуется в свою клетку карты теней.
+        Проход пропускается, если карта теней не устарела.
         """
-        self.depth_fbo.clear()
-        self.depth_fbo.use()
-        for obj in self.scene.objects:
-            obj.render_shadow()
+        passes = self.shadow_map.begin()
+        if not passes:
+            return
+        queue = self.queue
+        queue.clear()
+        for batch in self.batches:
+            mask = self.culler.cull('shadow', batch.spheres)
+            level = self.get_batch_level('shadow', batch, mask)
+            batch.submit_shadow(queue, mask, level=level)
+        voxels = self.scene.voxels
+        voxels.submit(queue, self.culler.cull('shadow', voxels.spheres), kind='shadow')
+        if not self.instancing:
+            mask = self.culler.cull_index('shadow', self.scene.index, self.object_positions)
+            levels = self.get_lod_levels('shadow', self.object_spheres)
+            for i, obj in enumerate(self.ordered_objects):
+                if mask is None or mask[i]:
+                    obj.submit_shadow(queue, level=int(levels[i]))
+        queue.sort()
+
+        shader = self.mesh.vao.program
+        for m_clip, viewport, region in passes:
+            self.shadow_map.use(viewport, region)
+            for name in ('shadow_map', 'shadow_map_instanced'):
+                for program in shader.get_variants(name):
+                    self.state.write(program, 'm_shadow_clip', m_clip)
+            queue.render('shadow', section='shadow')
+        self.shadow_map.end()
+
+    def get_lod_levels(self, name, sphere_set, depths=None):
+        """
+        Метод выбора уровней детализации объектов по размеру их проекции на экран камеры.
+        :param str name: Имя прохода ('main', 'shadow'), определяющее смещение уровня.
+        :param SphereSet sphere_set: Набор ограничивающих сфер.
+        :param numpy.ndarray depths: Глубины сфер, если уже вычислены.
+        :return numpy.ndarray: Уровни в порядке набора (нули, если выбор выключен).
+        """
+        if not self.lod:
+            return np.zeros(sphere_set.count, dtype=int)
+        camera = self.app.camera
+        if depths is None:
+            depths = sphere_set.get_depths(camera.m_view)
+        focal = self.app.WIN_SIZE[1] / 2 / np.tan(np.radians(camera.fov) / 2)
+        sizes = get_screen_sizes(depths, sphere_set.radius[:sphere_set.count], focal)
+        return get_lod_levels(sizes, bias=self.lod_bias[name])
+
+    def get_batch_level(self, name, batch, mask, depths=None):
+        """
+        Метод выбора общего уровня детализации группы инстансинга:
+        самого детального среди видимых экземпляров.
+        :param str name: Имя прохода ('main', 'shadow').
+        :param InstanceBatch batch: Группа объектов.
+        :param numpy.ndarray mask: Маска видимости экземпляров.
+        :param numpy.ndarray depths: Глубины экземпляров, если уже вычислены.
+        :return int: Уровень детализации.
+        """
+        if len(batch.lod_names) < 2:
+            return 0
+        levels = self.get_lod_levels(name, batch.spheres, depths)
+        if mask is not None:
+            levels = levels[mask]
+        return int(levels.min()) if len(levels) else 0
+
+    def submit_main(self):
+        """
+        Метод сбора пакетов основного прохода и неба в очередь отрисовки.
+        Объекты отсекаются пирамидой видимости камеры (объекты без инстансинга -
+        обходом пространственного индекса) и, если включено, по результатам
+        запросов перекрытия прошлых кадров, глубина берется
+        до ближней точки ограничивающей сферы. С предварительным проходом глубины
+        те же объекты с теми же уровнями детализации добавляются и в его слой.
+        """
+        queue, m_view = self.queue, self.app.camera.m_view
+        queue.clear()
+        for batch in self.batches:
+            mask = self.culler.cull('main', batch.spheres)
+            mask = self.occlusion.cull(batch.name, batch.spheres, mask)
+            if mask is None or mask.any():
+                depths = batch.spheres.get_depths(m_view)
+                level = self.get_batch_level('main', batch, mask, depths)
+                batch.submit(queue, mask, depths, level)
+                if self.depth_prepass:
+                    batch.submit_depth(queue, mask, depths, level)
+        voxels = self.scene.voxels
+        mask = self.culler.cull('main', voxels.spheres)
+        mask = self.occlusion.cull('voxels', voxels.spheres, mask)
+        depths = voxels.spheres.get_depths(m_view)
+        voxels.submit(queue, mask, depths)
+        if self.depth_prepass:
+            voxels.submit(queue, mask, depths, kind='depth')
+        if not self.instancing:
+            mask = self.culler.cull_index('main', self.scene.index, self.object_positions)
+            mask = self.occlusion.cull('objects', self.object_spheres, mask)
+            depths = self.object_spheres.get_depths(m_view)
+            levels = self.get_lod_levels('main', self.object_spheres, depths)
+            for i, obj in enumerate(self.ordered_objects):
+                if mask is None or mask[i]:
+                    obj.submit(queue, depth=float(depths[i]), level=int(levels[i]))
+                    if self.depth_prepass:
+                        obj.submit_depth(queue, depth=float(depths[i]), level=int(levels[i]))
+        self.scene.skybox.submit(queue, layer='sky')
+        queue.sort()
+
+    def set_write_mask(self, color=True, depth=True):
+        """
+        Метод включения и выключения записи цвета и глубины в буфер кадра.
+        moderngl применяет маски буфера кадра только при его привязке.
+        :param bool color: Записывать ли цвет.
+        :param bool depth: Записывать ли глубину.
+        """
+        framebuffer = self.app.framebuffer
+        framebuffer.color_mask = (color,) * 4
+        framebuffer.depth_mask = depth
+        framebuffer.use()
+
+    def depth_render(self):
+        """
+        Предварительный проход глубины: непрозрачные объекты рисуются без вывода цвета
+        шейдером, вычисляющим только позицию.
+        """
+        self.app.framebuffer.use()
+        self.submit_main()
+        self.set_write_mask(color=False)
+        self.queue.render('depth', section='prepass')
+        self.set_write_mask()
 
     def main_render(self):
         """
-        Основной рендеринг сцены.
+        Основной рендеринг сцены: непрозрачные объекты в порядке очереди отрисовки.
+        После прохода глубины фрагменты проходят только тест на равенство глубин,
+        поэтому затенение выполняется только для видимых фрагментов.
         """
-        self.app.ctx.screen.use()
-        for obj in self.scene.objects:
-            obj.render()
-        self.scene.skybox.render()
+        self.app.framebuffer.use()
+        if not self.depth_prepass:
+            self.submit_main()
+            self.queue.render('opaque', section='main')
+            return
+        self.ctx.depth_func = '=='
+        self.set_write_mask(depth=False)
+        self.queue.render('opaque', section='main')
+        self.set_write_mask()
+        self.ctx.depth_func = '<'
+
+    def occlusion_render(self):
+        """
+        Отправка запросов перекрытия: ограничивающие кубы объектов внутри пирамиды
+        видимости проверяются по глубине кадра без вывода цвета и записи глубины.
+        Запросы не могут быть вложены в запросы профилировщика, поэтому проход
+        выполняется вне его участков, а время процессора ведется в счетчиках отсечения.
+        """
+        if not self.occlusion.enabled:
+            return
+        camera = self.app.camera
+        self.set_write_mask(color=False, depth=False)
+        self.occlusion.render(self.state, self.mesh.vao.vaos['depth_cube'],
+                              camera.position, camera.near)
+        self.set_write_mask()
+
+    def update_culling(self):
+        """
+        Метод установки пирамид видимости камеры и источника света на текущий кадр.
+        """
+        camera = self.app.camera
+        self.culler.begin_frame()
+        self.occlusion.begin_frame()
+        self.culler.set_frustum('main', camera.m_proj * camera.m_view)
+        self.shadow_map.update()
+        self.culler.set_frustum('shadow', self.shadow_map.m_cull)
 
     def render(self):
         """
         Общий процесс рендеринга сцены.
         """
-        self.scene.update()
-        self.render_shadow()
-        self.main_render()
+        self.state.begin_frame()
+        self.queue.begin_frame()
+        self.profiler.begin_frame()
+        with self.profiler.section('update'):
+            self.mesh.poll()
+            moved = self.scene.update_transforms()
+            moved += self.scene.index_objects()
+            self.scene.update_voxels()
+            self.update_batches(moved, self.scene.changed)
+            self.update_culling()
+            self.light_grid.update(self.scene.lights)
+            self.light_grid.use()
+            self.frame_uniforms.update()
+        with self.profiler.section('shadow'):
+            self.render_shadow()
+        if self.depth_prepass:
+            with self.profiler.section('prepass'):
+                self.depth_render()
+        with self.profiler.section('main'):
+            self.main_render()
+        self.occlusion_render()
+        with self.profiler.section('skybox'):
+            self.queue.render('sky')
+        if self.overlay is not None:
+            self.overlay.render()
+
+    def destroy_batches(self):
+        """
+        Метод освобождения ресурсов групп объектов.
+        """
+        for batch in self.batches:
+            batch.destroy()
+        self.batches = []
 
     def destroy(self):
         """
         Метод уничтожения объекта.
         """
-        self.depth_fbo.release()
+        self.destroy_batches()
+        self.scene.voxels.destroy()
+        self.frame_uniforms.destroy()
+        self.light_grid.destroy()
+        self.occlusion.destroy()
+        self.shadow_map.destroy()
+        self.profiler.destroy()
+        if self.overlay is not None:
+            self.overlay.destroy()
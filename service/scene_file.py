@@ -0,0 +1,113 @@
+import os
+import json
+import numpy as np
+
+SCENE_VERSION = 1
+
+# строка таблицы экземпляров: номера меша и текстуры в списках манифеста,
+# позиция, углы поворота по осям в градусах и масштаб
+INSTANCE_DTYPE = np.dtype([('mesh', '<u2'), ('texture', '<u2'), ('position', '<f4', 3),
+                           ('rotation', '<f4', 3), ('scale', '<f4', 3)])
+
+# число экземпляров, загружаемых за один шаг
+CHUNK_SIZE = 65536
+
+
+def get_instance_table(count):
+    """
+    Функция создания таблицы экземпляров с единичным масштабом.
+    :param int count: Число экземпляров.
+    :return numpy.ndarray: Таблица экземпляров.
+    """
+    table = np.zeros(count, dtype=INSTANCE_DTYPE)
+    table['scale'] = 1.0
+    return table
+
+
+def write_scene(path, meshes, textures, instances, lights=(), voxels=None):
+    """
+    Функция записи файла сцены: манифеста JSON и таблицы экземпляров рядом с ним
+    (то же имя с расширением .bin).
+    :param str path: Путь к манифесту.
+    :param list meshes: Имена VAO, на которые ссылаются номера мешей таблицы.
+    :param list textures: Идентификаторы текстур, на которые ссылаются номера текстур.
+    :param numpy.ndarray instances: Таблица экземпляров (INSTANCE_DTYPE).
+    :param list lights: Точечные источники света.
+    :param dict voxels: Сетка ячеек: угол ячейки (0, 0, 0) 'origin', размер ячейки
+                        'cell_size' и заполненные параллелепипеды 'boxes'
+                        (первая ячейка 'min', ячейка за последней 'max', 'texture').
+    """
+    table_path = os.path.splitext(path)[0] + '.bin'
+    manifest = {
+        'version': SCENE_VERSION,
+        'meshes': list(meshes),
+        'textures': list(textures),
+        'instances': os.path.basename(table_path),
+        'count': len(instances),
+        'lights': [{'position': list(map(float, light.position)),
+                    'color': list(map(float, light.color)),
+                    'radius': float(light.radius), 'intensity': float(light.intensity)}
+                   for light in lights]
+    }
+    if voxels is not None:
+        manifest['voxels'] = voxels
+    np.asarray(instances, dtype=INSTANCE_DTYPE).tofile(table_path)
+    with open(path, 'w') as file:
+        json.dump(manifest, file, indent=2)
+        file.write('\n')
+
+
+class SceneFile:
+    """
+    Класс представляющий файл сцены: манифест JSON со списками мешей, текстур
+    и источников света, необязательной сеткой ячеек и бинарную таблицу экземпляров,
+    отображаемую в память.
+    Таблица читается частями, поэтому большая сцена не загружается в память целиком.
+    """
+    def __init__(self, path):
+        """
+        Метод открытия файла сцены.
+        :param str path: Путь к манифесту.
+        """
+        with open(path) as file:
+            manifest = json.load(file)
+        if manifest.get('version') != SCENE_VERSION:
+            raise ValueError(f'Unsupported scene version: {manifest.get("version")}')
+
+        self.path = path
+        self.meshes = manifest['meshes']
+        self.textures = manifest['textures']
+        self.lights = manifest.get('lights', [])
+        self.voxels = manifest.get('voxels')
+        count = manifest['count']
+        table_path = os.path.join(os.path.dirname(path), manifest['instances'])
+        if os.path.getsize(table_path) != count * INSTANCE_DTYPE.itemsize:
+            raise ValueError(f'Instance table size does not match the manifest: {table_path}')
+        self.instances = (np.memmap(table_path, dtype=INSTANCE_DTYPE, mode='r', shape=(count,))
+                          if count else np.zeros(0, dtype=INSTANCE_DTYPE))
+
+    def __len__(self):
+        return len(self.instances)
+
+    def get_chunks(self, chunk_size=CHUNK_SIZE):
+        """
+        Метод последовательного чтения таблицы экземпляров частями.
+        :param int chunk_size: Число экземпляров в части.
+        :return: Генератор частей таблицы.
+        """
+        for start in range(0, len(self.instances), chunk_size):
+            yield np.array(self.instances[start:start + chunk_size])
+
+    def get_groups(self, chunk):
+        """
+        Метод разбиения части таблицы на группы с общим мешем и текстурой.
+        :param numpy.ndarray chunk: Часть таблицы экземпляров.
+        :return list: Имя VAO, идентификатор текстуры и строки таблицы каждой группы.
+        """
+        keys = chunk['mesh'].astype(np.uint32) << 16 | chunk['texture']
+        order = np.argsort(keys, kind='stable')
+        unique, starts = np.unique(keys[order], return_index=True)
+        groups = []
+        for key, rows in zip(unique.tolist(), np.split(order, starts[1:])):
+            groups.append((self.meshes[key >> 16], self.textures[key & 0xffff], chunk[rows]))
+        return groups
@@ -1,38 +1,156 @@
+import os
+import re
+import hashlib
+from service.uniform import FrameUniforms
+from service.light_grid import SAMPLERS
+from service.assets import AssetLoader, AssetDict
 
 
 class ShaderProgram:
     """
     Класс представляющий работу со шейдерами.
+    Программы собираются из общих исходников с директивами #include,
+    а их варианты задаются набором #define (качество теней, текстурирование,
+    инстансинг, формат вершин). Вариант компилируется при первом обращении и кэшируется
+    по хэшу исходника и набору определений.
     """
-    def __init__(self, ctx):
+    def __init__(self, ctx, loader=None, defines=None):
         """
         Метод инициализации объекта шейдеров.
         :param moderngl.Context ctx: Контекст moderngl.
+        :param AssetLoader loader: Загрузчик ресурсов (для отчета о времени компиляции).
+        :param dict defines: Определения, общие для всех вариантов (например, SHADOW_QUALITY).
         """
         self.ctx = ctx
-        self.programs = {
-            'default': self.get_program('shaders/default'),
-            'skybox': self.get_program('shaders/skybox'),
-            'shadow_map': self.get_program('shaders/shadow_map')
+        self.loader = loader or AssetLoader()
+        self.defines = {'SHADOW_QUALITY': 16, **(defines or {})}
+        self.sources = {}
+        self.variants = {}
+        # имя программы -> (шейдер, фрагментный шейдер, определения)
+        self.specs = {
+            'default': ('shaders/default', None, {}),
+            'skybox': ('shaders/skybox', None, {}),
+            'shadow_map': ('shaders/shadow_map', None, {}),
+            'default_instanced': ('shaders/default', None, {'INSTANCING': True}),
+            'shadow_map_instanced': ('shaders/shadow_map', None, {'INSTANCING': True}),
+            'depth_prepass': ('shaders/shadow_map', None, {'DEPTH_PREPASS': True}),
+            'depth_prepass_instanced': ('shaders/shadow_map', None,
+                                        {'INSTANCING': True, 'DEPTH_PREPASS': True}),
+            'default_array': ('shaders/default', None, {'INSTANCING': True, 'TEXTURE_ARRAY': True}),
+            'overlay': ('shaders/overlay', None, {})
         }
+        # имя программы -> ее скомпилированные варианты (например, для сжатых вершин)
+        self.named = {}
+        self.programs = AssetDict(self.loader, 'program', {
+            name: self.get_source(name) for name in self.specs
+        })
 
-    def get_program(self, path):
+    def get_source(self, name):
         """
-        Метод загрузки шейдеров из файлов.
-        :param str path: Название шейдера.
+        Метод описания именованной программы для ленивой компиляции.
+        :param str name: Имя программы.
+        :return tuple: Функция декодирования (нет) и функция компиляции.
+        """
+        return None, lambda data: self.get_variant(name)
+
+    def get_variant(self, name, **defines):
+        """
+        Метод получения варианта именованной программы с дополнительными определениями
+        (например, формата вершин меша).
+        :param str name: Имя программы.
+        :param defines: Дополнительные определения варианта.
         :return moderngl.Program: Скомпилированный шейдер.
         """
-        with open(f'{path}.vert') as file:
-            vertex_shader = file.read()
+        path, fragment, base = self.specs[name]
+        program = self.get_program(path, fragment, **{**base, **defines})
+        variants = self.named.setdefault(name, [])
+        if program not in variants:
+            variants.append(program)
+        return program
+
+    def get_variants(self, name):
+        """
+        Метод получения всех уже скомпилированных вариантов именованной программы.
+        :param str name: Имя программы.
+        :return list: Варианты программы.
+        """
+        return list(self.named.get(name, ()))
+
+    def read_source(self, path, included=None):
+        """
+        Метод чтения исходника шейдера с подстановкой #include "файл".
+        Пути разрешаются относительно подключающего файла, каждый файл
+        подключается не более одного раза.
+        :param str path: Путь к файлу шейдера.
+        :param set included: Уже подключенные файлы.
+        :return str: Исходник с подставленными файлами.
+        """
+        included = set() if included is None else included
+        path = os.path.normpath(path)
+        if path in included:
+            return ''
+        included.add(path)
 
-        with open(f'{path}.frag') as file:
-            fragment_shader = file.read()
+        with open(path) as file:
+            source = file.read()
+        folder = os.path.dirname(path)
+        return re.sub(r'^[ \t]*#include\s+"(.+?)"[ \t]*$',
+                      lambda match: self.read_source(os.path.join(folder, match.group(1)), included),
+                      source, flags=re.M)
+
+    def get_shader_source(self, path):
+        """
+        Метод получения исходника шейдера и его хэша (читается один раз).
+        :param str path: Путь к файлу шейдера.
+        :return tuple: Исходник и хэш SHA-1.
+        """
+        if path not in self.sources:
+            source = self.read_source(path)
+            self.sources[path] = source, hashlib.sha1(source.encode()).hexdigest()
+        return self.sources[path]
+
+    @staticmethod
+    def apply_defines(source, defines):
+        """
+        Метод вставки определений варианта сразу после директивы #version.
+        :param str source: Исходник шейдера.
+        :param tuple defines: Пары (имя, значение); True - определение без значения.
+        :return str: Исходник варианта.
+        """
+        lines = [f'#define {name}' if value is True else f'#define {name} {value}'
+                 for name, value in defines]
+        version, _, body = source.partition('\n')
+        return '\n'.join([version, *lines, body])
+
+    def get_program(self, path, fragment=None, **defines):
+        """
+        Метод получения варианта программы с компиляцией при первом обращении.
+        :param str path: Название шейдера.
+        :param str fragment: Название фрагментного шейдера, если оно отличается от path.
+        :param defines: Определения варианта; False и None не определяются.
+        :return moderngl.Program: Скомпилированный шейдер.
+        """
+        vertex_shader, vertex_hash = self.get_shader_source(f'{path}.vert')
+        fragment_shader, fragment_hash = self.get_shader_source(f'{fragment or path}.frag')
+        defines = tuple(sorted((name, value) for name, value in {**self.defines, **defines}.items()
+                               if value is not None and value is not False))
 
-        program = self.ctx.program(vertex_shader=vertex_shader, fragment_shader=fragment_shader)
+        key = (vertex_hash, fragment_hash, defines)
+        program = self.variants.get(key)
+        if program is None:
+            program = self.ctx.program(vertex_shader=self.apply_defines(vertex_shader, defines),
+                                       fragment_shader=self.apply_defines(fragment_shader, defines))
+            if FrameUniforms.name in program:
+                program[FrameUniforms.name].binding = FrameUniforms.binding
+            # текстуры кластерного освещения всегда привязаны к одним и тем же блокам
+            for name, location in SAMPLERS.items():
+                if name in program:
+                    program[name].value = location
+            self.variants[key] = program
         return program
 
     def destroy(self):
         """
         Метод уничтожения объекта.
         """
-        [program.release() for program in self.programs.values()]
+        [program.release() for program in self.variants.values()]
@@ -0,0 +1,309 @@
+import glm
+import numpy as np
+
+# наибольшее число каскадов (размер массива матриц в блоке форм кадра)
+MAX_CASCADES = 4
+
+# вершины куба, описанного вокруг сферы единичного радиуса
+BOX_CORNERS = np.array([[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)], dtype='f4')
+
+# матрица перевода координат отсечения [-1, 1] в текстурные координаты [0, 1]
+M_SHADOW_BIAS = glm.mat4(
+    0.5, 0.0, 0.0, 0.0,
+    0.0, 0.5, 0.0, 0.0,
+    0.0, 0.0, 0.5, 0.0,
+    0.5, 0.5, 0.5, 1.0
+)
+
+
+def get_screen_rect(spheres, m_clip, size, padding=2):
+    """
+    Функция вычисления прямоугольника на экране (в пикселях), закрывающего проекции сфер.
+    Проецируются вершины описанных вокруг сфер кубов, поэтому оценка консервативна.
+    :param numpy.ndarray spheres: Сферы размером (n, 4).
+    :param glm.mat4 m_clip: Матрица проекции, умноженная на матрицу вида.
+    :param tuple size: Размер экрана (ширина, высота).
+    :param int padding: Запас в пикселях с каждой стороны.
+    :return tuple: Прямоугольник (x, y, ширина, высота) или None, если сфера пересекает
+                   плоскость камеры и оценить проекцию нельзя.
+    """
+    spheres = np.asarray(spheres, dtype='f4').reshape(-1, 4)
+    points = spheres[:, None, :3] + spheres[:, None, 3:] * BOX_CORNERS
+    points = np.concatenate([points.reshape(-1, 3), np.ones((len(points) * 8, 1), 'f4')], axis=1)
+    clip = points @ np.frombuffer(m_clip.to_bytes(), dtype='f4').reshape(4, 4)
+    if np.any(clip[:, 3] <= 1e-6):
+        return None
+
+    ndc = np.clip(clip[:, :2] / clip[:, 3:], -1.0, 1.0)
+    size = np.array(size)
+    low = np.maximum(np.floor((ndc.min(axis=0) + 1) / 2 * size).astype(int) - padding, 0)
+    high = np.minimum(np.ceil((ndc.max(axis=0) + 1) / 2 * size).astype(int) + padding, size)
+    width, height = np.maximum(high - low, 0)
+    return int(low[0]), int(low[1]), int(width), int(height)
+
+
+def get_cascade_splits(near, far, count, blend=0.75):
+    """
+    Функция разбиения диапазона глубины камеры на каскады.
+    Границы смешивают логарифмическое и равномерное разбиение (practical split scheme).
+    :param float near: Ближняя граница.
+    :param float far: Дальняя граница.
+    :param int count: Число каскадов.
+    :param float blend: Доля логарифмического разбиения.
+    :return list: Границы каскадов от near до far, count + 1 значений.
+    """
+    parts = np.arange(count + 1) / count
+    splits = blend * near * (far / near) ** parts + (1 - blend) * (near + (far - near) * parts)
+    splits[0], splits[-1] = near, far
+    return splits.tolist()
+
+
+def get_frustum_corners(m_clip):
+    """
+    Функция вычисления вершин пирамиды видимости в мировых координатах.
+    :param glm.mat4 m_clip: Матрица проекции, умноженная на матрицу вида.
+    :return numpy.ndarray: Вершины размером (8, 3).
+    """
+    corners = np.concatenate([BOX_CORNERS, np.ones((8, 1), 'f4')], axis=1)
+    world = corners @ np.frombuffer(glm.inverse(m_clip).to_bytes(), dtype='f4').reshape(4, 4)
+    return world[:, :3] / world[:, 3:]
+
+
+def get_atlas_layout(size, cascades, max_size):
+    """
+    Функция раскладки каскадов в атласе глубины: один или два каскада - в ряд,
+    три и четыре - сеткой 2x2. Если атлас не помещается в наибольший размер
+    текстуры, размер каскада уменьшается.
+    :param int size: Желаемый размер каскада в текселях.
+    :param int cascades: Число каскадов.
+    :param int max_size: Наибольший размер текстуры (GL_MAX_TEXTURE_SIZE).
+    :return tuple: Число столбцов, число строк и размер каскада в текселях.
+    """
+    cascades = max(1, min(cascades, MAX_CASCADES))
+    columns = min(cascades, 2)
+    rows = (cascades + columns - 1) // columns
+    return columns, rows, min(size, max_size // columns, max_size // rows)
+
+
+def snap_range(low, high, size):
+    """
+    Функция выравнивания диапазона по сетке текселей карты теней.
+    Ширина округляется вверх до восьмой части степени двойки, а начало -
+    до целого текселя, поэтому при небольших движениях камеры проекция
+    не меняется, и тени не дрожат.
+    :param numpy.ndarray low: Нижние границы по осям x, y.
+    :param numpy.ndarray high: Верхние границы по осям x, y.
+    :param int size: Размер карты теней (каскада) в текселях.
+    :return tuple: Выровненные нижние и верхние границы.
+    """
+    extent = max(float(np.max(high - low)), 1e-3)
+    step = 2.0 ** (np.ceil(np.log2(extent)) - 3)
+    extent = np.ceil(extent / step) * step
+    texel = extent / size
+    low = np.floor(low / texel) * texel
+    return low, low + extent
+
+
+class ShadowMap:
+    """
+    Класс представляющий карту теней с кэшированием между кадрами.
+    Свет проецируется ортографически: границы проекции подгоняются под
+    пересечение пирамиды видимости камеры с границами сцены. При нескольких
+    каскадах пирамида камеры делится по глубине, и каждый каскад занимает
+    свою клетку атласа глубины (раскладка - get_atlas_layout).
+    Карта перерисовывается целиком, только если изменились источник света,
+    проекции или состав сцены. Если сдвинулись отдельные объекты, перерисовывается
+    лишь область каждого каскада, которую они занимали до и после перемещения
+    (scissor). Если ничего не изменилось, проход теней пропускается.
+    """
+    def __init__(self, app, cache=True, max_region=0.5, bias=0.0005):
+        """
+        Метод инициализации карты теней.
+        Размер каскада и число каскадов задаются в приложении (SHADOW_SIZE, SHADOW_CASCADES).
+        :param GraphicsEngine app: Объект приложения.
+        :param bool cache: Сохранять ли карту между кадрами.
+        :param float max_region: Доля площади каскада, начиная с которой
+                                 частичная перерисовка заменяется полной.
+        :param float bias: Смещение глубины для борьбы с самозатенением.
+        """
+        self.app = app
+        self.ctx = app.ctx
+        self.cascades = max(1, min(app.SHADOW_CASCADES, MAX_CASCADES))
+        self.columns, self.rows, self.size = get_atlas_layout(
+            app.SHADOW_SIZE, self.cascades, self.ctx.info['GL_MAX_TEXTURE_SIZE'])
+        self.texture = app.mesh.texture.textures['depth_texture']
+        self.fbo = self.ctx.framebuffer(depth_attachment=self.texture)
+        self.cache = cache
+        self.max_region = max_region
+        self.bias = bias
+        self.key = None
+        self.stats = {'rendered': 0, 'partial': 0, 'skipped': 0}
+
+        self.bounds = None
+        self.bounds_key = None
+        self.splits = []
+        self.m_clip = []
+        self.m_shadow = []
+        self.m_cull = glm.mat4()
+
+    def get_bounds(self):
+        """
+        Метод получения границ всех объектов сцены в пространстве источника света.
+        Пересчитывается только при изменении сцены или источника света.
+        :return tuple: Нижние и верхние границы (numpy.ndarray (3,)) или None для пустой сцены.
+        """
+        scene, light = self.app.scene, self.app.light
+        key = (scene.version, scene.transform_version, light.version)
+        if key != self.bounds_key:
+            self.bounds_key = key
+            spheres = scene.get_spheres()
+            if not len(spheres):
+                self.bounds = None
+            else:
+                m_view = np.frombuffer(light.m_view_light.to_bytes(), dtype='f4').reshape(4, 4)
+                centers = spheres[:, :3] @ m_view[:3, :3] + m_view[3, :3]
+                radius = spheres[:, 3:]
+                self.bounds = (centers - radius).min(axis=0), (centers + radius).max(axis=0)
+        return self.bounds
+
+    def update(self):
+        """
+        Метод подгонки проекций каскадов под пирамиду видимости камеры и границы сцены.
+        Вызывается раз за кадр до прохода теней.
+        """
+        camera, light = self.app.camera, self.app.light
+        m_view_light = light.m_view_light
+        m_view = np.frombuffer(m_view_light.to_bytes(), dtype='f4').reshape(4, 4)
+        bounds = self.get_bounds()
+        if bounds is None:
+            bounds = np.full(3, -1.0), np.full(3, 1.0)
+        low_scene, high_scene = bounds
+        # источник света смотрит вдоль -z: ближняя и дальняя плоскости по границам сцены
+        near, far = -high_scene[2] - 1.0, -low_scene[2] + 1.0
+
+        self.splits = get_cascade_splits(camera.near, camera.far, self.cascades)
+        self.m_clip, self.m_shadow = [], []
+        low_all, high_all = None, None
+        for i in range(self.cascades):
+            m_slice = camera.get_projection_matrix(self.splits[i], self.splits[i + 1]) * camera.m_view
+            corners = get_frustum_corners(m_slice) @ m_view[:3, :3] + m_view[3, :3]
+            low = np.maximum(corners[:, :2].min(axis=0), low_scene[:2])
+            high = np.minimum(corners[:, :2].max(axis=0), high_scene[:2])
+            low, high = snap_range(low, np.maximum(high, low), self.size)
+            m_clip = glm.ortho(*map(float, (low[0], high[0], low[1], high[1], near, far))) * m_view_light
+
+            # клетка каскада в атласе: x' = (x + столбец) / столбцы, y' = (y + строка) / строки
+            column, row = self.get_cell(i)
+            m_atlas = glm.translate(glm.vec3(column / self.columns, row / self.rows, 0)) * \
+                glm.scale(glm.vec3(1 / self.columns, 1 / self.rows, 1))
+            self.m_clip.append(m_clip)
+            self.m_shadow.append(m_atlas * M_SHADOW_BIAS * m_clip)
+            low_all = low if low_all is None else np.minimum(low_all, low)
+            high_all = high if high_all is None else np.maximum(high_all, high)
+
+        box = low_all[0], high_all[0], low_all[1], high_all[1], near, far
+        self.m_cull = glm.ortho(*map(float, box)) * m_view_light
+
+    def get_cell(self, cascade):
+        """
+        Метод получения клетки каскада в атласе.
+        :param int cascade: Номер каскада.
+        :return tuple: Столбец и строка клетки.
+        """
+        return cascade % self.columns, cascade // self.columns
+
+    def get_key(self):
+        """
+        Метод получения ключа состояния, при изменении которого карта перерисовывается целиком.
+        :return tuple: Матрицы каскадов, версия состава сцены и версия загруженных мешей.
+        """
+        return (b''.join(m_clip.to_bytes() for m_clip in self.m_clip), self.app.scene.version,
+                self.app.mesh.version)
+
+    def get_region(self, spheres, m_clip):
+        """
+        Метод вычисления области каскада, которую нужно перерисовать после перемещения объектов.
+        :param numpy.ndarray spheres: Сферы объектов до и после перемещения.
+        :param glm.mat4 m_clip: Матрица проекции каскада.
+        :return tuple: Область (x, y, ширина, высота) внутри каскада или None для полной перерисовки.
+        """
+        region = get_screen_rect(spheres, m_clip, (self.size, self.size))
+        if region is None or region[2] * region[3] > self.max_region * self.size ** 2:
+            return None
+        return region
+
+    def begin(self):
+        """
+        Метод подготовки карты к проходу теней.
+        :return list: Каскады для отрисовки: (матрица проекции, область атласа, область
+                      перерисовки); пустой список, если проход можно пропустить.
+        """
+        moved = self.app.scene.take_moved()
+        key = self.get_key()
+        full = not self.cache or key != self.key
+        if not full and not len(moved):
+            self.stats['skipped'] += 1
+            return []
+
+        passes = []
+        for i, m_clip in enumerate(self.m_clip):
+            column, row = self.get_cell(i)
+            viewport = (column * self.size, row * self.size, self.size, self.size)
+            region = None if full else self.get_region(moved, m_clip)
+            if region is None:
+                region = viewport
+            elif not region[2] * region[3]:
+                # объекты перемещались за пределами каскада
+                continue
+            else:
+                region = (region[0] + viewport[0], region[1] + viewport[1], *region[2:])
+            passes.append((m_clip, viewport, region))
+
+        if not passes:
+            self.stats['skipped'] += 1
+            return []
+
+        self.key = key
+        self.stats['rendered' if full else 'partial'] += 1
+        self.fbo.use()
+        self.fbo.scissor = None
+        if full:
+            self.fbo.clear()
+        else:
+            for _, _, region in passes:
+                self.fbo.clear(viewport=region)
+        return passes
+
+    def use(self, viewport, region):
+        """
+        Метод выбора клетки каскада и области перерисовки.
+        :param tuple viewport: Клетка каскада в атласе.
+        :param tuple region: Область перерисовки.
+        """
+        self.fbo.viewport = viewport
+        self.fbo.scissor = region
+
+    def end(self):
+        """
+        Метод завершения прохода теней.
+        """
+        self.fbo.scissor = None
+        self.fbo.viewport = (0, 0, *self.texture.size)
+
+    def get_data(self):
+        """
+        Метод сборки данных теней для блока форм кадра.
+        :return bytes: Матрицы каскадов, границы каскадов и параметры карты в формате std140.
+        """
+        identity = glm.mat4().to_bytes()
+        matrices = [m.to_bytes() for m in self.m_shadow] + [identity] * (MAX_CASCADES - self.cascades)
+        splits = (self.splits[1:] + [self.splits[-1]] * MAX_CASCADES)[:MAX_CASCADES]
+        width, height = self.texture.size
+        params = (1 / width, 1 / height, self.cascades, self.bias)
+        return b''.join(matrices) + np.array([*splits, *params], dtype='f4').tobytes()
+
+    def destroy(self):
+        """
+        Метод уничтожения объекта путем освобождения связанных ресурсов.
+        """
+        self.fbo.release()
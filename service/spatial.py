@@ -0,0 +1,426 @@
+import math
+import numpy as np
+from service.culling import get_frustum_planes
+
+
+def get_plane_mask(spheres, planes):
+    """
+    Функция проверки сфер на пересечение с пирамидой видимости, заданной плоскостями.
+    :param numpy.ndarray spheres: Сферы размером (n, 4).
+    :param numpy.ndarray planes: Нормированные плоскости (a, b, c, d) размером (6, 4).
+    :return numpy.ndarray: Маска сфер, пересекающих пирамиду.
+    """
+    dist = spheres[:, :3] @ planes[:, :3].T + planes[:, 3]
+    return np.all(dist > -spheres[:, 3:4], axis=1)
+
+
+def get_radius_mask(spheres, center, radius):
+    """
+    Функция проверки сфер на пересечение со сферой.
+    :param numpy.ndarray spheres: Сферы размером (n, 4).
+    :param numpy.ndarray center: Центр сферы (x, y, z).
+    :param float radius: Радиус сферы.
+    :return numpy.ndarray: Маска пересекающих сфер.
+    """
+    dist = np.linalg.norm(spheres[:, :3] - center, axis=1)
+    return dist <= radius + spheres[:, 3]
+
+
+def get_ray_hits(spheres, origin, direction, max_distance=np.inf):
+    """
+    Функция пересечения сфер с лучом.
+    :param numpy.ndarray spheres: Сферы размером (n, 4).
+    :param numpy.ndarray origin: Начало луча (x, y, z).
+    :param numpy.ndarray direction: Нормированное направление луча (x, y, z).
+    :param float max_distance: Максимальная длина луча.
+    :return tuple: Расстояния до входа в сферы (или выхода, если начало внутри)
+                   и маска сфер, которые луч пересекает.
+    """
+    offset = spheres[:, :3] - origin
+    along = offset @ direction
+    dist2 = np.sum(offset ** 2, axis=1) - along ** 2
+    depth = np.sqrt(np.maximum(spheres[:, 3] ** 2 - dist2, 0))
+    t = np.where(along - depth >= 0, along - depth, along + depth)
+    return t, (dist2 <= spheres[:, 3] ** 2) & (t >= 0) & (t <= max_distance)
+
+
+class OctreeNode:
+    """
+    Класс представляющий узел свободного октодерева.
+    """
+    __slots__ = ('key', 'objects', 'children', 'spheres')
+
+    def __init__(self, key):
+        """
+        Метод инициализации узла.
+        :param tuple key: Ключ узла (глубина, ix, iy, iz).
+        """
+        self.key = key
+        self.objects = []
+        self.children = set()
+        self.spheres = None
+
+    def get_spheres(self, items):
+        """
+        Метод получения массива ограничивающих сфер объектов узла (кэшируется до изменения узла).
+        :param dict items: Данные объектов дерева.
+        :return numpy.ndarray: Сферы размером (n, 4).
+        """
+        if self.spheres is None:
+            self.spheres = np.array([items[obj][0] for obj in self.objects],
+                                    dtype='f4').reshape(-1, 4)
+        return self.spheres
+
+
+class LooseOctree:
+    """
+    Класс представляющий разреженное свободное (loose) октодерево над объектами сцены.
+    Объект хранится в единственном узле, ячейка которого содержит его центр,
+    а расширенные вдвое границы узла содержат всю ограничивающую сферу.
+    Узлы хранятся в словаре по ключу, поэтому пустые области мира не занимают памяти.
+    Объектом может быть любое хешируемое значение (например, номер записи экземпляра).
+    """
+    def __init__(self, size=256.0, max_depth=12):
+        """
+        Метод инициализации октодерева.
+        :param float size: Начальный размер корневой ячейки (куб с центром в начале координат).
+        :param int max_depth: Максимальная глубина дерева.
+        """
+        self.size = float(size)
+        self.max_depth = max_depth
+        self.nodes = {}
+        self.items = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def get_key(self, sphere):
+        """
+        Метод вычисления ключа узла для ограничивающей сферы.
+        :param sphere: Сфера (x, y, z, радиус).
+        :return tuple: Ключ узла (глубина, ix, iy, iz).
+        """
+        x, y, z, radius = (float(value) for value in sphere)
+        depth = self.max_depth
+        if radius > 0:
+            depth = min(self.max_depth, max(0, math.floor(math.log2(self.size / (2 * radius)))))
+        cells = 1 << depth
+        cell = self.size / cells
+        half = self.size / 2
+        return (depth, *(min(cells - 1, max(0, int((value + half) // cell))) for value in (x, y, z)))
+
+    def get_keys(self, spheres):
+        """
+        Метод вычисления ключей узлов для массива сфер за один векторный шаг.
+        :param numpy.ndarray spheres: Сферы размером (n, 4).
+        :return numpy.ndarray: Ключи узлов размером (n, 4).
+        """
+        radius = np.maximum(spheres[:, 3].astype('f8'), 1e-12)
+        depth = np.clip(np.floor(np.log2(self.size / (2 * radius))), 0, self.max_depth).astype(int)
+        cells = np.left_shift(1, depth)
+        cell = self.size / cells
+        index = ((spheres[:, :3].astype('f8') + self.size / 2) // cell[:, None]).astype(int)
+        index = np.clip(index, 0, (cells - 1)[:, None])
+        return np.column_stack([depth, index])
+
+    def get_node_box(self, key):
+        """
+        Метод вычисления расширенных границ узла.
+        :param tuple key: Ключ узла.
+        :return tuple: Центр (numpy.ndarray) и половина стороны расширенного куба.
+        """
+        depth, *index = key
+        cell = self.size / (1 << depth)
+        center = np.array(index, dtype='f4') * cell + cell / 2 - self.size / 2
+        return center, cell
+
+    def fits(self, sphere):
+        """
+        Метод проверки, помещается ли сфера в корневой узел.
+        :param sphere: Сфера (x, y, z, радиус).
+        :return bool: Помещается ли сфера.
+        """
+        half = self.size / 2
+        x, y, z, radius = (abs(float(value)) for value in sphere)
+        return max(x, y, z, radius) <= half
+
+    def insert(self, obj, sphere):
+        """
+        Метод добавления объекта в дерево.
+        :param obj: Объект сцены.
+        :param sphere: Ограничивающая сфера объекта (x, y, z, радиус).
+        """
+        sphere = np.asarray(sphere, dtype='f4')
+        if not self.fits(sphere):
+            self.grow(sphere)
+
+        key = self.get_key(sphere)
+        node = self.get_node(key)
+        node.objects.append(obj)
+        node.spheres = None
+        self.items[obj] = (sphere, key)
+
+    def get_node(self, key):
+        """
+        Метод получения узла по ключу с созданием недостающих узлов на пути к корню.
+        :param tuple key: Ключ узла.
+        :return OctreeNode: Узел дерева.
+        """
+        node = self.nodes.get(key)
+        if node is not None:
+            return node
+
+        node = self.nodes[key] = OctreeNode(key)
+        depth, x, y, z = key
+        if depth:
+            self.get_node((depth - 1, x >> 1, y >> 1, z >> 1)).children.add(key)
+        return node
+
+    def remove(self, obj):
+        """
+        Метод удаления объекта из дерева с удалением опустевших узлов.
+        :param obj: Объект сцены.
+        """
+        _, key = self.items.pop(obj)
+        node = self.nodes[key]
+        node.objects.remove(obj)
+        node.spheres = None
+
+        while not node.objects and not node.children and node.key[0]:
+            del self.nodes[node.key]
+            depth, x, y, z = node.key
+            node = self.nodes[(depth - 1, x >> 1, y >> 1, z >> 1)]
+            node.children.discard(key)
+            key = node.key
+
+    def update(self, obj, sphere):
+        """
+        Метод обновления ограничивающей сферы перемещенного объекта.
+        Объект переносится в другой узел, только если он покинул текущий.
+        :param obj: Объект сцены.
+        :param sphere: Новая ограничивающая сфера объекта.
+        """
+        sphere = np.asarray(sphere, dtype='f4')
+        _, key = self.items[obj]
+        if self.fits(sphere) and self.get_key(sphere) == key:
+            self.items[obj] = (sphere, key)
+            self.nodes[key].spheres = None
+            return
+        self.remove(obj)
+        self.insert(obj, sphere)
+
+    def update_many(self, objects, spheres):
+        """
+        Метод массового обновления сфер большого числа перемещенных объектов.
+        Если перемещено больше половины объектов, дерево перестраивается целиком.
+        :param list objects: Объекты сцены.
+        :param numpy.ndarray spheres: Новые сферы размером (n, 4).
+        """
+        if len(objects) * 2 < len(self.items):
+            for obj, sphere in zip(objects, spheres):
+                self.update(obj, sphere)
+            return
+        for obj, sphere in zip(objects, spheres):
+            self.items[obj] = (np.asarray(sphere, dtype='f4'), None)
+        self.rebuild()
+
+    def grow(self, sphere):
+        """
+        Метод увеличения корневой ячейки, пока в нее не поместится сфера.
+        :param numpy.ndarray sphere: Сфера, не поместившаяся в дерево.
+        """
+        while not self.fits(sphere):
+            self.size *= 4
+        self.rebuild()
+
+    def rebuild(self):
+        """
+        Метод полной перестройки дерева по текущим сферам объектов.
+        Ключи всех объектов вычисляются одним векторным шагом.
+        """
+        objects = list(self.items)
+        spheres = np.array([self.items[obj][0] for obj in objects], dtype='f4').reshape(-1, 4)
+        self.nodes = {}
+        self.items = {}
+        if not objects:
+            return
+
+        half = np.abs(spheres).max()
+        while half > self.size / 2:
+            self.size *= 2
+        self.place(objects, spheres)
+
+    def insert_many(self, objects, spheres):
+        """
+        Метод массового добавления объектов без перестройки дерева.
+        Дерево перестраивается целиком, только если сферы не помещаются в корневой узел.
+        :param list objects: Объекты сцены.
+        :param numpy.ndarray spheres: Ограничивающие сферы размером (n, 4).
+        """
+        spheres = np.asarray(spheres, dtype='f4').reshape(-1, 4)
+        if not len(spheres):
+            return
+        if np.abs(spheres).max() > self.size / 2:
+            for obj, sphere in zip(objects, spheres):
+                self.items[obj] = (sphere, None)
+            self.rebuild()
+            return
+        self.place(objects, spheres)
+
+    def place(self, objects, spheres):
+        """
+        Метод размещения объектов в узлах дерева: ключи вычисляются одним векторным шагом,
+        объекты одного узла добавляются в него вместе.
+        :param list objects: Объекты сцены.
+        :param numpy.ndarray spheres: Ограничивающие сферы размером (n, 4), помещающиеся в корень.
+        """
+        keys = self.get_keys(spheres)
+        codes = self.get_codes(keys)
+        order = np.argsort(codes, kind='stable')
+        starts = np.flatnonzero(np.diff(codes[order], prepend=-1))
+        bounds = np.append(starts, len(order)).tolist()
+        ordered = [objects[i] for i in order.tolist()]
+        self.add_nodes(keys[order[starts]])
+        nodes = self.nodes
+        for key, start, end in zip(map(tuple, keys[order[starts]].tolist()), bounds[:-1], bounds[1:]):
+            node = nodes[key]
+            node.objects.extend(ordered[start:end])
+            node.spheres = None
+        self.items.update(zip(objects, zip(spheres, map(tuple, keys.tolist()))))
+
+    def get_codes(self, keys):
+        """
+        Метод упаковки ключей узлов в целые числа (индексы ячеек меньше 2 ** max_depth).
+        :param numpy.ndarray keys: Ключи узлов размером (n, 4).
+        :return numpy.ndarray: Коды ключей размером (n,).
+        """
+        bits = self.max_depth
+        return (((keys[:, 0] << bits | keys[:, 1]) << bits | keys[:, 2]) << bits) | keys[:, 3]
+
+    def add_nodes(self, keys):
+        """
+        Метод создания недостающих узлов вместе с предками: по одному векторному шагу на уровень.
+        :param numpy.ndarray keys: Различные ключи узлов размером (n, 4).
+        """
+        nodes = self.nodes
+        listed = list(map(tuple, keys.tolist()))
+        missing = [i for i, key in enumerate(listed) if key not in nodes]
+        for i in missing:
+            nodes[listed[i]] = OctreeNode(listed[i])
+        keys = keys[missing]
+        keys = keys[keys[:, 0] > 0]
+        if not len(keys):
+            return
+
+        parents = np.column_stack([keys[:, 0] - 1, keys[:, 1:] >> 1])
+        self.add_nodes(parents[np.unique(self.get_codes(parents), return_index=True)[1]])
+        for key, parent in zip(map(tuple, keys.tolist()), map(tuple, parents.tolist())):
+            nodes[parent].children.add(key)
+
+    def traverse(self, test_node, test_spheres):
+        """
+        Метод обхода дерева с отсечением узлов.
+        :param test_node: Функция (центр, половина стороны) -> -1 вне, 0 пересекает, 1 внутри.
+        :param test_spheres: Функция (сферы) -> маска подходящих объектов.
+        :return list: Найденные объекты.
+        """
+        result = []
+        root = self.nodes.get((0, 0, 0, 0))
+        stack = [(root, False)] if root else []
+        while stack:
+            node, inside = stack.pop()
+            if not inside:
+                state = test_node(*self.get_node_box(node.key))
+                if state < 0:
+                    continue
+                inside = state > 0
+
+            if node.objects:
+                if inside:
+                    result.extend(node.objects)
+                else:
+                    mask = test_spheres(node.get_spheres(self.items))
+                    result.extend(obj for obj, hit in zip(node.objects, mask) if hit)
+            stack.extend((self.nodes[key], inside) for key in node.children)
+        return result
+
+    def query_frustum(self, m_clip):
+        """
+        Метод поиска объектов, пересекающих пирамиду видимости.
+        :param glm.mat4 m_clip: Матрица проекции, умноженная на матрицу вида.
+        :return list: Найденные объекты.
+        """
+        return self.query_planes(get_frustum_planes(m_clip))
+
+    def query_planes(self, planes):
+        """
+        Метод поиска объектов, пересекающих пирамиду видимости, заданную плоскостями.
+        Узлы вне пирамиды отбрасываются вместе с поддеревьями, а объекты узлов,
+        целиком лежащих внутри, не проверяются.
+        :param numpy.ndarray planes: Нормированные плоскости (a, b, c, d) размером (6, 4).
+        :return list: Найденные объекты.
+        """
+        normals, offsets = planes[:, :3], planes[:, 3]
+        extents = np.abs(normals).sum(axis=1)
+
+        def test_node(center, half):
+            dist = normals @ center + offsets
+            if np.any(dist < -half * extents):
+                return -1
+            return 1 if np.all(dist > half * extents) else 0
+
+        return self.traverse(test_node, lambda spheres: get_plane_mask(spheres, planes))
+
+    def query_radius(self, center, radius):
+        """
+        Метод поиска объектов, пересекающих сферу.
+        :param center: Центр сферы (x, y, z).
+        :param float radius: Радиус сферы.
+        :return list: Найденные объекты.
+        """
+        center = np.asarray(center, dtype='f4')
+
+        def test_node(node_center, half):
+            delta = np.abs(center - node_center)
+            if np.sum(np.maximum(delta - half, 0) ** 2) > radius ** 2:
+                return -1
+            far = np.sum((delta + half) ** 2)
+            return 1 if far <= radius ** 2 else 0
+
+        return self.traverse(test_node, lambda spheres: get_radius_mask(spheres, center, radius))
+
+    def query_ray(self, origin, direction, max_distance=np.inf):
+        """
+        Метод поиска объектов, ограничивающие сферы которых пересекает луч.
+        :param origin: Начало луча (x, y, z).
+        :param direction: Направление луча (x, y, z).
+        :param float max_distance: Максимальная длина луча.
+        :return list: Пары (расстояние, объект), отсортированные по расстоянию.
+        """
+        origin = np.asarray(origin, dtype='f4')
+        direction = np.asarray(direction, dtype='f4')
+        direction = direction / np.linalg.norm(direction)
+        with np.errstate(divide='ignore'):
+            inverse = 1.0 / direction
+
+        hits = []
+        root = self.nodes.get((0, 0, 0, 0))
+        stack = [root] if root else []
+        while stack:
+            node = stack.pop()
+            center, half = self.get_node_box(node.key)
+            with np.errstate(invalid='ignore'):
+                t1 = (center - half - origin) * inverse
+                t2 = (center + half - origin) * inverse
+            near = np.nanmax(np.minimum(t1, t2))
+            far = np.nanmin(np.maximum(t1, t2))
+            if near > far or far < 0 or near > max_distance:
+                continue
+
+            if node.objects:
+                t, mask = get_ray_hits(node.get_spheres(self.items), origin, direction, max_distance)
+                hits.extend((float(t[i]), node.objects[i]) for i in np.flatnonzero(mask))
+            stack.extend(self.nodes[key] for key in node.children)
+
+        hits.sort(key=lambda hit: hit[0])
+        return hits
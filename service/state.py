@@ -0,0 +1,81 @@
+class RenderState:
+    """
+    Класс представляющий кэш состояния OpenGL.
+    Запоминает последние записанные значения форм и привязанные текстуры,
+    чтобы пропускать повторную запись того же значения.
+    """
+    def __init__(self):
+        """
+        Метод инициализации кэша состояния.
+        """
+        self.uniforms = {}
+        self.textures = {}
+        self.stats = self.get_empty_stats()
+        self.frame_stats = self.get_empty_stats()
+
+    @staticmethod
+    def get_empty_stats():
+        """
+        Метод создания обнуленных счетчиков.
+        :return dict: Счетчики записей форм и привязок текстур.
+        """
+        return {
+            'uniform_writes': 0,
+            'uniform_skipped': 0,
+            'texture_binds': 0,
+            'texture_skipped': 0
+        }
+
+    def write(self, program, name, value):
+        """
+        Метод записи значения формы, если оно отличается от уже записанного.
+        :param moderngl.Program program: Шейдерная программа.
+        :param str name: Имя формы.
+        :param value: Значение glm или число.
+        :return bool: Была ли выполнена запись.
+        """
+        data = value if isinstance(value, (int, float)) else value.to_bytes()
+        key = (program.glo, name)
+        if self.uniforms.get(key) == data:
+            self.stats['uniform_skipped'] += 1
+            return False
+
+        if isinstance(data, bytes):
+            program[name].write(data)
+        else:
+            program[name].value = data
+        self.uniforms[key] = data
+        self.stats['uniform_writes'] += 1
+        return True
+
+    def use_texture(self, texture, location=0):
+        """
+        Метод привязки текстуры к текстурному блоку, если она еще не привязана.
+        :param texture: Текстура moderngl.
+        :param int location: Номер текстурного блока.
+        :return bool: Была ли выполнена привязка.
+        """
+        # текстуры разных типов привязываются к одному блоку независимо
+        key = (location, type(texture))
+        if self.textures.get(key) == texture.glo:
+            self.stats['texture_skipped'] += 1
+            return False
+
+        texture.use(location=location)
+        self.textures[key] = texture.glo
+        self.stats['texture_binds'] += 1
+        return True
+
+    def begin_frame(self):
+        """
+        Метод начала нового кадра: сохраняет счетчики прошлого кадра и обнуляет текущие.
+        """
+        self.frame_stats = self.stats
+        self.stats = self.get_empty_stats()
+
+    def invalidate(self):
+        """
+        Метод сброса кэша, когда состояние могло быть изменено в обход него.
+        """
+        self.uniforms.clear()
+        self.textures.clear()
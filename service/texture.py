@@ -1,75 +1,232 @@
 import pygame as pg
 import moderngl as mgl
+import numpy as np
+from service.assets import AssetLoader, AssetDict
+from service.texture_cache import load_texture
+from service.shadow import get_atlas_layout
 
 
 class Texture:
     """
     Класс представляющий работу с текстурами.
+    Текстуры загружаются лениво: изображение декодируется в пуле потоков
+    при первом запросе, а в видеопамять загружается в потоке контекста.
+    Декодированные изображения с готовыми уровнями детализации хранятся
+    в кэше рядом с исходными файлами и при следующих запусках отображаются в память.
     """
-    def __init__(self, app):
+    # грани текстуры куба в порядке OpenGL
+    cube_faces = ['right', 'left', 'top', 'bottom'] + ['front', 'back'][::-1]
+
+    def __init__(self, app, loader=None):
         """
         Метод инициализации объекта текстуры.
         :param GraphicsEngine app: Объект приложения.
+        :param AssetLoader loader: Загрузчик ресурсов.
         """
         self.app = app
         self.ctx = app.ctx
-        self.textures = {
-            0: self.get_texture(path='textures/img.png'),
-            1: self.get_texture(path='textures/img_1.png'),
-            2: self.get_texture(path='textures/img_2.png'),
-            'other_model': self.get_texture(path='textures/ball.png'),
-            'skybox': self.get_texture_cube(path='textures/skybox/', ext='png'),
-            'depth_texture': self.get_depth_texture()
+        self.loader = loader or AssetLoader()
+        self.paths = {
+            0: 'textures/img.png',
+            1: 'textures/img_1.png',
+            2: 'textures/img_2.png'
         }
+        # текстуры из paths можно собрать в текстурные массивы (get_arrays)
+        self.array_ids = set(self.paths)
+        # ключ текстурного массива -> {идентификатор текстуры: слой}
+        self.arrays = {}
+        self.textures = AssetDict(self.loader, 'texture', {
+            **{tex_id: self.get_source(path=path) for tex_id, path in self.paths.items()},
+            'other_model': self.get_source(path='textures/ball.png'),
+            'skybox': (lambda: self.get_texture_cube(path='textures/skybox/', ext='png'),
+                       self.upload_texture_cube),
+            'depth_texture': (None, lambda data: self.get_depth_texture())
+        })
+
+    def get_arrays(self, tex_ids):
+        """
+        Метод подготовки текстурных массивов для используемых текстур.
+        Текстуры группируются по исходному размеру, и для каждого размера,
+        общего хотя бы для двух текстур, описывается свой массив без масштабирования слоев.
+        Массив загружается при первом обращении к нему по ключу.
+        :param tex_ids: Идентификаторы текстур, используемых объектами.
+        :return dict: Идентификатор текстуры -> ключ текстурного массива с ней.
+        """
+        sizes = {}
+        for tex_id in sorted(self.array_ids.intersection(tex_ids)):
+            sizes.setdefault(self.get_image_size(self.paths[tex_id]), []).append(tex_id)
+
+        arrays = {}
+        for tex_ids in sizes.values():
+            if len(tex_ids) < 2:
+                continue
+            key = 'array:' + ','.join(map(str, tex_ids))
+            if key not in self.arrays:
+                self.arrays[key] = {tex_id: layer for layer, tex_id in enumerate(tex_ids)}
+                paths = [self.paths[tex_id] for tex_id in tex_ids]
+                self.textures.add(key, (lambda paths=paths: self.get_texture_array(paths),
+                                        self.upload_texture_array))
+            arrays.update(dict.fromkeys(tex_ids, key))
+        return arrays
+
+    def get_source(self, path):
+        """
+        Метод описания источника двумерной текстуры для ленивой загрузки.
+        :param str path: Путь к файлу изображения.
+        :return tuple: Функции декодирования и загрузки в видеопамять.
+        """
+        return lambda: self.get_texture(path), self.upload_texture
 
     def get_depth_texture(self):
         """
-        Создание текстуры глубины.
+        Создание текстуры глубины для карты теней.
+        Каскады теней располагаются в ней клетками размером SHADOW_SIZE (get_atlas_layout),
+        а если атлас больше GL_MAX_TEXTURE_SIZE, клетки уменьшаются.
         :return moderngl.Texture: Созданная текстура глубины.
         """
-        depth_texture = self.ctx.depth_texture(self.app.WIN_SIZE)
+        columns, rows, size = get_atlas_layout(self.app.SHADOW_SIZE, self.app.SHADOW_CASCADES,
+                                               self.ctx.info['GL_MAX_TEXTURE_SIZE'])
+        depth_texture = self.ctx.depth_texture((size * columns, size * rows))
         depth_texture.repeat_x = False
         depth_texture.repeat_y = False
         return depth_texture
 
-    def get_texture_cube(self, path, ext='png'):
+    @staticmethod
+    def decode_texture_cube(paths):
         """
-        Создание текстуры куба (SkyBox).
-        :param path: Путь к файлам текстур куба.
-        :param ext: Расширение файлов текстур.
-        :return moderngl.TextureCube: Созданная текстура куба.
+        Декодирование граней текстуры куба (SkyBox). Не обращается к OpenGL.
+        :param list paths: Пути к файлам граней в порядке граней OpenGL.
+        :return list: Изображения граней uint8 размером (h, w, 3).
         """
-        faces = ['right', 'left', 'top', 'bottom'] + ['front', 'back'][::-1]
-
-        textures = []
-        for face in faces:
-            texture = pg.image.load(path + f'{face}.{ext}').convert()
+        faces = []
+        for face, path in zip(Texture.cube_faces, paths):
+            texture = pg.image.load(path)
             if face in ['right', 'left', 'front', 'back']:
                 texture = pg.transform.flip(texture, flip_x=True, flip_y=False)
             else:
                 texture = pg.transform.flip(texture, flip_x=False, flip_y=True)
-            textures.append(texture)
+            faces.append(Texture.get_pixels(texture))
+        return faces
 
-        size = textures[0].get_size()
-        texture_cube = self.ctx.texture_cube(size=size, components=3, data=None)
+    def upload_texture_cube(self, data):
+        """
+        Создание текстуры куба (SkyBox) из подготовленных граней.
+        :param TextureData data: Данные граней текстуры куба.
+        :return moderngl.TextureCube: Созданная текстура куба.
+        """
+        texture_cube = self.ctx.texture_cube(size=data.size, components=data.components, data=None)
 
-        for i in range(6):
-            texture_data = pg.image.tostring(textures[i], 'RGB')
-            texture_cube.write(face=i, data=texture_data)
+        for i, face in enumerate(data.faces):
+            texture_cube.write(face=i, data=face[0])
 
         return texture_cube
 
-    def get_texture(self, path, anisotropy=32.0):
+    def get_texture_cube(self, path, ext='png'):
+        """
+        Загрузка подготовленной текстуры куба (SkyBox). Не обращается к OpenGL.
+        :param path: Путь к файлам текстур куба.
+        :param ext: Расширение файлов текстур.
+        :return TextureData: Данные граней текстуры куба.
+        """
+        paths = [path + f'{face}.{ext}' for face in self.cube_faces]
+        return load_texture(path + 'cube', paths, self.decode_texture_cube, mipmaps=False)
+
+    @staticmethod
+    def get_pixels(texture):
+        """
+        Метод получения пикселей поверхности pygame в виде массива.
+        :param pygame.Surface texture: Поверхность pygame.
+        :return numpy.ndarray: Изображение uint8 размером (h, w, 3).
+        """
+        width, height = texture.get_size()
+        return np.frombuffer(pg.image.tostring(texture, 'RGB'), dtype='u1').reshape(height, width, 3)
+
+    @staticmethod
+    def decode_texture(paths):
         """
-        Метод загрузки текстур из файлов.
+        Метод декодирования изображения в массив RGB. Не обращается к OpenGL.
+        :param list paths: Путь к файлу изображения (единственный).
+        :return list: Изображение uint8 размером (h, w, 3).
+        """
+        texture = pg.image.load(paths[0])
+        texture = pg.transform.flip(texture, flip_x=False, flip_y=True)
+        return [Texture.get_pixels(texture)]
+
+    def upload_texture(self, data, anisotropy=32.0):
+        """
+        Метод создания текстуры из подготовленных уровней детализации.
+        moderngl 5.10 не умеет выделять место под уровни без их построения:
+        context.texture создает только нулевой уровень, а write отказывается писать
+        в уровни выше max_level. Поэтому место выделяет build_mipmaps, который
+        строит цепочку на видеокарте, а затем уровни перезаписываются
+        готовыми из отображенного в память кэша.
+        :param TextureData data: Данные текстуры.
+        :param float anisotropy: Уровень анизотропной фильтрации для текстуры.
+        :return moderngl.Texture: Созданная текстура.
+        """
+        levels = data.faces[0]
+        texture = self.ctx.texture(size=data.size, components=data.components, data=levels[0])
+        texture.filter = (mgl.LINEAR_MIPMAP_LINEAR, mgl.LINEAR)
+        texture.build_mipmaps(max_level=len(levels) - 1)
+        for level, pixels in enumerate(levels[1:], start=1):
+            texture.write(pixels, level=level)
+        texture.anisotropy = anisotropy
+        return texture
+
+    def get_texture(self, path):
+        """
+        Метод загрузки подготовленной текстуры из файла. Не обращается к OpenGL.
         :param str path: Путь к файлу изображения.
+        :return TextureData: Данные текстуры с уровнями детализации.
+        """
+        return load_texture(path, [path], self.decode_texture)
+
+    @staticmethod
+    def get_image_size(path):
+        """
+        Метод получения размера изображения без декодирования.
+        Размер PNG читается из заголовка, остальные форматы загружаются целиком.
+        :param str path: Путь к файлу изображения.
+        :return tuple: Размер (ширина, высота).
+        """
+        with open(path, 'rb') as file:
+            header = file.read(24)
+        if header[:8] == b'\x89PNG\r\n\x1a\n':
+            return tuple(map(int, np.frombuffer(header[16:24], dtype='>u4')))
+        return pg.image.load(path).get_size()
+
+    @staticmethod
+    def decode_texture_array(paths):
+        """
+        Метод декодирования слоев текстурного массива. Не обращается к OpenGL.
+        :param list paths: Пути к файлам слоев одного размера.
+        :return list: Изображения слоев uint8 размером (h, w, 3).
+        """
+        return [Texture.decode_texture([path])[0] for path in paths]
+
+    def get_texture_array(self, paths):
+        """
+        Метод загрузки подготовленного текстурного массива. Не обращается к OpenGL.
+        :param list paths: Пути к файлам слоев одного размера.
+        :return TextureData: Данные слоев.
+        """
+        folder = paths[0].rsplit('/', 1)[0]
+        names = [path.rsplit('/', 1)[-1].rsplit('.', 1)[0] for path in paths]
+        return load_texture(f'{folder}/array_{"_".join(names)}', paths, self.decode_texture_array,
+                            mipmaps=False)
+
+    def upload_texture_array(self, data, anisotropy=32.0):
+        """
+        Метод создания текстурного массива (sampler2DArray) из подготовленных слоев.
+        В moderngl 5.10 TextureArray.write пишет только нулевой уровень, поэтому
+        уровни детализации массива не кэшируются, а строятся на видеокарте.
+        :param TextureData data: Данные слоев.
         :param float anisotropy: Уровень анизотропной фильтрации для текстуры.
-        :return moderngl.Program: Скомпилированная текстура.
+        :return moderngl.TextureArray: Созданный текстурный массив.
         """
-        texture = pg.image.load(path).convert()
-        texture = pg.transform.flip(texture, flip_x=False, flip_y=True)
-        texture = self.ctx.texture(size=texture.get_size(), components=3,
-                                   data=pg.image.tostring(texture, 'RGB'))
+        texture = self.ctx.texture_array(size=(*data.size, len(data.faces)),
+                                         components=data.components,
+                                         data=np.stack([face[0] for face in data.faces]))
         texture.filter = (mgl.LINEAR_MIPMAP_LINEAR, mgl.LINEAR)
         texture.build_mipmaps()
         texture.anisotropy = anisotropy
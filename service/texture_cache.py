@@ -0,0 +1,174 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+CACHE_DIR = '.cache'
+CACHE_MAGIC = b'TEXC'
+CACHE_VERSION = 1
+
+
+class TextureData:
+    """
+    Класс представляющий подготовленные данные текстуры.
+    Для каждой грани (одна у двумерной текстуры, шесть у текстуры куба)
+    хранится цепочка уровней детализации, от исходного размера до 1x1.
+    Изображения уже перевернуты для OpenGL, строки идут без выравнивания.
+    """
+    def __init__(self, faces):
+        """
+        Метод инициализации данных текстуры.
+        :param list faces: Грани - списки уровней numpy.ndarray размером (h, w, components).
+        """
+        self.faces = faces
+
+    @property
+    def size(self):
+        height, width = self.faces[0][0].shape[:2]
+        return width, height
+
+    @property
+    def components(self):
+        return self.faces[0][0].shape[2]
+
+    @property
+    def levels(self):
+        return len(self.faces[0])
+
+
+def get_mip_chain(pixels):
+    """
+    Функция построения цепочки уровней детализации усреднением блоков 2x2.
+    Размер следующего уровня округляется вниз, как в OpenGL; у нечетной
+    стороны последняя строка (столбец) отбрасывается.
+    :param numpy.ndarray pixels: Изображение uint8 размером (h, w, components).
+    :return list: Уровни от исходного изображения до 1x1.
+    """
+    levels = [pixels]
+    while max(pixels.shape[:2]) > 1:
+        height, width = pixels.shape[:2]
+        # по стороне, уже равной 1, усреднение не выполняется
+        rows = np.arange(max(1, height // 2) * 2) if height > 1 else np.zeros(2, dtype=int)
+        cols = np.arange(max(1, width // 2) * 2) if width > 1 else np.zeros(2, dtype=int)
+        block = pixels[rows][:, cols].astype('u2')
+        pixels = ((block[0::2, 0::2] + block[1::2, 0::2] + block[0::2, 1::2] + block[1::2, 1::2]
+                   + 2) >> 2).astype('u1')
+        levels.append(pixels)
+    return levels
+
+
+def get_files_hash(paths):
+    """
+    Функция вычисления общего хэша содержимого нескольких файлов.
+    :param list paths: Пути к файлам.
+    :return str: Хэш SHA-1 в шестнадцатеричном виде.
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def get_cache_path(name, digest):
+    """
+    Функция получения пути к файлу кэша для версии формата и хэша исходных файлов.
+    :param str name: Путь к исходной текстуре (для текстуры куба - условное имя в ее папке).
+    :param str digest: Хэш исходных файлов.
+    :return str: Путь к файлу кэша.
+    """
+    folder, name = os.path.split(name)
+    return os.path.join(folder, CACHE_DIR, f'{name}.{digest[:16]}.v{CACHE_VERSION}.tex')
+
+
+def write_cache(cache_path, data):
+    """
+    Функция записи подготовленной текстуры в бинарный кэш.
+    Формат: сигнатура, версия, длина заголовка, заголовок JSON
+    и уровни всех граней подряд, каждый выровнен по 16 байтам.
+    :param str cache_path: Путь к файлу кэша.
+    :param TextureData data: Данные текстуры.
+    """
+    folder = os.path.dirname(cache_path)
+    os.makedirs(folder, exist_ok=True)
+
+    # удаление кэшей прежних версий того же файла
+    prefix = os.path.basename(cache_path).rsplit('.', 3)[0] + '.'
+    for name in os.listdir(folder):
+        if name.startswith(prefix) and name.endswith('.tex'):
+            os.remove(os.path.join(folder, name))
+
+    offsets, offset = [], 0
+    for face in data.faces:
+        for level in face:
+            offsets.append(offset)
+            offset += level.nbytes + (-level.nbytes % 16)
+
+    header = json.dumps({'faces': len(data.faces), 'components': data.components,
+                         'sizes': [list(level.shape[1::-1]) for level in data.faces[0]],
+                         'offsets': offsets}).encode()
+    header += b' ' * (-(12 + len(header)) % 16)
+
+    temp_path = cache_path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(CACHE_MAGIC)
+        file.write(np.array([CACHE_VERSION, len(header)], dtype='<u4').tobytes())
+        file.write(header)
+        for face in data.faces:
+            for level in face:
+                file.write(np.ascontiguousarray(level, dtype='u1').tobytes())
+                file.write(b'\0' * (-level.nbytes % 16))
+    os.replace(temp_path, cache_path)
+
+
+def read_cache(cache_path):
+    """
+    Функция отображения бинарного кэша текстуры в память без копирования.
+    :param str cache_path: Путь к файлу кэша.
+    :return TextureData: Данные текстуры или None, если кэш отсутствует или устарел.
+    """
+    if not os.path.exists(cache_path):
+        return None
+
+    with open(cache_path, 'rb') as file:
+        magic = file.read(4)
+        version, size = np.frombuffer(file.read(8), dtype='<u4')
+        if magic != CACHE_MAGIC or version != CACHE_VERSION:
+            return None
+        header = json.loads(file.read(size))
+
+    start = 12 + size
+    components, sizes, offsets = header['components'], header['sizes'], iter(header['offsets'])
+    faces = [[np.memmap(cache_path, dtype='u1', mode='r', offset=start + next(offsets),
+                        shape=(height, width, components)) for width, height in sizes]
+             for _ in range(header['faces'])]
+    return TextureData(faces)
+
+
+def load_texture(name, paths, decode, mipmaps=True, cache=True):
+    """
+    Функция загрузки текстуры через бинарный кэш.
+    При первом запуске изображения декодируются, для них строятся уровни
+    детализации, и результат сохраняется в кэш рядом с исходными файлами;
+    при следующих запусках кэш отображается в память.
+    Кэш сбрасывается при изменении содержимого исходных файлов.
+    :param str name: Путь к исходной текстуре (для текстуры куба - условное имя в ее папке).
+    :param list paths: Пути к исходным файлам граней.
+    :param decode: Функция (пути) -> список изображений uint8 размером (h, w, components).
+    :param bool mipmaps: Строить ли уровни детализации.
+    :param bool cache: Использовать ли кэш.
+    :return TextureData: Данные текстуры.
+    """
+    def prepare():
+        return TextureData([get_mip_chain(pixels) if mipmaps else [pixels]
+                            for pixels in decode(paths)])
+
+    if not cache:
+        return prepare()
+
+    cache_path = get_cache_path(name, get_files_hash(paths))
+    data = read_cache(cache_path)
+    if data is None:
+        write_cache(cache_path, prepare())
+        data = read_cache(cache_path)
+    return data
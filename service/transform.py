@@ -0,0 +1,310 @@
+import glm
+import numpy as np
+
+
+def get_local_matrices(position, rotation, scale):
+    """
+    Функция векторного вычисления локальных матриц преобразования
+    translate * rotate_z * rotate_y * rotate_x * scale (как в glm).
+    :param numpy.ndarray position: Позиции размером (n, 3).
+    :param numpy.ndarray rotation: Углы поворота по осям (x, y, z) в радианах размером (n, 3).
+    :param numpy.ndarray scale: Масштабы по осям размером (n, 3).
+    :return numpy.ndarray: Матрицы размером (n, 4, 4) по столбцам (транспонированные).
+    """
+    position, rotation, scale = (np.asarray(value, dtype='f8') for value in
+                                 (position, rotation, scale))
+    cx, cy, cz = np.cos(rotation).T
+    sx, sy, sz = np.sin(rotation).T
+
+    # столбцы матрицы поворота Rz * Ry * Rx
+    matrices = np.zeros((len(position), 4, 4))
+    matrices[:, 0, :3] = np.column_stack([cz * cy, sz * cy, -sy])
+    matrices[:, 1, :3] = np.column_stack([cz * sy * sx - sz * cx, sz * sy * sx + cz * cx, cy * sx])
+    matrices[:, 2, :3] = np.column_stack([cz * sy * cx + sz * sx, sz * sy * cx - cz * sx, cy * cx])
+    matrices[:, :3, :3] *= scale[:, :, None]
+    matrices[:, 3, :3] = position
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+def get_normal_matrices(matrices):
+    """
+    Функция векторного вычисления матриц нормалей (обратных транспонированных
+    к верхней левой части 3x3 матриц моделей) через алгебраические дополнения.
+    Для вырожденной матрицы берется матрица дополнений: нормали все равно нормируются.
+    :param numpy.ndarray matrices: Матрицы моделей размером (n, 16) по столбцам.
+    :return numpy.ndarray: Матрицы нормалей размером (n, 9) по столбцам.
+    """
+    m = np.asarray(matrices, dtype='f8').reshape(-1, 4, 4)
+    a, b, c = m[:, 0, :3], m[:, 1, :3], m[:, 2, :3]
+    cofactors = np.stack([np.cross(b, c), np.cross(c, a), np.cross(a, b)], axis=1)
+    det = (a * cofactors[:, 0]).sum(axis=1)
+    det = np.where(np.abs(det) > 1e-12, det, 1.0)
+    return (cofactors / det[:, None, None]).reshape(-1, 9).astype('f4')
+
+
+class TransformStore:
+    """
+    Класс представляющий общее хранилище преобразований объектов сцены (structure of arrays).
+    Позиции, углы поворота и масштабы всех объектов лежат в непрерывных массивах
+    (записи удаленных объектов занимают новые объекты), изменение помечает запись
+    устаревшей, а матрицы всех устаревших записей и их потомков пересчитываются
+    одним векторным шагом в update.
+    Мировые матрицы и матрицы нормалей хранятся по столбцам во float32, как glm.mat4
+    и glm.mat3, поэтому выборка строк массивов сразу загружается в буфер экземпляров
+    или форм, и шейдерам не нужно обращать матрицы для каждой вершины.
+    """
+    def __init__(self, capacity=256):
+        """
+        Метод инициализации хранилища преобразований.
+        :param int capacity: Начальная вместимость массивов.
+        """
+        self.count = 0
+        self.position = np.zeros((capacity, 3), dtype='f4')
+        self.rotation = np.zeros((capacity, 3), dtype='f4')
+        self.scale = np.ones((capacity, 3), dtype='f4')
+        self.parent = np.full(capacity, -1, dtype=np.int32)
+        self.dirty = np.zeros(capacity, dtype=bool)
+        self.matrices = np.zeros((capacity, 16), dtype='f4')
+        self.normals = np.zeros((capacity, 9), dtype='f4')
+        self.owners = [None] * capacity
+        # освобожденные записи, которые займут следующие объекты
+        self.free = []
+        # записи по уровням иерархии (корни на уровне 0) или None, если иерархии нет
+        self.levels = None
+        self.changed = []
+        # есть ли устаревшие записи
+        self.pending = False
+        self.version = 0
+        self.stats = {'updated': 0}
+
+    def resize(self, capacity):
+        """
+        Метод увеличения вместимости массивов.
+        :param int capacity: Новая вместимость.
+        """
+        count = self.count
+        for name, fill in (('position', 0), ('rotation', 0), ('scale', 1), ('parent', -1),
+                           ('dirty', False), ('matrices', 0), ('normals', 0)):
+            old = getattr(self, name)
+            new = np.full((capacity, *old.shape[1:]), fill, dtype=old.dtype)
+            new[:count] = old[:count]
+            setattr(self, name, new)
+        self.owners.extend([None] * (capacity - len(self.owners)))
+
+    def add(self, position=(0, 0, 0), rotation=(0, 0, 0), scale=(1, 1, 1), owner=None):
+        """
+        Метод добавления записи преобразования.
+        :param position: Позиция (x, y, z).
+        :param rotation: Углы поворота по осям (x, y, z) в радианах.
+        :param scale: Масштаб по осям (x, y, z).
+        :param owner: Объект, которому принадлежит запись.
+        :return int: Номер записи.
+        """
+        if self.free:
+            # освобожденная запись уже лежит на нулевом уровне иерархии
+            index = self.free.pop()
+        else:
+            if self.count == len(self.dirty):
+                self.resize(len(self.dirty) * 2)
+            index = self.count
+            self.count += 1
+            if self.levels is not None:
+                self.levels[0] = np.append(self.levels[0], index)
+        self.position[index] = position
+        self.rotation[index] = rotation
+        self.scale[index] = scale
+        self.parent[index] = -1
+        self.owners[index] = owner
+        self.dirty[index] = True
+        self.pending = True
+        self.version += 1
+        return index
+
+    def remove(self, index):
+        """
+        Метод освобождения записи удаленного объекта.
+        Запись больше не пересчитывается и не держит объект-владелец,
+        а ее номер займет следующий добавленный объект. Потомки записи
+        открепляются от нее.
+        :param int index: Номер записи.
+        """
+        children = np.flatnonzero(self.parent[:self.count] == index)
+        self.parent[children] = -1
+        self.dirty[children] = True
+        self.pending = self.pending or len(children) > 0
+        self.position[index] = 0
+        self.rotation[index] = 0
+        self.scale[index] = 1
+        self.owners[index] = None
+        self.dirty[index] = False
+        if self.parent[index] >= 0 or len(children):
+            self.parent[index] = -1
+            self.levels = self.get_levels()
+        self.free.append(index)
+        self.version += 1
+
+    def add_many(self, position, rotation, scale):
+        """
+        Метод добавления многих записей одним шагом (без объектов-владельцев).
+        :param numpy.ndarray position: Позиции размером (n, 3).
+        :param numpy.ndarray rotation: Углы поворота в радианах размером (n, 3).
+        :param numpy.ndarray scale: Масштабы размером (n, 3).
+        :return numpy.ndarray: Номера добавленных записей (идут подряд).
+        """
+        count = len(position)
+        if self.count + count > len(self.dirty):
+            self.resize(max(len(self.dirty) * 2, 1 << (self.count + count - 1).bit_length()))
+        indices = np.arange(self.count, self.count + count)
+        self.count += count
+        self.position[indices] = position
+        self.rotation[indices] = rotation
+        self.scale[indices] = scale
+        self.parent[indices] = -1
+        self.dirty[indices] = True
+        self.pending = True
+        if self.levels is not None:
+            self.levels[0] = np.concatenate([self.levels[0], indices])
+        self.version += 1
+        return indices
+
+    def set(self, indices, position=None, rotation=None, scale=None):
+        """
+        Метод изменения преобразований одной или многих записей.
+        Матрицы пересчитываются при очередном вызове update.
+        :param indices: Номер записи или массив номеров.
+        :param position: Позиции (x, y, z) или массив размером (n, 3).
+        :param rotation: Углы поворота в радианах или массив размером (n, 3).
+        :param scale: Масштабы или массив размером (n, 3).
+        """
+        if position is not None:
+            self.position[indices] = position
+        if rotation is not None:
+            self.rotation[indices] = rotation
+        if scale is not None:
+            self.scale[indices] = scale
+        self.dirty[indices] = True
+        self.pending = True
+        self.version += 1
+
+    def set_parent(self, index, parent=-1):
+        """
+        Метод прикрепления записи к родителю: ее матрица становится локальной
+        относительно мировой матрицы родителя.
+        :param int index: Номер записи.
+        :param int parent: Номер родителя или -1, чтобы открепить запись.
+        """
+        node = parent
+        while node >= 0:
+            if node == index:
+                raise ValueError('Transform hierarchy cannot contain cycles')
+            node = self.parent[node]
+        self.parent[index] = parent
+        self.dirty[index] = True
+        self.pending = True
+        self.levels = self.get_levels()
+        self.version += 1
+
+    def get_levels(self):
+        """
+        Метод разбиения записей по уровням иерархии.
+        :return list: Массивы номеров записей уровней 0, 1, ... или None без иерархии.
+        """
+        parent = self.parent[:self.count]
+        if not (parent >= 0).any():
+            return None
+        depth = np.zeros(self.count, dtype=int)
+        linked = parent >= 0
+        while True:
+            new_depth = np.where(linked, depth[parent] + 1, 0)
+            if np.array_equal(new_depth, depth):
+                break
+            depth = new_depth
+        return [np.flatnonzero(depth == level) for level in range(depth.max() + 1)]
+
+    def update(self):
+        """
+        Метод пересчета мировых матриц устаревших записей и их потомков.
+        Родители пересчитываются раньше потомков: по одному векторному шагу на уровень иерархии.
+        :return numpy.ndarray: Номера пересчитанных записей.
+        """
+        if not self.pending:
+            return np.zeros(0, dtype=int)
+        dirty = self.dirty[:self.count]
+        if self.levels is not None:
+            for level in self.levels[1:]:
+                dirty[level] |= dirty[self.parent[level]]
+
+        indices = np.flatnonzero(dirty)
+        local = get_local_matrices(self.position[indices], self.rotation[indices],
+                                   self.scale[indices])
+        if self.levels is None:
+            self.matrices[indices] = local.reshape(-1, 16)
+        else:
+            slots = np.full(self.count, -1)
+            slots[indices] = np.arange(len(indices))
+            for level in self.levels:
+                level = level[dirty[level]]
+                parent = self.parent[level]
+                matrices = local[slots[level]]
+                linked = parent >= 0
+                # по столбцам: (P * L)^T = L^T * P^T
+                matrices[linked] = matrices[linked] @ \
+                    self.matrices[parent[linked]].reshape(-1, 4, 4).astype('f8')
+                self.matrices[level] = matrices.reshape(-1, 16)
+
+        self.normals[indices] = get_normal_matrices(self.matrices[indices])
+        dirty[:] = False
+        self.pending = False
+        self.changed.append(indices)
+        self.stats['updated'] += len(indices)
+        return indices
+
+    def take_changed(self):
+        """
+        Метод получения номеров записей, пересчитанных после прошлого вызова, с очисткой списка.
+        :return numpy.ndarray: Номера записей без повторов.
+        """
+        self.update()
+        changed = np.unique(np.concatenate(self.changed)) if self.changed else \
+            np.zeros(0, dtype=int)
+        self.changed = []
+        return changed
+
+    def get_matrices(self, indices):
+        """
+        Метод получения мировых матриц записей для загрузки в буфер.
+        :param indices: Массив номеров записей.
+        :return numpy.ndarray: Матрицы размером (n, 16) по столбцам.
+        """
+        self.update()
+        return self.matrices[indices]
+
+    def get_normal_matrices(self, indices):
+        """
+        Метод получения матриц нормалей записей для загрузки в буфер.
+        :param indices: Массив номеров записей.
+        :return numpy.ndarray: Матрицы размером (n, 9) по столбцам.
+        """
+        self.update()
+        return self.normals[indices]
+
+    def get_matrix(self, index):
+        """
+        Метод получения мировой матрицы одной записи.
+        :param int index: Номер записи.
+        :return glm.mat4: Матрица модели.
+        """
+        if self.pending:
+            self.update()
+        return glm.mat4(*self.matrices[index].tolist())
+
+    def get_normal_matrix(self, index):
+        """
+        Метод получения матрицы нормалей одной записи.
+        :param int index: Номер записи.
+        :return glm.mat3: Матрица нормалей.
+        """
+        if self.pending:
+            self.update()
+        return glm.mat3(*self.normals[index].tolist())
@@ -0,0 +1,75 @@
+from service.shadow import MAX_CASCADES
+
+
+class FrameUniforms:
+    """
+    Класс представляющий блок форм (UBO) с данными, общими для всего кадра.
+    Матрицы камеры и параметры света загружаются в него один раз за кадр,
+    а не записываются в шейдер отдельно для каждого объекта.
+    """
+    name = 'FrameData'
+    binding = 0
+
+    def __init__(self, app, shadow_map, light_grid):
+        """
+        Метод инициализации блока форм кадра.
+        :param GraphicsEngine app: Объект приложения.
+        :param ShadowMap shadow_map: Карта теней с матрицами каскадов.
+        :param LightGrid light_grid: Кластерное освещение точечными источниками.
+        """
+        self.app = app
+        self.ctx = app.ctx
+        self.shadow_map = shadow_map
+        self.light_grid = light_grid
+        self.buffer = self.ctx.buffer(reserve=self.get_size())
+        self.buffer.bind_to_uniform_block(self.binding)
+
+    @staticmethod
+    def get_size():
+        """
+        Метод вычисления размера блока по правилам выравнивания std140.
+        :return int: Размер блока в байтах.
+        """
+        # 4 * mat4 + camPos (vec3 -> 16) + Light (4 * vec3 -> 4 * 16)
+        # + матрицы каскадов теней + границы каскадов (vec4) + параметры теней (vec4)
+        # + параметры сетки кластеров освещения (2 * vec4)
+        return 4 * 64 + 16 + 4 * 16 + MAX_CASCADES * 64 + 16 + 16 + 2 * 16
+
+    @staticmethod
+    def pad(vec):
+        """
+        Метод выравнивания vec3 до 16 байт по правилам std140.
+        :param glm.vec3 vec: Вектор.
+        :return bytes: Данные вектора с выравниванием.
+        """
+        return vec.to_bytes() + bytes(4)
+
+    def get_data(self):
+        """
+        Метод сборки данных блока из камеры, источника света, карты теней и сетки кластеров.
+        :return bytes: Данные блока в формате std140.
+        """
+        camera, light, pad = self.app.camera, self.app.light, self.pad
+        return b''.join([
+            camera.m_proj.to_bytes(),
+            camera.m_view.to_bytes(),
+            (camera.m_proj * camera.m_view).to_bytes(),
+            light.m_view_light.to_bytes(),
+            pad(camera.position),
+            pad(light.position), pad(light.Ia), pad(light.Id), pad(light.Is),
+            self.shadow_map.get_data(),
+            self.light_grid.get_data()
+        ])
+
+    def update(self):
+        """
+        Метод загрузки данных кадра в буфер и привязки его к точке блока форм.
+        """
+        self.buffer.write(self.get_data())
+        self.buffer.bind_to_uniform_block(self.binding)
+
+    def destroy(self):
+        """
+        Метод уничтожения объекта путем освобождения связанных ресурсов.
+        """
+        self.buffer.release()
@@ -1,51 +1,120 @@
 from service.vbo import VBO
 from service.shader import ShaderProgram
+from service.assets import AssetDict
+from service.lod import get_lod_name
 
 
 class VAO:
     """
     Класс представляющий работу с объектами массива вершин (VAO).
     """
-    def __init__(self, ctx):
+    def __init__(self, ctx, loader=None, defines=None):
         """
         Метод инициализации объекта массива вершин (VAO).
+        VAO создается при первом обращении, после загрузки своего буфера вершин.
         :param moderngl.Context ctx: Контекст moderngl.
+        :param AssetLoader loader: Загрузчик ресурсов.
+        :param dict defines: Определения, общие для всех шейдеров.
         """
         self.ctx = ctx
-        self.vbo = VBO(ctx)
-        self.program = ShaderProgram(ctx)
-        self.vaos = {
-            'cube': self.get_vao(
-                program=self.program.programs['default'],
-                vbo=self.vbo.vbos['cube']
-            ),
-            'shadow_cube': self.get_vao(
-                program=self.program.programs['shadow_map'],
-                vbo=self.vbo.vbos['cube']
-            ),
-            'skybox': self.get_vao(
-                program=self.program.programs['skybox'],
-                vbo=self.vbo.vbos['skybox']
-            ),
-            'other_model': self.get_vao(
-                program=self.program.programs['default'],
-                vbo=self.vbo.vbos['other_model']
-            ),
-            'shadow_other_model': self.get_vao(
-                program=self.program.programs['shadow_map'],
-                vbo=self.vbo.vbos['other_model']
-            )
+        self.vbo = VBO(ctx, loader)
+        self.program = ShaderProgram(ctx, self.vbo.loader, defines)
+        # имя VAO -> (шейдерная программа, буфер вершин)
+        self.layouts = {
+            'cube': ('default', 'cube'),
+            'shadow_cube': ('shadow_map', 'cube'),
+            'skybox': ('skybox', 'skybox'),
+            'other_model': ('default', 'other_model'),
+            'shadow_other_model': ('shadow_map', 'other_model'),
+            # VAO предварительного прохода глубины создаются, только если он включен
+            'depth_cube': ('depth_prepass', 'cube'),
+            'depth_other_model': ('depth_prepass', 'other_model')
         }
+        # VAO уровней детализации с той же программой и упрощенным мешем
+        for name, (program_name, vbo_name) in list(self.layouts.items()):
+            for level in range(1, self.vbo.lods.get(vbo_name, 0) + 1):
+                self.layouts[get_lod_name(name, level)] = (program_name,
+                                                           get_lod_name(vbo_name, level))
+        self.vaos = AssetDict(self.vbo.loader, 'vao', {
+            name: self.get_source(*layout) for name, layout in self.layouts.items()
+        })
 
-    def get_vao(self, program, vbo):
+    def get_source(self, program_name, vbo_name):
+        """
+        Метод описания источника VAO для ленивой загрузки.
+        Вариант программы выбирается по формату вершин буфера.
+        :param str program_name: Имя шейдерной программы.
+        :param str vbo_name: Имя буфера вершин.
+        :return tuple: Функция декодирования (нет) и функция создания VAO.
+        """
+        def upload(data):
+            vbo = self.vbo.vbos[vbo_name]
+            return self.get_vao(program=self.program.get_variant(program_name,
+                                                                 **vbo.layout.defines),
+                                vbo=vbo)
+
+        return None, upload
+
+    def request(self, name):
+        """
+        Метод запуска фонового разбора меша, нужного VAO, без ожидания.
+        Уровни детализации запрашиваются отдельно, когда их впервые выбирает get_ready_level.
+        :param str name: Имя VAO.
+        """
+        self.vbo.vbos.request(self.layouts[name][1])
+
+    def get_ready_level(self, lod_names, level):
+        """
+        Метод выбора уровня детализации, меш которого уже загружен.
+        Разбор меша желаемого уровня запускается при первом выборе, а пока он идет,
+        берется ближайший более детальный готовый уровень.
+        :param list lod_names: Имена VAO уровней детализации (get_lod_names).
+        :param int level: Желаемый уровень детализации.
+        :return int: Готовый уровень.
+        """
+        level = min(level, len(lod_names) - 1)
+        if level:
+            self.request(lod_names[level])
+        for level in range(level, 0, -1):
+            if self.is_ready(lod_names[level]):
+                return level
+        return 0
+
+    def get_lod_names(self, name):
+        """
+        Метод получения имен VAO всех уровней детализации.
+        :param str name: Имя VAO исходного меша.
+        :return list: Имена VAO уровней 0, 1, ...
+        """
+        levels = self.vbo.lods.get(self.layouts[name][1], 0)
+        return [get_lod_name(name, level) for level in range(levels + 1)]
+
+    def is_ready(self, name):
+        """
+        Метод проверки, что буфер вершин VAO уже загружен и VAO можно создать без ожидания.
+        :param str name: Имя VAO.
+        :return bool: Загружен ли буфер вершин.
+        """
+        return self.vbo.vbos.is_loaded(self.layouts[name][1])
+
+    def get_vao(self, program, vbo, instance_buffer=None, instance_format='16f/i',
+                instance_attribs=('in_instance_model',)):
         """
         Метод создания объекта массива вершин на основе заданных шейдеров и буфера вершин.
+        Формат вершин буфера сохраняется в vao.extra для записи форм перед отрисовкой.
         :param moderngl.Program program: Скомпилированный шейдер.
         :param vbo: Буфер вершин.
+        :param moderngl.Buffer instance_buffer: Буфер данных экземпляров для инстансинга.
+        :param str instance_format: Формат буфера экземпляров.
+        :param tuple instance_attribs: Атрибуты буфера экземпляров.
         :return moderngl.VertexArray: Созданный объект массива вершин.
         """
-        vao = self.ctx.vertex_array(program, [(vbo.vbo, vbo.format, *vbo.attribs)],
-                                    skip_errors=True)
+        content = [(vbo.vbo, vbo.format, *vbo.attribs)]
+        if instance_buffer is not None:
+            content.append((instance_buffer, instance_format, *instance_attribs))
+        vao = self.ctx.vertex_array(program, content, index_buffer=vbo.ibo,
+                                    index_element_size=4, skip_errors=True)
+        vao.extra = vbo.layout
         return vao
 
     def destroy(self):
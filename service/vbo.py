@@ -1,21 +1,59 @@
 import numpy as np
-import pywavefront
+from service.culling import Bounds
+from service.geometry import build_indexed, get_index_stats
+from service.assets import AssetLoader, AssetDict
+from service.lod import LOD_RATIOS, load_lod, get_lod_name
+from service.vertex_format import VertexLayout
 
 
 class VBO:
     """
     Класс представляющий работу с буфером вершин (VBO).
     """
-    def __init__(self, ctx):
+    def __init__(self, ctx, loader=None):
         """
         Метод инициализации объекта буфера вершин (VBO).
+        Меши разбираются в пуле потоков при первом запросе.
         :param moderngl.Context ctx: Контекст moderngl.
+        :param AssetLoader loader: Загрузчик ресурсов.
         """
-        self.vbos = {
-            'cube': CubeVBO(ctx),
-            'skybox': SkyBoxVBO(ctx),
-            'other_model': OtherModelVBO(ctx)
-        }
+        self.ctx = ctx
+        self.loader = loader or AssetLoader()
+        # имя меша -> число упрощенных уровней детализации
+        self.lods = {'other_model': len(LOD_RATIOS)}
+        self.vbos = AssetDict(self.loader, 'vbo', {
+            'cube': self.get_source(CubeVBO),
+            'skybox': self.get_source(SkyBoxVBO),
+            'other_model': self.get_source(OtherModelVBO),
+            **{get_lod_name('other_model', level): self.get_source(OtherModelVBO, level=level)
+               for level in range(1, self.lods['other_model'] + 1)}
+        })
+
+    def get_source(self, vbo_class, **kwargs):
+        """
+        Метод описания источника буфера вершин для ленивой загрузки.
+        :param type vbo_class: Класс буфера вершин.
+        :param kwargs: Параметры буфера вершин (например, уровень детализации).
+        :return tuple: Функции разбора меша и загрузки в видеопамять.
+        """
+        return lambda: vbo_class(self.ctx, upload=False, **kwargs), self.upload
+
+    @staticmethod
+    def upload(vbo):
+        """
+        Метод загрузки разобранного меша в видеопамять.
+        :param BaseVBO vbo: Буфер вершин с данными в памяти.
+        :return BaseVBO: Буфер вершин, загруженный в видеопамять.
+        """
+        vbo.vbo = vbo.get_vbo()
+        return vbo
+
+    def get_stats(self):
+        """
+        Метод получения статистики индексированной геометрии по мешам.
+        :return dict: Имя меша -> число вершин и сэкономленная память.
+        """
+        return {name: vbo.stats for name, vbo in self.vbos.items() if vbo.stats}
 
     def destroy(self):
         """
@@ -28,25 +66,70 @@ class BaseVBO:
     """
     Базовый класс для работы с буфером вершин (VBO).
     """
-    def __init__(self, ctx):
+    def __init__(self, ctx, upload=True):
         """
         Метод инициализации базового объекта буфера вершин (VBO).
         :param moderngl.Context ctx: Контекст moderngl.
+        :param bool upload: Загрузить ли данные в видеопамять сразу.
+                            Без загрузки объект можно создавать вне потока контекста.
         """
         self.ctx = ctx
-        self.vbo = self.get_vbo()
+        self.bounds = None
+        self.ibo = None
+        self.stats = None
+        self.layout = None
+        self.vbo = None
+        self.vertex_data = None
+        self.index_data = None
+        self.load()
+        if upload:
+            self.vbo = self.get_vbo()
         self.format = None
         self.attribs = None
 
     def get_vertex_data(self):  ...
 
+    def get_bounds(self, vertex_data): ...
+
+    def get_index_data(self, vertex_data):
+        """
+        Метод получения индексов вершин. По умолчанию геометрия не индексируется.
+        :param numpy.ndarray vertex_data: Данные вершин.
+        :return tuple: Данные вершин и индексы (или None).
+        """
+        return vertex_data, None
+
+    def get_layout(self, vertex_data):
+        """
+        Метод выбора формата вершин буфера. По умолчанию вершины не сжимаются.
+        :param numpy.ndarray vertex_data: Данные вершин.
+        :return VertexLayout: Формат вершин.
+        """
+        return VertexLayout()
+
+    def load(self):
+        """
+        Метод подготовки данных вершин и индексов в памяти. Не обращается к OpenGL.
+        Вершины переводятся в выбранный для меша формат буфера.
+        """
+        vertex_data = self.get_vertex_data()
+        self.bounds = self.get_bounds(vertex_data)
+        vertex_data, self.index_data = self.get_index_data(vertex_data)
+        self.layout = self.get_layout(vertex_data)
+        self.vertex_data = self.layout.encode(vertex_data)
+        if self.stats and self.layout.compact:
+            self.stats['bytes'] = self.vertex_data.nbytes + self.index_data.nbytes
+            self.stats['saved_bytes'] = self.stats['source_bytes'] - self.stats['bytes']
+
     def get_vbo(self):
         """
-        Метод создания и возвращения буфера вершин.
+        Метод создания и возвращения буфера вершин и, если есть индексы, буфера индексов.
         :return moderngl.Buffer: Созданный буфер вершин.
         """
-        vertex_data = self.get_vertex_data()
-        vbo = self.ctx.buffer(vertex_data)
+        if self.index_data is not None:
+            self.ibo = self.ctx.buffer(self.index_data)
+        vbo = self.ctx.buffer(self.vertex_data)
+        self.vertex_data = self.index_data = None
         return vbo
 
     def destroy(self):
@@ -54,15 +137,17 @@ class BaseVBO:
         Метод уничтожения объекта.
         """
         self.vbo.release()
+        if self.ibo is not None:
+            self.ibo.release()
 
 
 class CubeVBO(BaseVBO):
     """
     Класс для создания буфера вершин для куба.
     """
-    def __init__(self, ctx):
-        super().__init__(ctx)
-        self.format = '2f 3f 3f'
+    def __init__(self, ctx, upload=True):
+        super().__init__(ctx, upload)
+        self.format = self.layout.format
         self.attribs = ['in_texcoord_0', 'in_normal', 'in_position']
 
     @staticmethod
@@ -76,6 +161,22 @@ class CubeVBO(BaseVBO):
         data = [vertices[ind] for triangle in indices for ind in triangle]
         return np.array(data, dtype='f4')
 
+    def get_bounds(self, vertex_data):
+        """
+        Метод вычисления ограничивающих объемов по позициям вершин формата '2f 3f 3f'.
+        :param numpy.ndarray vertex_data: Данные вершин.
+        :return Bounds: Ограничивающие объемы меша.
+        """
+        return Bounds(vertex_data.reshape(-1, 8)[:, 5:8])
+
+    def get_layout(self, vertex_data):
+        """
+        Метод выбора формата вершин по размеру меша.
+        :param numpy.ndarray vertex_data: Данные вершин формата '2f 3f 3f'.
+        :return VertexLayout: Формат вершин.
+        """
+        return VertexLayout.choose(vertex_data)
+
     def get_vertex_data(self):
         """
         Метод генерации данных вершин для куба.
@@ -117,13 +218,23 @@ class CubeVBO(BaseVBO):
 
         return vertex_data
 
+    def get_index_data(self, vertex_data):
+        """
+        Метод слияния одинаковых вершин куба и построения буфера индексов.
+        :param numpy.ndarray vertex_data: Несвязанные вершины куба.
+        :return tuple: Уникальные вершины и индексы.
+        """
+        welded, index_data = build_indexed(vertex_data)
+        self.stats = get_index_stats(len(vertex_data), welded, index_data)
+        return welded, index_data
+
 
 class SkyBoxVBO(BaseVBO):
     """
     Класс для создания буфера вершин для пола.
     """
-    def __init__(self, ctx):
-        super().__init__(ctx)
+    def __init__(self, ctx, upload=True):
+        super().__init__(ctx, upload)
         self.format = '3f'
         self.attribs = ['in_position']
 
@@ -142,19 +253,57 @@ class OtherModelVBO(BaseVBO):
     """
     Класс для создания буфера вершин для 3д-объектов.
     """
-    def __init__(self, app):
-        super().__init__(app)
-        self.format = '2f 3f 3f'
+    def __init__(self, ctx, upload=True, level=0):
+        """
+        Метод инициализации буфера вершин 3д-объекта.
+        :param moderngl.Context ctx: Контекст moderngl.
+        :param bool upload: Загрузить ли данные в видеопамять сразу.
+        :param int level: Уровень детализации (0 - исходный меш).
+        """
+        self.path = None
+        self.mesh = None
+        self.level = level
+        super().__init__(ctx, upload)
+        self.format = self.layout.format
         self.attribs = ['in_texcoord_0', 'in_normal', 'in_position']
 
     def get_vertex_data(self, path='objects/ball/ball.obj'):
         """
-        Получение данных вершин из файла модели.
+        Получение данных вершин из файла модели через бинарный кэш.
+        Вершины всех материалов лежат в одном буфере и рисуются одним вызовом
+        с текстурой модели. Упрощенные уровни детализации строятся при первой
+        загрузке и кэшируются рядом с кэшем модели.
         :param path: Путь к файлу модели.
         :return numpy.ndarray: Массив данных вершин.
         """
-        objs = pywavefront.Wavefront(path, cache=True, parse=True)
-        obj = objs.materials.popitem()[1]
-        vertex_data = obj.vertices
-        vertex_data = np.array(vertex_data, dtype='f4')
-        return vertex_data
+        self.path = path
+        self.mesh = load_lod(path, self.level)
+        return self.mesh.vertex_data
+
+    def get_bounds(self, vertex_data):
+        """
+        Метод вычисления ограничивающих объемов по позициям вершин формата '2f 3f 3f'.
+        :param numpy.ndarray vertex_data: Данные вершин.
+        :return Bounds: Ограничивающие объемы меша.
+        """
+        return Bounds(vertex_data.reshape(-1, 8)[:, 5:8])
+
+    def get_layout(self, vertex_data):
+        """
+        Метод выбора формата вершин. Решение о сжатии принимается по исходному мешу,
+        чтобы все уровни детализации рисовались одним вариантом шейдера.
+        :param numpy.ndarray vertex_data: Данные вершин формата '2f 3f 3f'.
+        :return VertexLayout: Формат вершин.
+        """
+        count = len(load_lod(self.path, 0).vertex_data) if self.level else None
+        return VertexLayout.choose(vertex_data, count)
+
+    def get_index_data(self, vertex_data):
+        """
+        Метод получения индексов, построенных при создании кэша модели.
+        :param numpy.ndarray vertex_data: Данные вершин.
+        :return tuple: Данные вершин и индексы.
+        """
+        mesh = self.mesh
+        self.stats = get_index_stats(mesh.source_count, vertex_data, mesh.index_data)
+        return vertex_data, mesh.index_data
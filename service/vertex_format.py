@@ -0,0 +1,114 @@
+import glm
+import numpy as np
+
+# наименьшее число вершин меша, начиная с которого вершины сжимаются
+MIN_COMPACT_VERTICES = 256
+
+# наибольшая по модулю текстурная координата, которая точно хранится в half float
+MAX_HALF_TEXCOORD = 2048.0
+
+# сжатая вершина: текстурные координаты half float, нормаль 10_10_10_2,
+# позиция uint16 в границах меша и выравнивание до 16 байт
+COMPACT_DTYPE = np.dtype([('texcoord', '<f2', 2), ('normal', '<u4'),
+                          ('position', '<u2', 3), ('pad', '<u2')])
+
+
+def pack_normals(normals):
+    """
+    Функция упаковки нормалей в формат 10_10_10_2 (три знаковых 10-битных компоненты).
+    :param numpy.ndarray normals: Нормали размером (n, 3).
+    :return numpy.ndarray: Упакованные нормали uint32 размером (n,).
+    """
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = normals / np.maximum(lengths, 1e-12)
+    values = np.round(np.clip(normals, -1.0, 1.0) * 511).astype(np.int32) & 0x3ff
+    return (values[:, 0] | values[:, 1] << 10 | values[:, 2] << 20).astype(np.uint32)
+
+
+def unpack_normals(packed):
+    """
+    Функция распаковки нормалей формата 10_10_10_2 (как в шейдере).
+    :param numpy.ndarray packed: Упакованные нормали uint32.
+    :return numpy.ndarray: Нормали размером (n, 3).
+    """
+    packed = np.asarray(packed, dtype=np.uint32)
+    values = np.column_stack([(packed >> shift) & 0x3ff for shift in (0, 10, 20)]).astype(np.int32)
+    values = np.where(values >= 512, values - 1024, values)
+    return np.maximum(values / 511.0, -1.0)
+
+
+class VertexLayout:
+    """
+    Класс представляющий формат вершин буфера '2f 3f 3f'
+    (текстурные координаты, нормаль, позиция) и его сжатый вариант.
+    Сжатая вершина занимает 16 байт вместо 32: позиция квантуется в границах меша,
+    поэтому шейдеру передаются смещение и масштаб для ее восстановления.
+    """
+    def __init__(self, compact=False, offset=(0, 0, 0), scale=(1, 1, 1)):
+        """
+        Метод инициализации формата вершин.
+        :param bool compact: Сжатый ли формат.
+        :param offset: Нижняя граница меша (начало сетки квантования).
+        :param scale: Шаг сетки квантования по осям.
+        """
+        self.compact = compact
+        self.offset = glm.vec3(*map(float, offset))
+        self.scale = glm.vec3(*map(float, scale))
+        self.format = '2f2 u4 3u2 2x' if compact else '2f 3f 3f'
+        self.defines = {'COMPACT_VERTEX': True} if compact else {}
+
+    @classmethod
+    def choose(cls, vertex_data, count=None):
+        """
+        Метод выбора формата для меша: сжатие для мешей с большим числом вершин,
+        если текстурные координаты представимы в half float.
+        :param numpy.ndarray vertex_data: Вершины '2f 3f 3f' размером (n, 8).
+        :param int count: Число вершин, по которому принимается решение
+                          (например, исходного меша для уровня детализации).
+        :return VertexLayout: Формат вершин.
+        """
+        vertex_data = np.asarray(vertex_data).reshape(-1, 8)
+        count = len(vertex_data) if count is None else count
+        if count < MIN_COMPACT_VERTICES or not len(vertex_data) or \
+                np.abs(vertex_data[:, :2]).max() >= MAX_HALF_TEXCOORD:
+            return cls()
+        low, high = vertex_data[:, 5:8].min(axis=0), vertex_data[:, 5:8].max(axis=0)
+        return cls(True, low, np.maximum(high - low, 1e-6) / 65535)
+
+    def encode(self, vertex_data):
+        """
+        Метод перевода вершин '2f 3f 3f' в формат буфера.
+        :param numpy.ndarray vertex_data: Вершины размером (n, 8).
+        :return numpy.ndarray: Данные для буфера вершин.
+        """
+        if not self.compact:
+            return vertex_data
+        vertex_data = np.asarray(vertex_data, dtype='f4').reshape(-1, 8)
+        data = np.zeros(len(vertex_data), dtype=COMPACT_DTYPE)
+        data['texcoord'] = vertex_data[:, 0:2]
+        data['normal'] = pack_normals(vertex_data[:, 2:5])
+        positions = (vertex_data[:, 5:8] - np.array(self.offset)) / np.array(self.scale)
+        data['position'] = np.clip(np.round(positions), 0, 65535)
+        return data
+
+    def decode(self, data):
+        """
+        Метод восстановления вершин '2f 3f 3f' из данных буфера (как в шейдере).
+        :param numpy.ndarray data: Данные буфера вершин.
+        :return numpy.ndarray: Вершины размером (n, 8).
+        """
+        if not self.compact:
+            return np.asarray(data).reshape(-1, 8)
+        positions = np.array(self.offset) + data['position'] * np.array(self.scale)
+        return np.column_stack([data['texcoord'].astype('f4'), unpack_normals(data['normal']),
+                                positions]).astype('f4')
+
+    def use(self, state, program):
+        """
+        Метод записи форм восстановления позиций перед отрисовкой сжатого меша.
+        :param RenderState state: Кэш состояния OpenGL.
+        :param moderngl.Program program: Шейдерная программа.
+        """
+        if self.compact:
+            state.write(program, 'u_position_offset', self.offset)
+            state.write(program, 'u_position_scale', self.scale)
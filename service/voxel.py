@@ -0,0 +1,448 @@
+import glm
+import numpy as np
+from service.culling import Bounds, SphereSet
+from service.vbo import BaseVBO
+from service.vertex_format import VertexLayout
+
+# размер чанка сетки в ячейках по каждой оси
+CHUNK_SIZE = 16
+
+# оси текстурных координат граней (ось, знак) для направлений (ось нормали, знак),
+# как у граней куба CubeVBO: текстура повторяется в каждой ячейке
+UV_AXES = {
+    (0, 1): ((2, -1), (1, 1)),
+    (0, -1): ((2, 1), (1, 1)),
+    (1, 1): ((0, 1), (2, -1)),
+    (1, -1): ((0, 1), (2, 1)),
+    (2, 1): ((0, 1), (1, 1)),
+    (2, -1): ((0, -1), (1, 1))
+}
+
+
+def get_rectangles(mask):
+    """
+    Функция жадного объединения клеток слоя с одинаковым материалом в прямоугольники
+    (greedy meshing): прямоугольник растет сначала вдоль строки, затем по строкам.
+    :param numpy.ndarray mask: Материалы клеток слоя (0 - нет грани) размером (h, w).
+    :return list: Прямоугольники (строка, столбец, высота, ширина, материал).
+    """
+    mask = mask.tolist()
+    rows, cols = len(mask), len(mask[0])
+    rectangles = []
+    for i in range(rows):
+        j = 0
+        while j < cols:
+            material = mask[i][j]
+            if not material:
+                j += 1
+                continue
+            width = 1
+            while j + width < cols and mask[i][j + width] == material:
+                width += 1
+            height = 1
+            while i + height < rows and \
+                    all(value == material for value in mask[i + height][j:j + width]):
+                height += 1
+            for row in mask[i:i + height]:
+                row[j:j + width] = [0] * width
+            rectangles.append((i, j, height, width, material))
+            j += width
+    return rectangles
+
+
+def get_chunk_quads(cells):
+    """
+    Функция построения видимых граней чанка: грани между занятыми соседними ячейками
+    отбрасываются, а соседние грани одного направления с одним материалом объединяются.
+    :param numpy.ndarray cells: Материалы ячеек чанка с рамкой в одну ячейку из соседних
+                                чанков размером (n + 2, n + 2, n + 2).
+    :return list: Для каждого направления (ось, знак) - массив четырехугольников
+                  (слой, строка, столбец, высота, ширина, материал) размером (m, 6).
+    """
+    inner = cells[1:-1, 1:-1, 1:-1]
+    quads = []
+    for axis in range(3):
+        for sign in (1, -1):
+            index = [slice(1, -1)] * 3
+            index[axis] = slice(2, None) if sign > 0 else slice(None, -2)
+            faces = np.where(cells[tuple(index)] == 0, inner, 0)
+            rectangles = []
+            for layer, mask in enumerate(np.moveaxis(faces, axis, 0)):
+                if mask.any():
+                    rectangles.extend((layer, *rectangle) for rectangle in get_rectangles(mask))
+            quads.append(((axis, sign), np.array(rectangles, dtype=int).reshape(-1, 6)))
+    return quads
+
+
+def get_quad_vertices(direction, quads, offset, origin, cell_size):
+    """
+    Функция построения вершин '2f 3f 3f' и индексов четырехугольников одного направления.
+    :param tuple direction: Ось нормали и знак.
+    :param numpy.ndarray quads: Четырехугольники (слой, строка, столбец, высота, ширина, материал).
+    :param numpy.ndarray offset: Первая ячейка чанка в координатах сетки.
+    :param numpy.ndarray origin: Мировые координаты угла ячейки (0, 0, 0).
+    :param float cell_size: Размер ячейки.
+    :return tuple: Вершины размером (4m, 8) и индексы размером (6m,) относительно первой вершины.
+    """
+    axis, sign = direction
+    b, c = [i for i in range(3) if i != axis]
+    layer, row, col, height, width = quads[:, :5].T
+
+    corners = np.zeros((len(quads), 4, 3))
+    corners[:, :, axis] = (layer + (sign > 0))[:, None]
+    corners[:, :, b] = np.column_stack([row, row + height, row + height, row])
+    corners[:, :, c] = np.column_stack([col, col, col + width, col + width])
+    corners += offset
+
+    (u_axis, u_sign), (v_axis, v_sign) = UV_AXES[direction]
+    texcoords = np.stack([u_sign * corners[:, :, u_axis], v_sign * corners[:, :, v_axis]], axis=2)
+    normal = np.zeros(3)
+    normal[axis] = sign
+    positions = origin + corners * cell_size
+
+    vertex_data = np.concatenate([texcoords, np.broadcast_to(normal, corners.shape), positions],
+                                 axis=2).reshape(-1, 8)
+    # обход против часовой стрелки при взгляде снаружи
+    edge_b, edge_c = np.eye(3)[b], np.eye(3)[c]
+    order = [0, 1, 2, 0, 2, 3] if np.cross(edge_b, edge_c) @ normal > 0 else [0, 2, 1, 0, 3, 2]
+    indices = (np.arange(len(quads))[:, None] * 4 + order).ravel()
+    return vertex_data.astype('f4'), indices.astype('u4')
+
+
+class ChunkVBO(BaseVBO):
+    """
+    Класс для создания буфера вершин меша одного материала чанка сетки.
+    """
+    def __init__(self, ctx, vertex_data, index_data):
+        """
+        Метод инициализации буфера вершин чанка.
+        :param moderngl.Context ctx: Контекст moderngl.
+        :param numpy.ndarray vertex_data: Вершины '2f 3f 3f' размером (n, 8).
+        :param numpy.ndarray index_data: Индексы вершин.
+        """
+        self.source = vertex_data, index_data
+        super().__init__(ctx)
+        self.format = self.layout.format
+        self.attribs = ['in_texcoord_0', 'in_normal', 'in_position']
+
+    def get_vertex_data(self):
+        return self.source[0]
+
+    def get_bounds(self, vertex_data):
+        return Bounds(vertex_data[:, 5:8])
+
+    def get_index_data(self, vertex_data):
+        return vertex_data, self.source[1]
+
+    def get_layout(self, vertex_data):
+        """
+        Метод выбора формата вершин. Вершины не сжимаются: квантование позиций
+        в границах каждого чанка дало бы щели между соседними чанками.
+        :param numpy.ndarray vertex_data: Данные вершин.
+        :return VertexLayout: Формат вершин.
+        """
+        return VertexLayout()
+
+
+class ChunkMesh:
+    """
+    Класс представляющий меш одного материала чанка: буфер вершин в мировых
+    координатах и VAO проходов, создаваемые при первой отрисовке.
+    """
+    def __init__(self, grid, vbo, tex_id):
+        """
+        Метод инициализации меша чанка.
+        :param VoxelGrid grid: Сетка, которой принадлежит меш.
+        :param ChunkVBO vbo: Буфер вершин.
+        :param tex_id: Идентификатор текстуры материала.
+        """
+        self.grid = grid
+        self.vbo = vbo
+        self.tex_id = tex_id
+        self.sphere = np.array([*vbo.bounds.center, vbo.bounds.radius], dtype='f4')
+        self.vaos = {}
+
+    def get_vao(self, kind):
+        """
+        Метод получения VAO прохода.
+        :param str kind: Проход ('main', 'shadow', 'depth').
+        :return moderngl.VertexArray: VAO.
+        """
+        if kind not in self.vaos:
+            vao = self.grid.app.mesh.vao
+            self.vaos[kind] = vao.get_vao(self.grid.programs[kind], self.vbo)
+        return self.vaos[kind]
+
+    def destroy(self):
+        """
+        Метод уничтожения объекта путем освобождения связанных ресурсов.
+        """
+        for vao in self.vaos.values():
+            vao.release()
+        self.vbo.destroy()
+
+
+class VoxelGrid:
+    """
+    Класс представляющий сетку ячеек на регулярной решетке, разбитую на чанки.
+    Ячейки хранят номер материала (текстуры), и для каждого чанка строится
+    по одному мешу на материал: грани между занятыми соседними ячейками
+    отбрасываются, а соседние грани одного направления с одним материалом
+    объединяются в прямоугольники. После изменения ячеек перестраиваются
+    только их чанки и соседние чанки, которых касаются изменения на границе.
+    """
+    def __init__(self, app, origin=(0, 0, 0), cell_size=2.0, chunk_size=CHUNK_SIZE):
+        """
+        Метод инициализации сетки.
+        :param GraphicsEngine app: Объект приложения.
+        :param origin: Мировые координаты угла ячейки (0, 0, 0).
+        :param float cell_size: Размер ячейки.
+        :param int chunk_size: Размер чанка в ячейках.
+        """
+        self.app = app
+        self.state = app.render_state
+        self.origin = np.array(origin, dtype='f8')
+        self.cell_size = cell_size
+        self.chunk_size = chunk_size
+        # ключ чанка -> материалы ячеек (0 - пусто) размером (n, n, n)
+        self.chunks = {}
+        # ключ чанка -> меши материалов
+        self.meshes = {}
+        self.dirty = set()
+        # идентификаторы текстур материалов 1, 2, ...
+        self.materials = []
+        self.version = 0
+        self.spheres = SphereSet(np.zeros((0, 4), dtype='f4'))
+        self.ordered_meshes = []
+        self.stats = {'chunks': 0, 'meshes': 0, 'quads': 0, 'rebuilt': 0}
+
+        shader = app.mesh.vao.program
+        self.programs = {'main': shader.get_variant('default'),
+                         'shadow': shader.get_variant('shadow_map'),
+                         'depth': shader.get_variant('depth_prepass')}
+        self.m_model = glm.mat4()
+        self.m_normal = glm.mat3()
+        self.depth_texture = app.mesh.texture.textures['depth_texture']
+        self.on_init()
+
+    def set_origin(self, origin, cell_size):
+        """
+        Метод задания решетки сетки. Все чанки перестраиваются.
+        :param origin: Мировые координаты угла ячейки (0, 0, 0).
+        :param float cell_size: Размер ячейки.
+        """
+        self.origin = np.array(origin, dtype='f8')
+        self.cell_size = cell_size
+        self.dirty.update(self.chunks)
+        self.version += 1
+
+    def get_material(self, tex_id):
+        """
+        Метод получения номера материала текстуры с регистрацией нового материала.
+        :param tex_id: Идентификатор текстуры или None для пустой ячейки.
+        :return int: Номер материала (0 - пусто).
+        """
+        if tex_id is None:
+            return 0
+        if tex_id not in self.materials:
+            if len(self.materials) == 255:
+                raise ValueError('Voxel grid supports at most 255 materials')
+            self.materials.append(tex_id)
+            self.app.mesh.request(tex_id=tex_id)
+        return self.materials.index(tex_id) + 1
+
+    def set_cells(self, cells, tex_id):
+        """
+        Метод изменения многих ячеек одним шагом.
+        :param numpy.ndarray cells: Координаты ячеек размером (n, 3).
+        :param tex_id: Идентификатор текстуры ячеек или None, чтобы очистить их.
+        """
+        cells = np.asarray(cells, dtype=int).reshape(-1, 3)
+        if not len(cells):
+            return
+        material = self.get_material(tex_id)
+        size = self.chunk_size
+        keys, local = cells // size, cells % size
+        unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+        for i, key in enumerate(map(tuple, unique.tolist())):
+            rows = local[inverse.ravel() == i]
+            chunk = self.chunks.get(key)
+            if chunk is None:
+                if not material:
+                    continue
+                chunk = self.chunks[key] = np.zeros((size,) * 3, dtype=np.uint8)
+            chunk[tuple(rows.T)] = material
+            self.dirty.add(key)
+            # изменения на границе меняют видимость граней соседнего чанка
+            for axis in range(3):
+                for sign, edge in ((-1, 0), (1, size - 1)):
+                    if (rows[:, axis] == edge).any():
+                        neighbour = list(key)
+                        neighbour[axis] += sign
+                        self.dirty.add(tuple(neighbour))
+        self.version += 1
+
+    def set_cell(self, cell, tex_id):
+        """
+        Метод изменения одной ячейки.
+        :param cell: Координаты ячейки (x, y, z).
+        :param tex_id: Идентификатор текстуры ячейки или None, чтобы очистить ее.
+        """
+        self.set_cells([cell], tex_id)
+
+    def fill(self, low, high, tex_id):
+        """
+        Метод заполнения параллелепипеда ячеек.
+        :param low: Первая ячейка (x, y, z).
+        :param high: Ячейка за последней (x, y, z).
+        :param tex_id: Идентификатор текстуры ячеек или None, чтобы очистить их.
+        """
+        ranges = [np.arange(a, b) for a, b in zip(low, high)]
+        cells = np.stack(np.meshgrid(*ranges, indexing='ij'), axis=-1).reshape(-1, 3)
+        self.set_cells(cells, tex_id)
+
+    def get_padded(self, key):
+        """
+        Метод получения ячеек чанка с рамкой из граничных слоев соседних чанков.
+        :param tuple key: Ключ чанка.
+        :return numpy.ndarray: Материалы размером (n + 2, n + 2, n + 2).
+        """
+        size = self.chunk_size
+        padded = np.zeros((size + 2,) * 3, dtype=np.uint8)
+        padded[1:-1, 1:-1, 1:-1] = self.chunks[key]
+        for axis in range(3):
+            for sign in (-1, 1):
+                neighbour = list(key)
+                neighbour[axis] += sign
+                chunk = self.chunks.get(tuple(neighbour))
+                if chunk is None:
+                    continue
+                source = [slice(None)] * 3
+                source[axis] = 0 if sign > 0 else size - 1
+                target = [slice(1, -1)] * 3
+                target[axis] = size + 1 if sign > 0 else 0
+                padded[tuple(target)] = chunk[tuple(source)]
+        return padded
+
+    def build_chunk(self, key):
+        """
+        Метод построения мешей материалов чанка.
+        :param tuple key: Ключ чанка.
+        :return list: Меши чанка.
+        """
+        offset = np.array(key) * self.chunk_size
+        parts = {}
+        for direction, quads in get_chunk_quads(self.get_padded(key)):
+            for material in np.unique(quads[:, 5]).tolist():
+                vertex_data, index_data = get_quad_vertices(
+                    direction, quads[quads[:, 5] == material], offset, self.origin, self.cell_size)
+                parts.setdefault(material, []).append((vertex_data, index_data))
+
+        meshes = []
+        for material, items in parts.items():
+            starts = np.cumsum([0] + [len(vertex_data) for vertex_data, _ in items[:-1]])
+            vertex_data = np.concatenate([vertex_data for vertex_data, _ in items])
+            index_data = np.concatenate([index_data + start
+                                         for (_, index_data), start in zip(items, starts)])
+            vbo = ChunkVBO(self.app.ctx, vertex_data, index_data.astype('u4'))
+            meshes.append(ChunkMesh(self, vbo, self.materials[material - 1]))
+            self.stats['quads'] += len(index_data) // 6
+        return meshes
+
+    def update(self):
+        """
+        Метод перестройки измененных чанков.
+        :return tuple: Сферы мешей до и после перестройки размером (n, 4).
+        """
+        if not self.dirty:
+            return np.zeros((0, 4), dtype='f4'), np.zeros((0, 4), dtype='f4')
+        old, new = [], []
+        for key in self.dirty:
+            for mesh in self.meshes.pop(key, []):
+                old.append(mesh.sphere)
+                mesh.destroy()
+            chunk = self.chunks.get(key)
+            if chunk is None:
+                continue
+            if not chunk.any():
+                del self.chunks[key]
+                continue
+            self.meshes[key] = self.build_chunk(key)
+            new.extend(mesh.sphere for mesh in self.meshes[key])
+        self.stats['rebuilt'] += len(self.dirty)
+        self.dirty = set()
+
+        meshes = [mesh for items in self.meshes.values() for mesh in items]
+        spheres = np.array([mesh.sphere for mesh in meshes], dtype='f4').reshape(-1, 4)
+        self.spheres = SphereSet(spheres)
+        self.ordered_meshes = [meshes[i] for i in self.spheres.order]
+        self.stats.update(chunks=len(self.chunks), meshes=len(meshes))
+        return (np.array(old, dtype='f4').reshape(-1, 4),
+                np.array(new, dtype='f4').reshape(-1, 4))
+
+    def get_spheres(self):
+        """
+        Метод получения ограничивающих сфер всех мешей сетки.
+        :return numpy.ndarray: Сферы размером (n, 4).
+        """
+        return np.array([mesh.sphere for mesh in self.ordered_meshes], dtype='f4').reshape(-1, 4)
+
+    def render(self, mesh, kind):
+        """
+        Метод отрисовки меша чанка. Вершины заданы в мировых координатах.
+        :param ChunkMesh mesh: Меш чанка.
+        :param str kind: Проход ('main', 'shadow', 'depth').
+        """
+        vao = mesh.get_vao(kind)
+        program = self.programs[kind]
+        if kind == 'main':
+            self.state.use_texture(self.app.mesh.texture.textures[mesh.tex_id], location=0)
+            self.state.write(program, 'm_normal', self.m_normal)
+        self.state.write(program, 'm_model', self.m_model)
+        vao.render()
+
+    def submit_mesh(self, queue, layer, mesh, kind, depth):
+        """
+        Метод добавления пакета отрисовки меша чанка в очередь.
+        :param RenderQueue queue: Очередь отрисовки.
+        :param str layer: Слой очереди.
+        :param ChunkMesh mesh: Меш чанка.
+        :param str kind: Проход ('main', 'shadow', 'depth').
+        :param float depth: Расстояние до камеры.
+        """
+        texture = self.app.mesh.texture.textures[mesh.tex_id] if kind == 'main' else None
+        queue.submit(layer, self.programs[kind], texture, mesh.get_vao(kind), depth,
+                     lambda: self.render(mesh, kind))
+
+    def submit(self, queue, mask=None, depths=None, kind='main'):
+        """
+        Метод добавления пакетов отрисовки видимых мешей в очередь.
+        :param RenderQueue queue: Очередь отрисовки.
+        :param numpy.ndarray mask: Маска видимости мешей в порядке набора сфер.
+        :param numpy.ndarray depths: Глубины мешей.
+        :param str kind: Проход ('main', 'shadow', 'depth').
+        """
+        layer = {'main': 'opaque', 'shadow': 'shadow', 'depth': 'depth'}[kind]
+        for i, mesh in enumerate(self.ordered_meshes):
+            if mask is None or mask[i]:
+                depth = float(depths[i]) if depths is not None else 0.0
+                self.submit_mesh(queue, layer, mesh, kind, depth)
+
+    def on_init(self):
+        """
+        Метод для установки начальных значений для форм основной программы.
+        """
+        state = self.state
+        program = self.programs['main']
+        state.write(program, 'shadowMap', 1)
+        state.write(program, 'u_texture_0', 0)
+        state.use_texture(self.depth_texture, location=1)
+
+    def destroy(self):
+        """
+        Метод уничтожения объекта путем освобождения связанных ресурсов.
+        """
+        for meshes in self.meshes.values():
+            for mesh in meshes:
+                mesh.destroy()
+        self.meshes = {}
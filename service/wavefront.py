@@ -0,0 +1,330 @@
+import os
+import re
+import json
+import hashlib
+import numpy as np
+from service.geometry import build_indexed
+
+CACHE_DIR = '.cache'
+CACHE_MAGIC = b'OBJC'
+CACHE_VERSION = 4
+
+
+class ObjMesh:
+    """
+    Класс представляющий меш, загруженный из файла OBJ.
+    Вершины всех материалов лежат в одном массиве формата '2f 3f 3f'
+    (текстурные координаты, нормаль, позиция), а каждому материалу
+    соответствует непрерывный диапазон: диапазон индексов для индексированного
+    меша, иначе диапазон вершин. Диапазоны не дают слиянию вершин и упрощению
+    смешивать материалы.
+    """
+    format = '2f 3f 3f'
+
+    def __init__(self, vertex_data, ranges, index_data=None, source_count=None):
+        """
+        Метод инициализации меша.
+        :param numpy.ndarray vertex_data: Данные вершин размером (n, 8).
+        :param list ranges: Диапазоны материалов: словари с ключами name, first, count, texture.
+        :param numpy.ndarray index_data: Индексы uint32 или None для несвязанных треугольников.
+        :param int source_count: Число вершин до слияния.
+        """
+        self.vertex_data = vertex_data
+        self.ranges = ranges
+        self.index_data = index_data
+        self.source_count = source_count or len(vertex_data)
+
+    @property
+    def vertex_count(self):
+        return len(self.vertex_data)
+
+
+def get_material_textures(path, data):
+    """
+    Функция чтения диффузных текстур материалов из библиотек mtllib.
+    :param str path: Путь к файлу OBJ.
+    :param bytes data: Содержимое файла OBJ.
+    :return dict: Имя материала -> имя файла текстуры.
+    """
+    textures = {}
+    folder = os.path.dirname(path)
+    for library in re.findall(rb'^mtllib[ \t]+(.+?)\s*$', data, re.M):
+        library_path = os.path.join(folder, library.decode())
+        if not os.path.exists(library_path):
+            continue
+        with open(library_path, 'rb') as file:
+            material = None
+            for line in file:
+                key, _, value = line.strip().replace(b'\t', b' ').partition(b' ')
+                if key == b'newmtl':
+                    material = value.decode()
+                elif key == b'map_Kd' and material is not None:
+                    textures[material] = value.split()[-1].decode()
+    return textures
+
+
+def get_flat_normals(positions):
+    """
+    Функция вычисления нормалей граней для треугольников без нормалей в файле.
+    :param numpy.ndarray positions: Позиции вершин треугольников размером (n * 3, 3).
+    :return numpy.ndarray: Нормали вершин размером (n * 3, 3).
+    """
+    triangles = positions.reshape(-1, 3, 3)
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    normals /= np.maximum(np.linalg.norm(normals, axis=1), 1e-12)[:, None]
+    return np.repeat(normals, 3, axis=0)
+
+
+def get_line_widths(text, count):
+    """
+    Функция подсчета чисел в каждой строке текста.
+    :param bytes text: Строки, разделенные переводом строки.
+    :param int count: Число строк.
+    :return numpy.ndarray: Число чисел в каждой строке.
+    """
+    chars = np.frombuffer(text, dtype='u1')
+    blank = (chars == ord(' ')) | (chars == ord('\t')) | (chars == ord('\n'))
+    starts = ~blank & np.concatenate([[True], blank[:-1]])
+    return np.bincount(np.cumsum(chars == ord('\n'))[starts], minlength=count)
+
+
+def get_rows(values, widths, width):
+    """
+    Функция раскладки чисел строк в массив строк одной ширины.
+    Лишние числа строки отбрасываются (например, w у позиции), недостающие равны нулю.
+    :param numpy.ndarray values: Числа всех строк подряд.
+    :param numpy.ndarray widths: Число чисел в каждой строке.
+    :param int width: Ширина строки результата.
+    :return numpy.ndarray: Массив размером (число строк, width).
+    """
+    if len(widths) and (widths == width).all():
+        return values.reshape(-1, width)
+    rows = np.repeat(np.arange(len(widths)), widths)
+    columns = np.arange(len(values)) - np.repeat(np.cumsum(widths) - widths, widths)
+    keep = columns < width
+    result = np.zeros((len(widths), width), dtype='f4')
+    result[rows[keep], columns[keep]] = values[keep]
+    return result
+
+
+def get_indices(tokens, counts):
+    """
+    Функция перевода индексов OBJ (с единицы, допускаются отрицательные) в индексы массива.
+    Отрицательный индекс отсчитывается от последнего элемента, объявленного до грани.
+    :param numpy.ndarray tokens: Индексы из файла.
+    :param counts: Число элементов, объявленных до грани каждого индекса (или общее число).
+    :return numpy.ndarray: Индексы с нуля.
+    """
+    return np.where(tokens < 0, tokens + counts, tokens - 1)
+
+
+def get_face_tokens(faces):
+    """
+    Функция разбора вершин граней в тройки индексов (позиция, текстура, нормаль).
+    Грани могут смешивать записи v, v/t, v//n и v/t/n: отсутствующий индекс равен нулю.
+    :param list faces: Строки граней без ключевого слова.
+    :return tuple: Индексы размером (n, 3) и число вершин каждой грани.
+    """
+    sizes = np.array([len(face.split()) for face in faces])
+    text = b' '.join(faces).replace(b'//', b'/0/')
+    text = re.sub(rb'(?<![/\d-])(-?\d+)/(-?\d+)(?![/\d])', rb'\1/\2/0', text)
+    text = re.sub(rb'(?<![/\d-])(-?\d+)(?![/\d])', rb'\1/0/0', text)
+    tokens = np.fromstring(text.replace(b'/', b' ').decode(), dtype=np.int64, sep=' ')
+    return tokens.reshape(-1, 3), sizes
+
+
+def parse_obj(path):
+    """
+    Функция разбора файла OBJ сразу в типизированные массивы NumPy.
+    Числа разбираются целиком по всем строкам одного вида, а многоугольники
+    разбиваются на треугольники веером, как в pywavefront.
+    :param str path: Путь к файлу OBJ.
+    :return ObjMesh: Загруженный меш.
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    def read_floats(prefix, width):
+        lines = re.findall(rb'^' + prefix + rb'[ \t]+(.*?)\s*$', data, re.M)
+        text = b'\n'.join(lines)
+        values = np.fromstring(text.decode(), dtype='f4', sep=' ')
+        return get_rows(values, get_line_widths(text, len(lines)), width)
+
+    positions = read_floats(rb'v', 3)
+    tex_coords = read_floats(rb'vt', 2)
+    normals = read_floats(rb'vn', 3)
+
+    # смещения строк v, vt и vn в файле нужны только для отрицательных индексов
+    line_offsets = []
+
+    def get_counts(offsets):
+        if not line_offsets:
+            line_offsets.extend(
+                np.array([match.start()
+                          for match in re.finditer(rb'^' + prefix + rb'[ \t]', data, re.M)],
+                         dtype=np.int64)
+                for prefix in (rb'v', rb'vt', rb'vn'))
+        return np.column_stack([np.searchsorted(lines, offsets) for lines in line_offsets])
+
+    # грани группируются по материалу в порядке первого появления
+    groups = {}
+    material = None
+    for match in re.finditer(rb'^(f|usemtl)[ \t]+(.*?)\s*$', data, re.M):
+        key, value = match.groups()
+        if key == b'usemtl':
+            material = value.decode()
+        else:
+            faces, offsets = groups.setdefault(material, ([], []))
+            faces.append(value)
+            offsets.append(match.start())
+
+    textures = get_material_textures(path, data)
+    chunks, ranges, first = [], [], 0
+    for material, (faces, offsets) in groups.items():
+        tokens, sizes = get_face_tokens(faces)
+        counts = (len(positions), len(tex_coords), len(normals))
+        if (tokens < 0).any():
+            counts = np.repeat(get_counts(np.array(offsets)), sizes, axis=0)
+        indices = get_indices(tokens, counts)
+        present = tokens != 0
+
+        # веерная триангуляция в порядке pywavefront: (0, 1, 2), затем (i, 0, i - 1)
+        starts = np.repeat(np.cumsum(sizes) - sizes, sizes - 2)
+        steps = np.arange(len(starts)) - np.repeat(np.cumsum(sizes - 2) - (sizes - 2), sizes - 2)
+        corners = np.column_stack([np.where(steps, starts + steps + 2, starts),
+                                   np.where(steps, starts, starts + 1),
+                                   np.where(steps, starts + steps + 1, starts + 2)]).ravel()
+        indices, present = indices[corners], present[corners]
+
+        vertices = np.zeros((len(indices), 8), dtype='f4')
+        vertices[:, 5:8] = positions[indices[:, 0]]
+        if len(tex_coords):
+            has_uv = present[:, 1]
+            vertices[has_uv, 0:2] = tex_coords[indices[has_uv, 1]]
+        vertices[:, 2:5] = get_flat_normals(vertices[:, 5:8])
+        if len(normals):
+            has_normal = present[:, 2]
+            vertices[has_normal, 2:5] = normals[indices[has_normal, 2]]
+
+        chunks.append(vertices)
+        ranges.append({'name': material, 'first': first, 'count': len(vertices),
+                       'texture': textures.get(material)})
+        first += len(vertices)
+
+    vertex_data = np.vstack(chunks) if chunks else np.zeros((0, 8), dtype='f4')
+    return ObjMesh(vertex_data, ranges)
+
+
+def get_cache_path(path, digest, ext='mesh'):
+    """
+    Функция получения пути к файлу кэша для версии формата и хэша содержимого.
+    :param str path: Путь к файлу OBJ.
+    :param str digest: Хэш содержимого файла OBJ.
+    :param str ext: Расширение файла кэша (например, lod1 для уровней детализации).
+    :return str: Путь к файлу кэша.
+    """
+    folder, name = os.path.split(path)
+    return os.path.join(folder, CACHE_DIR, f'{name}.{digest[:16]}.v{CACHE_VERSION}.{ext}')
+
+
+def get_file_hash(path):
+    """
+    Функция вычисления хэша содержимого файла.
+    :param str path: Путь к файлу.
+    :return str: Хэш SHA-1 в шестнадцатеричном виде.
+    """
+    with open(path, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+def write_cache(cache_path, mesh):
+    """
+    Функция записи меша в бинарный кэш.
+    Формат: сигнатура, версия, длина заголовка, заголовок JSON, данные вершин,
+    выровненные по 16 байтам, и индексы.
+    :param str cache_path: Путь к файлу кэша.
+    :param ObjMesh mesh: Меш.
+    """
+    folder = os.path.dirname(cache_path)
+    os.makedirs(folder, exist_ok=True)
+
+    # удаление кэшей прежних версий того же файла
+    prefix, _, _, ext = os.path.basename(cache_path).rsplit('.', 3)
+    for name in os.listdir(folder):
+        if name.startswith(prefix + '.') and name.endswith('.' + ext):
+            os.remove(os.path.join(folder, name))
+
+    header = json.dumps({'count': mesh.vertex_count, 'index_count': len(mesh.index_data),
+                         'source_count': mesh.source_count, 'ranges': mesh.ranges}).encode()
+    offset = 12 + len(header)
+    header += b' ' * (-offset % 16)
+
+    temp_path = cache_path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(CACHE_MAGIC)
+        file.write(np.array([CACHE_VERSION, len(header)], dtype='<u4').tobytes())
+        file.write(header)
+        file.write(np.ascontiguousarray(mesh.vertex_data, dtype='<f4').tobytes())
+        file.write(np.ascontiguousarray(mesh.index_data, dtype='<u4').tobytes())
+    os.replace(temp_path, cache_path)
+
+
+def read_cache(cache_path):
+    """
+    Функция отображения бинарного кэша меша в память без копирования вершин.
+    :param str cache_path: Путь к файлу кэша.
+    :return ObjMesh: Меш или None, если кэш отсутствует или устарел.
+    """
+    if not os.path.exists(cache_path):
+        return None
+
+    with open(cache_path, 'rb') as file:
+        magic = file.read(4)
+        version, size = np.frombuffer(file.read(8), dtype='<u4')
+        if magic != CACHE_MAGIC or version != CACHE_VERSION:
+            return None
+        header = json.loads(file.read(size))
+
+    count, index_count = header['count'], header['index_count']
+    offset = 12 + size
+    vertex_data = np.memmap(cache_path, dtype='<f4', mode='r', offset=offset, shape=(count, 8))
+    index_data = np.memmap(cache_path, dtype='<u4', mode='r', offset=offset + count * 32,
+                           shape=(index_count,))
+    return ObjMesh(vertex_data, header['ranges'], index_data, header['source_count'])
+
+
+def get_indexed_mesh(mesh, optimize=False):
+    """
+    Функция перевода меша из несвязанных треугольников в индексированный.
+    Диапазоны материалов пересчитываются в диапазоны индексов.
+    :param ObjMesh mesh: Меш из несвязанных треугольников.
+    :param bool optimize: Переупорядочивать ли треугольники для кэша вершин.
+    :return ObjMesh: Индексированный меш.
+    """
+    vertex_data, index_data = build_indexed(mesh.vertex_data, mesh.ranges, optimize=optimize)
+    return ObjMesh(vertex_data, mesh.ranges, index_data, mesh.vertex_count)
+
+
+def load_obj(path, cache=True, optimize=False):
+    """
+    Функция загрузки файла OBJ через бинарный кэш.
+    При первом запуске файл разбирается, вершины сливаются в индексированный меш
+    и сохраняются в кэш, при следующих кэш отображается в память.
+    Кэш сбрасывается при изменении содержимого файла.
+    Переупорядочивание треугольников для кэша вершин выполняется на чистом Python
+    и в несколько раз дольше разбора файла, поэтому включается явно
+    (например, для подготовки ресурсов заранее) и кэшируется в отдельный файл.
+    :param str path: Путь к файлу OBJ.
+    :param bool cache: Использовать ли кэш.
+    :param bool optimize: Переупорядочивать ли треугольники для кэша вершин.
+    :return ObjMesh: Загруженный индексированный меш.
+    """
+    if not cache:
+        return get_indexed_mesh(parse_obj(path), optimize)
+
+    cache_path = get_cache_path(path, get_file_hash(path), 'mesh-opt' if optimize else 'mesh')
+    mesh = read_cache(cache_path)
+    if mesh is None:
+        write_cache(cache_path, get_indexed_mesh(parse_obj(path), optimize))
+        mesh = read_cache(cache_path)
+    return mesh
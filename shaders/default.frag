@@ -5,29 +5,43 @@ layout (location = 0) out vec4 fragColor;
 in vec2 uv_0;
 in vec3 normal;
 in vec3 fragPos;
-in vec4 shadowCoord;
+#ifdef TEXTURE_ARRAY
+flat in float layer;
+#endif
 
-struct Light {
-    vec3 position;
-    vec3 Ia;
-    vec3 Id;
-    vec3 Is;
-};
+#include "include/frame_data.glsl"
 
-uniform Light light;
+// качество мягких теней: 0 - без теней, 1 - жесткие, 4, 16 или 64 выборки
+#ifndef SHADOW_QUALITY
+#define SHADOW_QUALITY 16
+#endif
+
+#if defined(TEXTURE_ARRAY)
+uniform sampler2DArray u_texture_0;
+#elif !defined(UNTEXTURED)
 uniform sampler2D u_texture_0;
-uniform vec3 camPos;
+#else
+uniform vec3 u_color = vec3(1.0);
+#endif
 uniform sampler2DShadow shadowMap;
-uniform vec2 u_resolution;
+
+// кластерное освещение (см. service/light_grid.py): положения и радиусы источников
+// в строке 0 и цвета в строке 1, смещение и число источников каждого кластера
+// и список индексов источников по кластерам
+uniform sampler2D u_lights;
+uniform usampler2D u_light_grid;
+uniform usampler2D u_light_indices;
+
+vec4 shadowCoord;
 
 float lookup(float ox, float oy) {
-    vec2 pixelOffset = 1 / u_resolution;
+    vec2 pixelOffset = shadowParams.xy;
     return textureProj(shadowMap, shadowCoord + vec4(ox * pixelOffset.x * shadowCoord.w,
                                                      oy * pixelOffset.y * shadowCoord.w, 0.0, 0.0));
 }
 
 float getSoftShadowX4() {
-    float shadow;
+    float shadow = 0.0;
     float swidth = 1.5;
     vec2 offset = mod(floor(gl_FragCoord.xy), 2.0) * swidth;
     shadow += lookup(-1.5 * swidth + offset.x, 1.5 * swidth - offset.y);
@@ -38,7 +52,7 @@ float getSoftShadowX4() {
 }
 
 float getSoftShadowX16() {
-    float shadow;
+    float shadow = 0.0;
     float swidth = 1.0;
     float endp = swidth * 1.5;
     for (float y = -endp; y <= endp; y += swidth) {
@@ -50,7 +64,7 @@ float getSoftShadowX16() {
 }
 
 float getSoftShadowX64() {
-    float shadow;
+    float shadow = 0.0;
     float swidth = 0.6;
     float endp = swidth * 3.0 + swidth / 2.0;
     for (float y = -endp; y <= endp; y += swidth) {
@@ -66,6 +80,69 @@ float getShadow() {
     return shadow;
 }
 
+int getCascade() {
+    float depth = -(m_view * vec4(fragPos, 1.0)).z;
+    int cascades = int(shadowParams.z);
+    for (int i = 0; i < cascades; i++) {
+        if (depth <= cascadeSplits[i]) {
+            return i;
+        }
+    }
+    return -1;
+}
+
+float getShadowFactor() {
+    int cascade = getCascade();
+    if (cascade < 0) {
+        return 1.0;
+    }
+    shadowCoord = m_shadow[cascade] * vec4(fragPos, 1.0);
+    shadowCoord.z -= shadowParams.w;
+#if SHADOW_QUALITY == 0
+    return 1.0;
+#elif SHADOW_QUALITY == 1
+    return getShadow();
+#elif SHADOW_QUALITY == 4
+    return getSoftShadowX4();
+#elif SHADOW_QUALITY == 64
+    return getSoftShadowX64();
+#else
+    return getSoftShadowX16();
+#endif
+}
+
+uvec2 getCluster() {
+    float depth = -(m_view * vec4(fragPos, 1.0)).z;
+    int slice = int(log(max(depth, lightGridParams.x) / lightGridParams.x) * lightGridParams.y);
+    ivec2 tile = min(ivec2(gl_FragCoord.xy / lightGridParams.zw), ivec2(lightGrid.xy) - 1);
+    ivec2 texel = ivec2(tile.y * int(lightGrid.x) + tile.x, min(slice, int(lightGrid.z) - 1));
+    return texelFetch(u_light_grid, texel, 0).xy;
+}
+
+vec3 getPointLights(vec3 Normal, vec3 viewDir) {
+    vec3 result = vec3(0.0);
+    if (lightGrid.w < 1.0) {
+        return result;
+    }
+    uvec2 cluster = getCluster();
+    int width = textureSize(u_light_indices, 0).x;
+    for (int i = int(cluster.x); i < int(cluster.x + cluster.y); i++) {
+        int index = int(texelFetch(u_light_indices, ivec2(i % width, i / width), 0).r);
+        vec4 sphere = texelFetch(u_lights, ivec2(index, 0), 0);
+        vec3 toLight = sphere.xyz - fragPos;
+        float distance = length(toLight);
+        if (distance >= sphere.w) {
+            continue;
+        }
+        float falloff = 1.0 - distance * distance / (sphere.w * sphere.w);
+        vec3 lightDir = toLight / max(distance, 1e-4);
+        float diff = max(0, dot(lightDir, Normal));
+        float spec = pow(max(dot(viewDir, reflect(-lightDir, Normal)), 0), 32);
+        result += (diff + spec) * falloff * falloff * texelFetch(u_lights, ivec2(index, 1), 0).rgb;
+    }
+    return result;
+}
+
 vec3 getLight(vec3 color) {
     vec3 Normal = normalize(normal);
 
@@ -80,14 +157,20 @@ vec3 getLight(vec3 color) {
     float spec = pow(max(dot(viewDir, reflectDir), 0), 32);
     vec3 specular = spec * light.Is;
 
-    float shadow = getSoftShadowX16();
+    float shadow = getShadowFactor();
 
-    return color * (ambient + (diffuse + specular) * shadow);
+    return color * (ambient + (diffuse + specular) * shadow + getPointLights(Normal, viewDir));
 }
 
 void main() {
     float gamma = 2.2;
+#if defined(TEXTURE_ARRAY)
+    vec3 color = texture(u_texture_0, vec3(uv_0, layer)).rgb;
+#elif !defined(UNTEXTURED)
     vec3 color = texture(u_texture_0, uv_0).rgb;
+#else
+    vec3 color = u_color;
+#endif
     color = pow(color, vec3(gamma));
 
     color = getLight(color);
@@ -1,33 +1,54 @@
 #version 330 core
 
 layout (location = 0) in vec2 in_texcoord_0;
+#ifdef COMPACT_VERTEX
+layout (location = 1) in uint in_normal;
+#else
 layout (location = 1) in vec3 in_normal;
+#endif
 layout (location = 2) in vec3 in_position;
+#ifdef INSTANCING
+layout (location = 3) in mat4 in_instance_model;
+#endif
+#ifdef TEXTURE_ARRAY
+layout (location = 7) in float in_instance_layer;
+#endif
+#ifdef INSTANCING
+layout (location = 8) in mat3 in_instance_normal;
+#endif
 
 out vec2 uv_0;
 out vec3 normal;
 out vec3 fragPos;
-out vec4 shadowCoord;
+#ifdef TEXTURE_ARRAY
+flat out float layer;
+#endif
 
-uniform mat4 m_proj;
-uniform mat4 m_view;
-uniform mat4 m_view_light;
+#include "include/frame_data.glsl"
+#include "include/vertex.glsl"
+
+// матрица модели и матрица нормалей (обратная транспонированная), вычисленная
+// на процессоре в хранилище преобразований (см. service/transform.py)
+#ifndef INSTANCING
 uniform mat4 m_model;
+uniform mat3 m_normal;
+#endif
 
-mat4 m_shadow_bias = mat4(
-    0.5, 0.0, 0.0, 0.0,
-    0.0, 0.5, 0.0, 0.0,
-    0.0, 0.0, 0.5, 0.0,
-    0.5, 0.5, 0.5, 1.0
-);
+// совпадает с глубиной предварительного прохода (shadow_map.vert с DEPTH_PREPASS)
+invariant gl_Position;
 
 void main() {
+#ifdef INSTANCING
+    mat4 m_model = in_instance_model;
+    mat3 m_normal = in_instance_normal;
+#endif
+#ifdef TEXTURE_ARRAY
+    layer = in_instance_layer;
+#endif
+    vec3 position = decodePosition(in_position);
     uv_0 = in_texcoord_0;
-    fragPos = vec3(m_model * vec4(in_position, 1.0));
-    normal = mat3(transpose(inverse(m_model))) * normalize(in_normal);
-    gl_Position = m_proj * m_view * m_model * vec4(in_position, 1.0);
-
-    mat4 shadowMVP = m_proj * m_view_light * m_model;
-    shadowCoord = m_shadow_bias * shadowMVP * vec4(in_position, 1.0);
-    shadowCoord.z -= 0.0005;
+    vec4 worldPos = m_model * vec4(position, 1.0);
+    fragPos = worldPos.xyz;
+    normal = m_normal * normalize(decodeNormal(in_normal));
+    gl_Position = m_view_proj * worldPos;
 }
@@ -0,0 +1,28 @@
+struct Light {
+    vec3 position;
+    vec3 Ia;
+    vec3 Id;
+    vec3 Is;
+};
+
+#define MAX_CASCADES 4
+
+layout (std140) uniform FrameData {
+    mat4 m_proj;
+    mat4 m_view;
+    // m_proj * m_view, вычисляется на процессоре раз за кадр
+    mat4 m_view_proj;
+    mat4 m_view_light;
+    vec3 camPos;
+    Light light;
+    // мир -> текстурные координаты атласа теней для каждого каскада
+    mat4 m_shadow[MAX_CASCADES];
+    // дальние границы каскадов по глубине вида
+    vec4 cascadeSplits;
+    // размер текселя атласа (x, y), число каскадов, смещение глубины
+    vec4 shadowParams;
+    // сетка кластеров освещения: плитки по x и y, слои по глубине, число источников
+    vec4 lightGrid;
+    // ближняя граница, масштаб слоев по глубине, размер плитки в пикселях (x, y)
+    vec4 lightGridParams;
+};
@@ -0,0 +1,24 @@
+// восстановление атрибутов сжатых вершин (см. service/vertex_format.py)
+#ifdef COMPACT_VERTEX
+// нижняя граница меша и шаг сетки квантования позиций uint16
+uniform vec3 u_position_offset;
+uniform vec3 u_position_scale;
+
+vec3 decodePosition(vec3 position) {
+    return u_position_offset + position * u_position_scale;
+}
+
+// нормаль 10_10_10_2: три знаковых 10-битных компоненты
+vec3 decodeNormal(uint normal) {
+    ivec3 values = ivec3(int(normal << 22u) >> 22, int(normal << 12u) >> 22, int(normal << 2u) >> 22);
+    return max(vec3(values) / 511.0, -1.0);
+}
+#else
+vec3 decodePosition(vec3 position) {
+    return position;
+}
+
+vec3 decodeNormal(vec3 normal) {
+    return normal;
+}
+#endif
@@ -0,0 +1,13 @@
+#version 330 core
+
+layout (location = 0) in vec2 in_position;
+
+out vec2 uv_0;
+
+// прямоугольник на экране в координатах отсечения: (x, y, ширина, высота)
+uniform vec4 u_rect;
+
+void main() {
+    uv_0 = vec2(in_position.x, 1.0 - in_position.y);
+    gl_Position = vec4(u_rect.xy + in_position * u_rect.zw, 0.0, 1.0);
+}
@@ -1,12 +1,35 @@
 #version 330 core
 
 layout (location = 2) in vec3 in_position;
+#ifdef INSTANCING
+layout (location = 3) in mat4 in_instance_model;
+#endif
 
-uniform mat4 m_proj;
-uniform mat4 m_view_light;
+#include "include/frame_data.glsl"
+#include "include/vertex.glsl"
+
+#ifndef INSTANCING
 uniform mat4 m_model;
+#endif
+#ifndef DEPTH_PREPASS
+// проекция каскада, умноженная на матрицу вида источника света
+uniform mat4 m_shadow_clip;
+#endif
+
+#ifdef DEPTH_PREPASS
+// глубина предварительного прохода должна точно совпасть с основным (тест GL_EQUAL)
+invariant gl_Position;
+#endif
 
 void main() {
-    mat4 mvp = m_proj * m_view_light * m_model;
-    gl_Position = mvp * vec4(in_position, 1.0);
+#ifdef INSTANCING
+    mat4 m_model = in_instance_model;
+#endif
+    vec4 worldPos = m_model * vec4(decodePosition(in_position), 1.0);
+#ifdef DEPTH_PREPASS
+    // то же выражение, что и в default.vert
+    gl_Position = m_view_proj * worldPos;
+#else
+    gl_Position = m_shadow_clip * worldPos;
+#endif
 }
@@ -0,0 +1,26 @@
+import numpy as np
+from service.wavefront import parse_obj
+
+
+def write_obj(tmp_path, text):
+    """
+    Функция записи файла OBJ во временную папку.
+    :param pathlib.Path tmp_path: Временная папка.
+    :param str text: Содержимое файла.
+    :return str: Путь к файлу.
+    """
+    path = tmp_path / 'mesh.obj'
+    path.write_text(text)
+    return str(path)
+
+
+def test_optional_w_component(tmp_path):
+    mesh = parse_obj(write_obj(tmp_path, 'v 0 0 0\nv 1 0 0 1.0\nv 0 1 0\nf 1 2 3\n'))
+    assert np.array_equal(mesh.vertex_data[:, 5:8], [[0, 0, 0], [1, 0, 0], [0, 1, 0]])
+
+
+def test_tab_separators(tmp_path):
+    mesh = parse_obj(write_obj(tmp_path, 'v 0 0 0\nv\t1 0 0\nv 0\t1\t0\nvt\t0.5 0.25\n'
+                                         'f\t1/1 2/1\t3/1\n'))
+    assert np.array_equal(mesh.vertex_data[:, 5:8], [[0, 0, 0], [1, 0, 0], [0, 1, 0]])
+    assert np.array_equal(mesh.vertex_data[:, 0:2], [[0.5, 0.25]] * 3)